@@ -0,0 +1,224 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Aggregate the api_metrics reported by the PAN-OS modules over a whole
+playbook run and export them in OpenMetrics text format.
+
+Enable it by whitelisting the callback in ansible.cfg::
+
+    [defaults]
+    callback_whitelist = panos_metrics
+
+The metrics are written to the file named by PANOS_METRICS_FILE (default
+panos_metrics.prom in the current directory), which can be picked up by the
+node_exporter textfile collector. When PANOS_METRICS_PUSH_URL is set the
+same payload is also PUT to that URL, e.g.
+http://pushgateway:9091/metrics/job/ansible-panos.
+"""
+
+import os
+import tempfile
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+try:
+    from ansible.module_utils.urls import open_url
+    HAS_URLS = True
+except ImportError:
+    HAS_URLS = False
+
+METRICS_FILE_ENV = 'PANOS_METRICS_FILE'
+METRICS_PUSH_URL_ENV = 'PANOS_METRICS_PUSH_URL'
+DEFAULT_METRICS_FILE = 'panos_metrics.prom'
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**kwargs):
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, _escape(v)) for k, v in sorted(kwargs.items())
+        if v is not None
+    )
+
+
+class _Family(object):
+    def __init__(self, name, mtype, help_, unit=None):
+        self.name = name
+        self.mtype = mtype
+        self.help = help_
+        self.unit = unit
+        self.samples = {}
+
+    def add(self, suffix, labels, value):
+        key = (suffix, labels)
+        self.samples[key] = self.samples.get(key, 0) + value
+
+    def maximum(self, suffix, labels, value):
+        key = (suffix, labels)
+        self.samples[key] = max(self.samples.get(key, 0), value)
+
+    def render(self):
+        lines = ['# TYPE %s %s' % (self.name, self.mtype)]
+        if self.unit:
+            lines.append('# UNIT %s %s' % (self.name, self.unit))
+        lines.append('# HELP %s %s' % (self.name, self.help))
+        for (suffix, labels), value in sorted(self.samples.items()):
+            if isinstance(value, float):
+                value = repr(round(value, 6))
+            lines.append('%s%s%s %s' % (self.name, suffix, labels, value))
+        return lines
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'panos_metrics'
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, display=None):
+        super(CallbackModule, self).__init__(display=display)
+
+        self.metrics_file = os.environ.get(METRICS_FILE_ENV,
+                                           DEFAULT_METRICS_FILE)
+        self.push_url = os.environ.get(METRICS_PUSH_URL_ENV)
+
+        self.api_calls = _Family(
+            'panos_api_calls', 'counter',
+            'PAN-OS API calls issued by the modules.')
+        self.api_errors = _Family(
+            'panos_api_errors', 'counter',
+            'PAN-OS API calls that raised an error.')
+        self.api_seconds = _Family(
+            'panos_api_call_seconds', 'summary',
+            'Latency of the PAN-OS API calls.', unit='seconds')
+        self.api_max_seconds = _Family(
+            'panos_api_call_max_seconds', 'gauge',
+            'Slowest PAN-OS API call seen in the run.', unit='seconds')
+        self.api_bytes_sent = _Family(
+            'panos_api_sent_bytes', 'counter',
+            'Request payload sent to the PAN-OS API.', unit='bytes')
+        self.api_bytes_received = _Family(
+            'panos_api_received_bytes', 'counter',
+            'Response payload received from the PAN-OS API.', unit='bytes')
+        self.commit_seconds = _Family(
+            'panos_commit_seconds', 'summary',
+            'Duration of the commit requests.', unit='seconds')
+        self.job_seconds = _Family(
+            'panos_job_seconds', 'summary',
+            'Time spent waiting for PAN-OS jobs.', unit='seconds')
+        self.job_polls = _Family(
+            'panos_job_polls', 'counter',
+            'Status polls issued while waiting for PAN-OS jobs.')
+        self.tasks = _Family(
+            'panos_tasks', 'counter',
+            'Tasks that reported PAN-OS API metrics.')
+
+        self.families = [
+            self.api_calls, self.api_errors, self.api_seconds,
+            self.api_max_seconds, self.api_bytes_sent,
+            self.api_bytes_received, self.commit_seconds, self.job_seconds,
+            self.job_polls, self.tasks
+        ]
+
+    def _record(self, host, module, status, metrics):
+        self.tasks.add('_total', _labels(host=host, module=module,
+                                         status=status), 1)
+
+        for method, m in metrics.get('methods', {}).items():
+            labels = _labels(host=host, module=module, method=method)
+            self.api_calls.add('_total', labels, m['calls'])
+            self.api_errors.add('_total', labels, m['errors'])
+            self.api_seconds.add('_sum', labels, m['seconds'])
+            self.api_seconds.add('_count', labels, m['calls'])
+            self.api_max_seconds.maximum('', labels, m['max_seconds'])
+            self.api_bytes_sent.add('_total', labels, m['bytes_out'])
+            self.api_bytes_received.add('_total', labels, m['bytes_in'])
+
+            if method == 'commit':
+                labels = _labels(host=host, module=module)
+                self.commit_seconds.add('_sum', labels, m['seconds'])
+                self.commit_seconds.add('_count', labels, m['calls'])
+
+        for job in metrics.get('jobs', []):
+            labels = _labels(host=host, module=module, type=job.get('type'),
+                             result=job.get('result'))
+            self.job_seconds.add('_sum', labels, job['seconds'])
+            self.job_seconds.add('_count', labels, 1)
+            self.job_polls.add('_total', labels, job['polls'])
+
+    def _collect(self, result, status):
+        host = result._host.get_name()
+        module = result._task.action
+
+        r = result._result
+        items = r.get('results')
+        if not isinstance(items, list):
+            items = [r]
+        for item in items:
+            if isinstance(item, dict) and 'api_metrics' in item:
+                self._record(host, module, status, item['api_metrics'])
+
+    def v2_runner_on_ok(self, result):
+        self._collect(result, 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._collect(result, 'failed')
+
+    def render(self):
+        lines = []
+        for f in self.families:
+            if f.samples:
+                lines.extend(f.render())
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def _write_file(self, payload):
+        dirname = os.path.dirname(os.path.abspath(self.metrics_file))
+        # write and rename so scrapers never see a partial file
+        fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.panos_metrics')
+        try:
+            os.write(fd, payload.encode('utf-8'))
+        finally:
+            os.close(fd)
+        os.chmod(tmpname, 0o644)
+        os.rename(tmpname, self.metrics_file)
+
+    def _push(self, payload):
+        if not HAS_URLS:
+            self._display.warning('panos_metrics: cannot push metrics, '
+                                  'ansible.module_utils.urls is missing')
+            return
+        open_url(self.push_url, data=payload.encode('utf-8'), method='PUT',
+                 headers={'Content-Type': CONTENT_TYPE})
+
+    def v2_playbook_on_stats(self, stats):
+        payload = self.render()
+        try:
+            self._write_file(payload)
+            if self.push_url:
+                self._push(payload)
+        except Exception as e:
+            self._display.warning('panos_metrics: failed to export metrics: '
+                                  '%s' % e)
+            return
+
+        self._display.display('PAN-OS API metrics written to %s at %s' %
+                              (self.metrics_file,
+                               time.strftime('%Y-%m-%d %H:%M:%S')))
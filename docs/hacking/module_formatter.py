@@ -29,6 +29,9 @@ import optparse
 import time
 import datetime
 import subprocess
+import hashlib
+import tempfile
+import multiprocessing
 
 # modules that are ok that they do not have documentation strings
 BLACKLIST_MODULES = [
@@ -159,6 +162,322 @@ def get_docstring(filename, verbose=False):
     return doc, examples
 
 
+class DocCache(object):
+    """
+    Parsed DOCUMENTATION and EXAMPLES of each module, kept between runs in
+    a JSON file. An entry is valid while the file has the same mtime and
+    size or, when they changed, the same sha1 of its content; it also
+    remembers the key of the last rendering so unchanged modules whose
+    output is still there can be skipped.
+
+    Modules that do need rendering are parsed again: the templates walk
+    the options in dict order, which depends on how the dict was built,
+    and the output must not depend on the state of the cache.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        if path is None or not os.path.exists(path):
+            return
+        try:
+            f = open(path)
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return
+        if isinstance(data, dict) and data.get('version') == self.VERSION:
+            self.entries = data.get('modules', {})
+
+    def lookup(self, module, fname):
+        """Return (entry or None, sha1 of fname or None if not needed)."""
+        st = os.stat(fname)
+        e = self.entries.get(module)
+        if e is not None and e['mtime'] == st.st_mtime and \
+                e['size'] == st.st_size:
+            return e, e['sha1']
+
+        digest = file_hash(fname)
+        if e is not None and e['sha1'] == digest:
+            e['mtime'], e['size'] = st.st_mtime, st.st_size
+            self.dirty = True
+            return e, digest
+        return None, digest
+
+    def store(self, module, fname, digest, doc, examples, rendered,
+              **extra):
+        st = os.stat(fname)
+        e = dict(mtime=st.st_mtime, size=st.st_size, sha1=digest, doc=doc,
+                 examples=examples, rendered=rendered, **extra)
+        try:
+            json.dumps(e)
+        except (TypeError, ValueError):
+            # not representable in JSON, parse it again next time
+            self.entries.pop(module, None)
+            return
+        self.entries[module] = e
+        self.dirty = True
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.module_formatter')
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(dict(version=self.VERSION, modules=self.entries), f)
+        finally:
+            f.close()
+        os.rename(tmpname, self.path)
+
+
+SPEC_INDEX_FORMAT = 'ansible-pan-module-specs'
+SPEC_INDEX_VERSION = 1
+
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        # computed value, the index can only tell it is there
+        return '<expr>'
+
+
+def get_argument_spec(filename):
+    """
+    The argument_spec = dict(...) of the module, evaluated statically:
+    {option: {key: value}}, or None if the module has none.
+    """
+    M = ast.parse(''.join(open(filename)))
+    for node in ast.walk(M):
+        if not isinstance(node, ast.Assign) or \
+                'argument_spec' not in [getattr(t, 'id', None)
+                                        for t in node.targets]:
+            continue
+        call = node.value
+        if not isinstance(call, ast.Call) or \
+                getattr(call.func, 'id', None) != 'dict':
+            continue
+        spec = {}
+        for kw in call.keywords:
+            o = kw.value
+            if isinstance(o, ast.Call) and getattr(o.func, 'id', None) == 'dict':
+                spec[kw.arg] = dict([(k.arg, _literal(k.value))
+                                     for k in o.keywords])
+            else:
+                spec[kw.arg] = {}
+        return spec
+    return None
+
+
+def _doc_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('yes', 'true', '1', 'on')
+
+
+def _same_default(documented, actual):
+    if documented in (None, 'None', 'none', 'null', 'Null', ''):
+        return actual in (None, '', [])
+    if isinstance(actual, bool):
+        return _doc_bool(documented) == actual and \
+            str(documented).lower() in ('yes', 'no', 'true', 'false',
+                                        '1', '0', 'on', 'off')
+    if isinstance(actual, list) and len(actual) == 1 and \
+            not isinstance(documented, list):
+        # a list option documented with its single default value
+        actual = actual[0]
+    return str(documented) == str(actual)
+
+
+def check_spec(doc, spec):
+    """
+    Differences between the documented options and the argument_spec,
+    as a list of messages.
+    """
+    problems = []
+    documented = doc.get('options') or {}
+    for name in sorted(set(documented) - set(spec)):
+        problems.append("option %s is documented but not in argument_spec"
+                        % name)
+    for name in sorted(set(spec) - set(documented)):
+        problems.append("option %s is not documented" % name)
+
+    for name in sorted(set(documented) & set(spec)):
+        d = documented[name] or {}
+        a = spec[name]
+        if a.get('required') == '<expr>':
+            continue
+        # many modules check their required options themselves, only an
+        # option required by argument_spec but documented optional is wrong
+        if a.get('required') and not _doc_bool(d.get('required', False)):
+            problems.append("option %s: required by argument_spec but "
+                            "documented optional" % name)
+        if 'default' in d and a.get('default') != '<expr>' and \
+                not _same_default(d['default'], a.get('default')):
+            problems.append("option %s: documented default %r, "
+                            "argument_spec default %r" %
+                            (name, d['default'], a.get('default')))
+        dchoices = d.get('choices')
+        achoices = a.get('choices')
+        if achoices != '<expr>' and (dchoices or achoices) and \
+                sorted([str(c) for c in dchoices or []]) != \
+                sorted([str(c) for c in achoices or []]):
+            problems.append("option %s: documented choices %s, "
+                            "argument_spec choices %s" %
+                            (name, dchoices, achoices))
+    return problems
+
+
+def spec_entry(doc, spec, digest):
+    """The index record of a module."""
+    options = {}
+    for name, d in (doc.get('options') or {}).items():
+        d = d or {}
+        o = dict(
+            description=d.get('description'),
+            required=_doc_bool(d.get('required', False)),
+            default=d.get('default'),
+            choices=d.get('choices'),
+        )
+        if spec is not None and name in spec:
+            o['argument_spec'] = spec[name]
+        options[name] = o
+    for name in set(spec or {}) - set(options):
+        options[name] = dict(argument_spec=spec[name])
+    return dict(
+        short_description=doc.get('short_description'),
+        version_added=doc.get('version_added'),
+        requirements=doc.get('requirements'),
+        sha1=digest,
+        options=options,
+    )
+
+
+def file_hash(fname):
+    f = open(fname, 'rb')
+    try:
+        return hashlib.sha1(f.read()).hexdigest()
+    finally:
+        f.close()
+
+
+def setup_template(template_dir, type_):
+    """Return (template, outputname, includecmt, includefmt) for type_."""
+
+    env = Environment(loader=FileSystemLoader(template_dir),
+        variable_start_string="@{",
+        variable_end_string="}@",
+        trim_blocks=True,
+        )
+
+    env.globals['xline'] = rst_xline
+
+    template = None
+    includecmt = ""
+    includefmt = ""
+    if type_ == 'latex':
+        env.filters['jpfunc'] = latex_ify
+        template = env.get_template('latex.j2')
+        outputname = "%s.tex"
+        includecmt = "% generated code\n"
+        includefmt = "\\input %s\n"
+    if type_ == 'html':
+        env.filters['jpfunc'] = html_ify
+        template = env.get_template('html.j2')
+        outputname = "%s.html"
+    if type_ == 'man':
+        env.filters['jpfunc'] = man_ify
+        template = env.get_template('man.j2')
+        outputname = "ansible.%s.3"
+    if type_ == 'rst':
+        env.filters['jpfunc'] = rst_ify
+        env.filters['html_ify'] = html_ify
+        env.filters['fmt'] = rst_fmt
+        env.filters['xline'] = rst_xline
+        template = env.get_template('rst.j2')
+        outputname = "%s.rst"
+        includecmt = RST_HEADER
+        includefmt = "   modules/%s\n"
+    if type_ == 'json':
+        env.filters['jpfunc'] = json_ify
+        outputname = "%s.json"
+    if type_ == 'js':
+        env.filters['jpfunc'] = js_ify
+        template = env.get_template('js.j2')
+        outputname = "%s.js"
+    if type_ == 'spec':
+        outputname = "%s.json"
+
+    return template, outputname, includecmt, includefmt
+
+
+def render_key(template_dir, type_, ansible_version):
+    """Changes whenever the same doc would not render the same text."""
+    h = hashlib.sha1()
+    h.update(('%s\0%s\0' % (type_, ansible_version)).encode('utf-8'))
+    tname = os.path.join(template_dir, '%s.j2' % type_)
+    if os.path.exists(tname):
+        h.update(file_hash(tname).encode('utf-8'))
+    return h.hexdigest()
+
+
+_worker = {}
+
+
+def _init_worker(settings):
+    _worker['settings'] = settings
+    _worker['template'] = setup_template(settings['template_dir'],
+                                         settings['type'])[0]
+
+
+def render_module(task):
+    """
+    Parse and render one module. Runs in the worker processes; returns
+    (module, fname, digest, doc, examples, text), text being None when the
+    module has no documentation.
+    """
+    module, fname, digest = task
+    settings = _worker['settings']
+
+    doc, examples = get_docstring(fname, verbose=settings['verbose'])
+    if doc is None:
+        return module, fname, digest, None, None, None
+
+    # render from a copy, the cache keeps the doc as parsed
+    rdoc = dict(doc)
+    rdoc['filename']         = fname
+    rdoc['docuri']           = rdoc['module'].replace('_', '-')
+    rdoc['now_date']         = datetime.date.today().strftime('%Y-%m-%d')
+    rdoc['ansible_version']  = settings['ansible_version']
+
+    if examples is not None:
+        rdoc['plainexamples'] = examples
+
+    if settings['verbose']:
+        print json.dumps(rdoc, indent=4)
+
+    if settings['type'] == 'latex':
+        extra = os.path.join("inc", "%s.tex" % module)
+        if os.path.exists(extra):
+            f = open(extra)
+            extradata = f.read()
+            f.close()
+            rdoc['extradata'] = extradata
+
+    if settings['type'] == 'json':
+        text = json.dumps(rdoc, indent=2)
+    else:
+        text = _worker['template'].render(rdoc)
+
+    return module, fname, digest, doc, examples, text
+
+
 def return_data(text, options, outputname, module):
     if options.output_dir is not None:
         f = open(os.path.join(options.output_dir, outputname % module), 'w')
@@ -173,6 +492,68 @@ def boilerplate():
     print file(EXAMPLE_YAML).read()
 
 
+def build_spec_index(options, cache):
+    """
+    Write module_specs.json, a single index of the options of every
+    module: what DOCUMENTATION says about each one and, under
+    argument_spec, what the module actually accepts. Cached docs can be
+    used here since the index is written with sorted keys.
+    """
+    modules = {}
+    problems = 0
+    for module in sorted(os.listdir(options.module_dir)):
+        if len(options.module_list):
+            if not module in options.module_list:
+                continue
+
+        fname = os.path.join(options.module_dir, module)
+        if not fname.endswith(".py") or not os.path.isfile(fname):
+            continue
+
+        entry, digest = cache.lookup(module, fname)
+        if entry is not None and 'argument_spec' in entry:
+            doc, spec = entry['doc'], entry['argument_spec']
+        else:
+            if entry is not None:
+                doc, examples = entry['doc'], entry['examples']
+            else:
+                doc, examples = get_docstring(fname, verbose=options.verbose)
+            spec = get_argument_spec(fname)
+            cache.store(module, fname, digest, doc, examples,
+                        entry['rendered'] if entry is not None else None,
+                        argument_spec=spec)
+
+        if doc is None:
+            if module not in BLACKLIST_MODULES and module != '__init__.py':
+                sys.stderr.write("*** ERROR: CORE MODULE MISSING DOCUMENTATION: %s ***\n" % module)
+            continue
+
+        name = doc.get('module') or module[:-3]
+        modules[name] = spec_entry(doc, spec, digest)
+
+        if options.check_specs:
+            if spec is None:
+                found = ["no argument_spec found"]
+            else:
+                found = check_spec(doc, spec)
+            for msg in found:
+                sys.stderr.write("%s: %s\n" % (name, msg))
+            problems += len(found)
+
+    text = json.dumps(dict(format=SPEC_INDEX_FORMAT,
+                           version=SPEC_INDEX_VERSION,
+                           ansible_version=options.ansible_version,
+                           modules=modules),
+                      indent=1, sort_keys=True, separators=(',', ': '))
+    return_data(text + "\n", options, "%s.json", 'module_specs')
+    cache.save()
+
+    if problems:
+        sys.stderr.write("%d differences between DOCUMENTATION and "
+                         "argument_spec\n" % problems)
+        sys.exit(1)
+
+
 def main():
 
     p = optparse.OptionParser(
@@ -199,7 +580,7 @@ def main():
     p.add_option("-t", "--type",
             action='store',
             dest='type',
-            choices=['html', 'latex', 'man', 'rst', 'json'],
+            choices=['html', 'latex', 'man', 'rst', 'json', 'spec'],
             default='latex',
             help="Output type")
     p.add_option("-m", "--module",
@@ -226,6 +607,22 @@ def main():
             dest="do_boilerplate",
             default=False,
             help="generate boilerplate DOCUMENTATION to stdout")
+    p.add_option("-C", "--cache-file",
+            action="store",
+            dest="cache_file",
+            default=None,
+            help="Keep parsed docs in this file and skip the modules unchanged since the last run")
+    p.add_option("-j", "--jobs",
+            action="store",
+            dest="jobs",
+            type="int",
+            default=multiprocessing.cpu_count(),
+            help="Number of processes parsing and rendering modules")
+    p.add_option("--check-specs",
+            action="store_true",
+            dest="check_specs",
+            default=False,
+            help="With -t spec, report the differences between DOCUMENTATION and argument_spec and fail on any")
     p.add_option('-V', action='version', help='Show version number and exit')
 
     (options, args) = p.parse_args()
@@ -251,120 +648,104 @@ def main():
         print "Need template_dir"
         sys.exit(1)
 
-    env = Environment(loader=FileSystemLoader(options.template_dir),
-        variable_start_string="@{",
-        variable_end_string="}@",
-        trim_blocks=True,
-        )
-
-    env.globals['xline'] = rst_xline
-
-    if options.type == 'latex':
-        env.filters['jpfunc'] = latex_ify
-        template = env.get_template('latex.j2')
-        outputname = "%s.tex"
-        includecmt = "% generated code\n"
-        includefmt = "\\input %s\n"
-    if options.type == 'html':
-        env.filters['jpfunc'] = html_ify
-        template = env.get_template('html.j2')
-        outputname = "%s.html"
-        includecmt = ""
-        includefmt = ""
-    if options.type == 'man':
-        env.filters['jpfunc'] = man_ify
-        template = env.get_template('man.j2')
-        outputname = "ansible.%s.3"
-        includecmt = ""
-        includefmt = ""
-    if options.type == 'rst':
-        env.filters['jpfunc'] = rst_ify
-        env.filters['html_ify'] = html_ify
-        env.filters['fmt'] = rst_fmt
-        env.filters['xline'] = rst_xline
-        template = env.get_template('rst.j2')
-        outputname = "%s.rst"
-        includecmt = RST_HEADER
-        includefmt = "   modules/%s\n"
-    if options.type == 'json':
-        env.filters['jpfunc'] = json_ify
-        outputname = "%s.json"
-        includecmt = ""
-        includefmt = ""
-    if options.type == 'js':
-        env.filters['jpfunc'] = js_ify
-        template = env.get_template('js.j2')
-        outputname = "%s.js"
+    template, outputname, includecmt, includefmt = \
+        setup_template(options.template_dir, options.type)
 
     if options.includes_file is not None and includefmt != "":
         incfile = open(options.includes_file, "w")
         incfile.write(includecmt)
 
-    # Temporary variable required to genrate aggregated content in 'js' format.
-    js_data = []
-    for module in sorted(os.listdir(options.module_dir)):
-        if len(options.module_list):
-            if not module in options.module_list:
-                continue
-
-        fname = os.path.join(options.module_dir, module)
-        extra = os.path.join("inc", "%s.tex" % module)
-
-        if fname.endswith(".swp"):
-            continue
-
-        print " processing module source ---> %s" % fname
-
-        if options.type == 'js':
+    if options.type == 'js':
+        # Temporary variable required to genrate aggregated content in 'js' format.
+        js_data = []
+        for module in sorted(os.listdir(options.module_dir)):
+            fname = os.path.join(options.module_dir, module)
             if fname.endswith(".json"):
                 f = open(fname)
                 j = json.load(f)
                 f.close()
                 js_data.append(j)
-            continue
-
-        doc, examples = get_docstring(fname, verbose=options.verbose)
-
-        if doc is None and module not in BLACKLIST_MODULES:
-            sys.stderr.write("*** ERROR: CORE MODULE MISSING DOCUMENTATION: %s ***\n" % module)
-            #sys.exit(1)
+        docs = {}
+        docs['json'] = json.dumps(js_data, indent=2)
+        text = template.render(docs)
+        return_data(text, options, outputname, 'modules')
+        return
 
-        if not doc is None:
+    cache = DocCache(options.cache_file)
 
-            doc['filename']         = fname
-            doc['docuri']           = doc['module'].replace('_', '-')
-            doc['now_date']         = datetime.date.today().strftime('%Y-%m-%d')
-            doc['ansible_version']  = options.ansible_version
+    if options.type == 'spec':
+        build_spec_index(options, cache)
+        return
 
-            if examples is not None:
-                doc['plainexamples'] = examples
+    rkey = render_key(options.template_dir, options.type,
+                      options.ansible_version)
 
-            if options.includes_file is not None and includefmt != "":
-                incfile.write(includefmt % module)
+    # modules in order, with the cached doc when the source is unchanged
+    modules = []
+    tasks = []
+    for module in sorted(os.listdir(options.module_dir)):
+        if len(options.module_list):
+            if not module in options.module_list:
+                continue
 
-            if options.verbose:
-                print json.dumps(doc, indent=4)
+        fname = os.path.join(options.module_dir, module)
 
+        if fname.endswith(".swp") or not os.path.isfile(fname):
+            continue
 
-            if options.type == 'latex':
-                if os.path.exists(extra):
-                    f = open(extra)
-                    extradata = f.read()
-                    f.close()
-                    doc['extradata'] = extradata
+        entry, digest = cache.lookup(module, fname)
+        modules.append((module, entry))
+        if entry is not None and entry['rendered'] == rkey and \
+                options.output_dir is not None and \
+                (entry['doc'] is None or
+                 os.path.exists(os.path.join(options.output_dir,
+                                             outputname % module))):
+            print " unchanged module source ---> %s" % fname
+            continue
 
-            if options.type == 'json':
-                text = json.dumps(doc, indent=2)
-            else:
-                text = template.render(doc)
+        print " processing module source ---> %s" % fname
+        tasks.append((module, fname, digest))
+
+    settings = dict(template_dir=options.template_dir, type=options.type,
+                    ansible_version=options.ansible_version,
+                    verbose=options.verbose)
+    if options.jobs > 1 and len(tasks) > 1:
+        # do not let the workers inherit unflushed output
+        sys.stdout.flush()
+        if options.includes_file is not None and includefmt != "":
+            incfile.flush()
+        pool = multiprocessing.Pool(min(options.jobs, len(tasks)),
+                                    _init_worker, (settings,))
+        try:
+            results = pool.map(render_module, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(settings)
+        results = [render_module(t) for t in tasks]
 
-            return_data(text, options, outputname, module)
+    documented = {}
+    for module, fname, digest, doc, examples, text in results:
+        cache.store(module, fname, digest, doc, examples, rkey)
+        if doc is None:
+            continue
+        documented[module] = True
+        return_data(text, options, outputname, module)
+
+    for module, entry in modules:
+        if module not in documented and entry is not None and \
+                entry['doc'] is not None:
+            # skipped as unchanged
+            documented[module] = True
+        if module not in documented and module not in BLACKLIST_MODULES:
+            sys.stderr.write("*** ERROR: CORE MODULE MISSING DOCUMENTATION: %s ***\n" % module)
+            #sys.exit(1)
+        if module in documented and options.includes_file is not None and \
+                includefmt != "":
+            incfile.write(includefmt % module)
 
-    if options.type == 'js':
-        docs = {}
-        docs['json'] = json.dumps(js_data, indent=2)
-        text = template.render(docs)
-        return_data(text, options, outputname, 'modules')
+    cache.save()
 
 if __name__ == '__main__':
     main()
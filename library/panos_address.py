@@ -24,6 +24,9 @@ module: panos_address
 short_description: create address service object
 description:
     - Create address service object of different types [IP Range, FQDN, or IP Netmask].
+    - With I(analyze), report instead on the address objects already configured, fetched in a single request, the
+      values that are not in canonical form, duplicates, objects contained in or overlapping another one and groups
+      of objects that could be replaced by fewer networks.
 author: "Luigi Mori (@jtschichold), Ken Celenza (@itdependsnetworks), Ivan Bojer (@ivanbojer)"
 version_added: "2.3"
 requirements:
@@ -43,18 +46,18 @@ options:
         required: true
     address:
         description:
-            - IP address with or without mask, range, or FQDN.
-        required: true
+            - IP address with or without mask, range, or FQDN. Required unless I(analyze) is set.
+        required: false
         default: None
     address_name:
         description:
-            - Human readable name of the address.
-        required: true
+            - Human readable name of the address. Required unless I(analyze) is set.
+        required: false
         default: None
     type:
         description:
             - This is the type of the object created.
-        default: ip-nemask
+        default: ip-netmask
         choices: [ 'ip-netmask', 'fqdn', 'ip-range' ]
     description:
         description:
@@ -68,6 +71,17 @@ options:
         description:
             - Commit if changed
         default: true
+    partial_commit:
+        description:
+            - commit only the changes made by I(username), leaving out the device and network configuration
+              (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: false
+    analyze:
+        description:
+            - analyze the existing address objects of vsys1 instead of creating one, nothing is changed
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
@@ -97,14 +111,36 @@ EXAMPLES = '''
     type: 'fqdn'
     address_name: 'google.com'
     address: 'www.google.com'
+
+- name: look for duplicate and overlapping address objects
+  panos_address:
+    ip_address: "192.168.1.1"
+    password: 'admin'
+    analyze: true
+  register: result
 '''
 
 RETURN = '''
-# Default return values
+analysis:
+    description: >
+        result of I(analyze): invalid values, normalized (objects whose value has a canonical form different from the
+        configured one, e.g. 10.0.0.1/32 for 10.0.0.1), duplicates (objects with the same value), contained and
+        overlaps (objects inside or partly overlapping another one, each reported against one object only) and
+        consolidations (objects covering contiguous addresses and the fewer networks that could replace them)
+    returned: when analyze is true
+    type: dict
+    sample: {"duplicates": [{"value": "10.0.0.1", "objects": ["web-1", "web_1"]}],
+             "consolidations": [{"objects": ["net-a", "net-b"], "replace_with": ["10.1.0.0/23"]}],
+             "contained": [], "overlaps": [], "invalid": [], "normalized": []}
 '''
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    partial_scope, POLICY_AND_OBJECTS
+from ansible.module_utils.panos_xml import XmlTemplateError, ADDRESS
+from ansible.module_utils.panos_addr import analyze_addresses
 
 try:
     import pan.xapi
@@ -114,9 +150,12 @@ try:
 except ImportError:
     HAS_LIB = False
 
-_ADDRESS_XPATH = "/config/devices/entry[@name='localhost.localdomain']" + \
-                 "/vsys/entry[@name='vsys1']" + \
-                 "/address/entry[@name='%s']"
+_ADDRESSES_XPATH = "/config/devices/entry[@name='localhost.localdomain']" + \
+                   "/vsys/entry[@name='vsys1']" + \
+                   "/address"
+_ADDRESS_XPATH = _ADDRESSES_XPATH + "/entry[@name='%s']"
+
+_ADDRESS_TYPES = ('ip-netmask', 'ip-range', 'fqdn')
 
 
 def address_exists(xapi, address_name):
@@ -131,41 +170,44 @@ def add_address(xapi, module, address, address_name, description, type, tag):
     if address_exists(xapi, address_name):
         return False
 
-    exml = []
-    exml.append('<%s>' % type)
-    exml.append('%s' % address)
-    exml.append('</%s>' % type)
-
-    if description:
-        exml.append('<description>')
-        exml.append('%s' % description)
-        exml.append('</description>')
-
-    if tag:
-        exml.append('<tag>')
-        exml.append('<member>%s</member>' % tag)
-        exml.append('</tag>')
-
-    exml = ''.join(exml)
+    exml = ADDRESS.render(type=type, address=address,
+                          description=description, tag=tag)
 
     xapi.set(xpath=_ADDRESS_XPATH % address_name, element=exml)
 
     return True
 
 
+def fetch_addresses(xapi):
+    """(name, type, value) of every address object of vsys1."""
+    xapi.get(_ADDRESSES_XPATH)
+    objects = []
+    for e in xapi.element_root.findall('./result/address/entry'):
+        for type_ in _ADDRESS_TYPES:
+            value = e.find(type_)
+            if value is not None:
+                objects.append((e.get('name'), type_, value.text))
+                break
+    return objects
+
+
 def main():
     argument_spec = dict(
         ip_address=dict(required=True),
         password=dict(required=True, no_log=True),
         username=dict(default='admin'),
-        address_name=dict(required=True),
+        address_name=dict(),
         address=dict(default=None),
         description=dict(default=None),
         tag=dict(default=None),
         type=dict(default='ip-netmask', choices=['ip-netmask', 'ip-range', 'fqdn']),
-        commit=dict(type='bool', default=True)
+        commit=dict(type='bool', default=True),
+        partial_commit=dict(type='bool', default=False),
+        analyze=dict(type='bool', default=False)
     )
-    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False,
+                           required_if=[['analyze', False,
+                                         ['address_name', 'address']]])
 
     if not HAS_LIB:
         module.fail_json(msg='pan-python required for this module')
@@ -174,11 +216,20 @@ def main():
     password = module.params["password"]
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
+
+    if module.params['analyze']:
+        try:
+            objects = fetch_addresses(xapi)
+        except PanXapiError:
+            exc = get_exception()
+            module.fail_json(msg=exc.message)
+        module.exit_json(changed=False, analysis=analyze_addresses(objects),
+                         msg="okey dokey")
 
     address_name = module.params['address_name']
     address = module.params['address']
@@ -199,9 +250,12 @@ def main():
     except PanXapiError:
         exc = get_exception()
         module.fail_json(msg=exc.message)
+    except XmlTemplateError:
+        exc = get_exception()
+        module.fail_json(msg=str(exc))
 
     if changed and commit:
-        xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+        commit_candidate(xapi, **partial_scope(module, POLICY_AND_OBJECTS))
 
     module.exit_json(changed=changed, msg="okey dokey")
 
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+DOCUMENTATION = '''
+---
+module: panos_addrgroup_facts
+short_description: resolve static and dynamic address groups to their members
+description:
+    - Gather the flattened membership of address groups, nested static groups and dynamic address groups (see
+      panos_dag) included, as ansible facts.
+    - Address objects and groups of the vsys and of shared are fetched once, along with the registered IPs for the
+      dynamic groups, whatever the number of groups resolved.
+author: "Luigi Mori (@jtschichold), Ivan Bojer (@ivanbojer)"
+version_added: "2.3"
+requirements:
+    - pan-python
+notes:
+    - Checkmode is supported.
+options:
+    ip_address:
+        description:
+            - IP address (or hostname) of PAN-OS device
+        required: true
+    password:
+        description:
+            - password for authentication
+        required: true
+    username:
+        description:
+            - username for authentication
+        required: false
+        default: "admin"
+    vsys:
+        description:
+            - vsys the groups belong to
+        required: false
+        default: "vsys1"
+    groups:
+        description:
+            - names of the address groups to resolve, all of them when not specified
+        required: false
+        default: None
+    registered_ips:
+        description:
+            - fetch the registered IPs to resolve dynamic address groups. When false dynamic groups only resolve to
+              the address objects matching their filter.
+        required: false
+        default: true
+'''
+
+EXAMPLES = '''
+- name: resolve address groups
+  panos_addrgroup_facts:
+    ip_address: "192.168.1.1"
+    password: "admin"
+    groups: ["web-servers", "dag-1"]
+
+- debug: msg="{{panos_address_groups['dag-1'].addresses}}"
+'''
+
+RETURN = '''
+ansible_facts:
+    description: panos_address_groups, the membership of each group by name. A dynamic group whose filter cannot be
+                 parsed has an error and no members.
+    returned: success
+    type: dict
+    sample: {"panos_address_groups": {"dag-1": {
+        "dynamic": true, "filter": "'web' and 'prod'", "members": ["web-1"],
+        "registered_ips": ["10.0.1.12"], "addresses": ["10.0.1.11", "10.0.1.12"],
+        "fqdns": [], "unresolved": []}}}
+'''
+
+ANSIBLE_METADATA = {'status': ['preview'],
+                    'supported_by': 'community',
+                    'version': '1.0'}
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_addrgroup import AddressGroupResolver, \
+    VSYS_XPATH, SHARED_XPATH, REGISTERED_IP_CMD
+
+try:
+    import pan.xapi
+    from pan.xapi import PanXapiError
+    HAS_LIB = True
+except ImportError:
+    HAS_LIB = False
+
+
+def fetch_resolver(xapi, vsys, registered_ips):
+    """
+    AddressGroupResolver loaded with the objects of shared and vsys, one
+    get per scope and container, and the registered IPs of vsys.
+    """
+    resolver = AddressGroupResolver()
+    for scope in (SHARED_XPATH, VSYS_XPATH % vsys):
+        for container in ('address', 'address-group'):
+            xapi.get(xpath='%s/%s' % (scope, container))
+            result = xapi.element_root.find('result')
+            if result is not None:
+                resolver.load(result)
+
+    if registered_ips:
+        xapi.op(cmd=REGISTERED_IP_CMD, vsys=vsys)
+        result = xapi.element_root.find('result')
+        if result is not None:
+            resolver.load_registered_ips(result)
+
+    return resolver
+
+
+def main():
+    argument_spec = dict(
+        ip_address=dict(required=True),
+        password=dict(required=True, no_log=True),
+        username=dict(default='admin'),
+        vsys=dict(default='vsys1'),
+        groups=dict(type='list'),
+        registered_ips=dict(type='bool', default=True)
+    )
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+    if not HAS_LIB:
+        module.fail_json(msg='pan-python is required for this module')
+
+    ip_address = module.params["ip_address"]
+    password = module.params["password"]
+    username = module.params['username']
+
+    xapi = instrument(module, pan.xapi.PanXapi(
+        hostname=ip_address,
+        api_username=username,
+        api_password=password
+    ))
+
+    try:
+        resolver = fetch_resolver(xapi, module.params['vsys'],
+                                  module.params['registered_ips'])
+    except PanXapiError:
+        exc = get_exception()
+        module.fail_json(msg=exc.message)
+
+    try:
+        groups = resolver.facts(module.params['groups'])
+    except KeyError:
+        exc = get_exception()
+        module.fail_json(msg='address group %s not found' % exc.args[0])
+
+    module.exit_json(changed=False,
+                     ansible_facts=dict(panos_address_groups=groups))
+
+
+if __name__ == '__main__':
+    main()
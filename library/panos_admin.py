@@ -50,18 +50,52 @@ options:
         default: "admin"
     admin_password:
         description:
-            - password for admin user
-        required: true
+            - password for admin user, required to create it
+        required: false
     role:
         description:
             - role for admin user
         required: false
         default: null
+    admins:
+        description:
+            - list of admin accounts to reconcile, each a dict with admin_username and optionally role, their
+              passwords are given in I(admin_passwords). The users are read with a single request, passwords are
+              hashed on the device only for the accounts whose password does not match the current hash, only the
+              accounts that changed are written back, followed by a single commit. Accounts not in the list are
+              left alone.
+        required: false
+        default: null
+    admin_passwords:
+        description:
+            - with I(admins), password of the accounts by admin_username, required for the accounts to create.
+              Kept apart from I(admins) so that only the passwords are hidden from the logs.
+        required: false
+        default: null
+    password_cache_ttl:
+        description:
+            - when the password hash scheme of the device cannot be verified locally, remember for this many
+              seconds a salted digest of the passwords set by the module, so that unchanged passwords are not hashed
+              and written again. 0 disables the cache.
+        required: false
+        default: 0
+    password_cache_file:
+        description:
+            - file holding the password digests, by default admin_passwords.json in $PANOS_CACHE_DIR or
+              ~/.ansible/cache/panos on the host running the module
+        required: false
+        default: None
     commit:
         description:
             - commit if changed
         required: false
         default: true
+    partial_commit:
+        description:
+            - commit only the changes made by I(username), leaving out the policy and objects configuration
+              (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
@@ -74,6 +108,15 @@ EXAMPLES = '''
       admin_username: admin
       admin_password: "badpassword"
       commit: False
+
+# Sync a list of accounts, only the changed ones are hashed and written
+  - name: sync admin accounts
+    panos_admin:
+      ip_address: "192.168.1.1"
+      password: "admin"
+      admins: "{{ idp_admins }}"
+      admin_passwords: "{{ idp_admin_passwords }}"
+      password_cache_ttl: 86400
 '''
 
 RETURN = '''
@@ -82,74 +125,165 @@ status:
     returned: success
     type: string
     sample: "okey dokey"
+changed_admins:
+    description: names of the admin accounts created or changed
+    returned: success
+    type: list
+    sample: ["alice", "bob"]
 '''
+import hashlib
+import xml.etree.ElementTree as ET
+
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    partial_scope, DEVICE_AND_NETWORK
+from ansible.module_utils.panos_cache import TTLCache, default_cache_path
+from ansible.module_utils.panos_xml import escape
 
 try:
     import pan.xapi
+    from pan.xapi import PanXapiError
     HAS_LIB = True
 except ImportError:
     HAS_LIB = False
 
-_ADMIN_XPATH = "/config/mgt-config/users/entry[@name='%s']"
+try:
+    import crypt
+    HAS_CRYPT = True
+except ImportError:
+    HAS_CRYPT = False
+
+_USERS_XPATH = "/config/mgt-config/users"
+_ADMIN_XPATH = _USERS_XPATH + "/entry[@name='%s']"
+
+
+def fetch_admins(xapi):
+    """The users element of the candidate config, from a single get."""
+    xapi.get(xpath=_USERS_XPATH)
+    users = xapi.element_root.find('.//users')
+    if users is None:
+        users = ET.Element('users')
+    return users
+
+
+def password_hash(xapi, password):
+    xapi.op(cmd='<request><password-hash><password>%s</password>'
+                '</password-hash></request>' % escape(password))
+    return xapi.element_root.find('.//phash').text
+
+
+def _digest(phash, password):
+    return hashlib.sha256(('%s\n%s' % (phash, password))
+                          .encode('utf-8')).hexdigest()
+
 
+def password_matches(phash, password, cache=None, key=None):
+    """
+    True when phash is known to be the hash of password: checked with
+    crypt when the hash scheme is supported locally, else against the
+    digest remembered in the cache when the password was last set.
+    """
+    if not phash:
+        return False
+    if HAS_CRYPT:
+        try:
+            if crypt.crypt(password, phash) == phash:
+                return True
+        except (ValueError, OSError):
+            pass
+    if cache is not None:
+        return cache.get(key) == _digest(phash, password)
+    return False
 
-def admin_exists(xapi, admin_username):
-    xapi.get(_ADMIN_XPATH % admin_username)
-    e = xapi.element_root.find('.//entry')
-    return e
 
+def _role_value(role):
+    if role == "superuser" or role == 'superreader':
+        return "yes"
+    return ""
+
+
+def _child(e, tag, index=None):
+    c = e.find(tag)
+    if c is None:
+        c = ET.Element(tag)
+        if index is None:
+            e.append(c)
+        else:
+            e.insert(index, c)
+    return c
+
+
+def admin_update(xapi, users, index, admin, cache=None, cache_prefix=''):
+    """
+    Apply admin (admin_username, admin_password, role) to the users
+    element. The password is hashed on the device only when the current
+    hash does not match it. Returns True if the entry changed.
+    """
+    name = admin['admin_username']
+    password = admin.get('admin_password')
+    role = admin.get('role')
+
+    e = index.get(name)
+    changed = False
+    if e is None:
+        if password is None or role is None:
+            raise ValueError("admin_password and role are required to "
+                             "create admin %s" % name)
+        e = ET.SubElement(users, 'entry', name=name)
+        index[name] = e
+        changed = True
 
-def admin_set(xapi, module, admin_username, admin_password, role):
-    if admin_password is not None:
-        xapi.op(cmd='request password-hash password "%s"' % admin_password,
-                cmd_xml=True)
-        r = xapi.element_root
-        phash = r.find('.//phash').text
     if role is not None:
-        rbval = "yes"
-        if role != "superuser" and role != 'superreader':
-            rbval = ""
-
-    ea = admin_exists(xapi, admin_username)
-    if ea is not None:
-        # user exists
-        changed = False
-
-        if role is not None:
-            rb = ea.find('.//role-based')
-            if rb is not None:
-                if rb[0].tag != role:
-                    changed = True
-                    xpath = _ADMIN_XPATH % admin_username
-                    xpath += '/permissions/role-based/%s' % rb[0].tag
-                    xapi.delete(xpath=xpath)
-
-                    xpath = _ADMIN_XPATH % admin_username
-                    xpath += '/permissions/role-based'
-                    xapi.set(xpath=xpath,
-                             element='<%s>%s</%s>' % (role, rbval, role))
-
-        if admin_password is not None:
-            xapi.edit(xpath=_ADMIN_XPATH % admin_username+'/phash',
-                      element='<phash>%s</phash>' % phash)
+        rb = _child(_child(e, 'permissions'), 'role-based')
+        if len(rb) != 1 or rb[0].tag != role:
+            for c in list(rb):
+                rb.remove(c)
+            ET.SubElement(rb, role).text = _role_value(role)
             changed = True
 
-        return changed
+    if password is not None:
+        key = cache_prefix + name
+        phash = _child(e, 'phash', 0)
+        if not password_matches(phash.text, password, cache, key):
+            phash.text = password_hash(xapi, password)
+            if cache is not None:
+                cache.set(key, _digest(phash.text, password))
+            changed = True
+
+    return changed
+
 
-    # setup the non encrypted part of the monitor
-    exml = []
+def admins_set(xapi, admins, cache=None, cache_prefix=''):
+    """
+    Reconcile many admin accounts: one get of the users, a password hash
+    request only for the passwords that changed and one edit per admin
+    changed (a set for a new one) touching its entry only, so that the
+    other accounts are never written. Returns the names of the admins changed.
+    """
+    users = fetch_admins(xapi)
+    index = dict([(e.get('name'), e) for e in users.findall('entry')])
 
-    exml.append('<phash>%s</phash>' % phash)
-    exml.append('<permissions><role-based><%s>%s</%s>'
-                '</role-based></permissions>' % (role, rbval, role))
+    existing = set(index)
+    changed = [a['admin_username'] for a in admins
+               if admin_update(xapi, users, index, a, cache, cache_prefix)]
 
-    exml = ''.join(exml)
-    # module.fail_json(msg=exml)
+    for name in changed:
+        e = index[name]
+        if name in existing:
+            element = ET.tostring(e)
+            if not isinstance(element, str):
+                element = element.decode('utf-8')
+            xapi.edit(xpath=_ADMIN_XPATH % name, element=element)
+        else:
+            element = ''.join([ET.tostring(c).decode('utf-8') for c in e])
+            xapi.set(xpath=_ADMIN_XPATH % name, element=element)
 
-    xapi.set(xpath=_ADMIN_XPATH % admin_username, element=exml)
+    if cache is not None:
+        cache.save()
 
-    return True
+    return changed
 
 
 def main():
@@ -160,7 +294,12 @@ def main():
         admin_username=dict(default='admin'),
         admin_password=dict(no_log=True),
         role=dict(),
-        commit=dict(type='bool', default=True)
+        admins=dict(type='list'),
+        admin_passwords=dict(type='dict', no_log=True),
+        password_cache_ttl=dict(type='int', default=0),
+        password_cache_file=dict(type='path'),
+        commit=dict(type='bool', default=True),
+        partial_commit=dict(type='bool', default=False)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
 
@@ -175,25 +314,53 @@ def main():
         module.fail_json(msg="password is required")
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
-    admin_username = module.params['admin_username']
-    if admin_username is None:
-        module.fail_json(msg="admin_username is required")
-    admin_password = module.params['admin_password']
-    role = module.params['role']
     commit = module.params['commit']
 
-    changed = admin_set(xapi, module, admin_username, admin_password, role)
+    admins = module.params['admins']
+    if admins:
+        admin_passwords = module.params['admin_passwords'] or {}
+        for idx, a in enumerate(admins):
+            if not isinstance(a, dict) or not a.get('admin_username'):
+                module.fail_json(msg="admins[%d]: admin_username is required"
+                                     % idx)
+            if 'admin_password' in a:
+                module.fail_json(msg="admins[%d]: the password of %s should "
+                                     "be given in admin_passwords" %
+                                     (idx, a['admin_username']))
+        admins = [dict(a, admin_password=admin_passwords.get(
+            a['admin_username'])) for a in admins]
+    else:
+        if module.params['admin_username'] is None:
+            module.fail_json(msg="admin_username is required")
+        admins = [dict(admin_username=module.params['admin_username'],
+                       admin_password=module.params['admin_password'],
+                       role=module.params['role'])]
+
+    cache = None
+    if module.params['password_cache_ttl'] > 0:
+        cache = TTLCache(module.params['password_cache_file'] or
+                         default_cache_path('admin_passwords'),
+                         module.params['password_cache_ttl'])
 
-    if changed and commit:
-        xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+    try:
+        changed = admins_set(xapi, admins, cache, ip_address + '/')
+        if changed and commit:
+            commit_candidate(xapi, **partial_scope(module, DEVICE_AND_NETWORK))
+    except ValueError:
+        exc = get_exception()
+        module.fail_json(msg=str(exc))
+    except PanXapiError:
+        exc = get_exception()
+        module.fail_json(msg=exc.message)
 
-    module.exit_json(changed=changed, msg="okey dokey")
+    module.exit_json(changed=bool(changed), changed_admins=changed,
+                     msg="okey dokey")
 
 if __name__ == '__main__':
     main()
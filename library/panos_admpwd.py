@@ -28,8 +28,8 @@ requirements:
 options:
     ip_address:
         description:
-            - IP address (or hostname) of PAN-OS device
-        required: true
+            - IP address (or hostname) of PAN-OS device. Required unless I(devices) is set.
+        required: false
     username:
         description:
             - username for initial authentication
@@ -37,12 +37,38 @@ options:
         default: "admin"
     key_filename:
         description:
-            - filename of the SSH Key to use for authentication
-        required: true
+            - filename of the SSH Key to use for authentication. Required unless set in every I(devices) entry.
+        required: false
     newpassword:
         description:
-            - password to configure for admin on the PAN-OS device
-        required: true
+            - password to configure for admin on the PAN-OS device. Required unless given for every device in
+              I(device_passwords).
+        required: false
+    devices:
+        description:
+            - list of devices to bootstrap from this single task instead of I(ip_address), each an IP address or
+              a dict with ip_address and optionally username and key_filename overriding the options. The devices
+              are bootstrapped concurrently and the result of each one is reported in devices.
+        required: false
+        default: null
+    device_passwords:
+        description:
+            - with I(devices), password to configure on some of the devices by IP address, overriding
+              I(newpassword). Kept apart from I(devices) so that only the passwords are hidden from the logs.
+        required: false
+        default: null
+    max_concurrency:
+        description:
+            - with I(devices), maximum number of SSH sessions open at the same time
+        required: false
+        default: 20
+    ready_timeout:
+        description:
+            - keep trying to connect for this many seconds while SSH is not ready on the device (booting
+              instances refuse or drop connections and reject the key until the management plane is up), with a
+              growing delay between attempts. 0 makes a single attempt. The last error is reported.
+        required: false
+        default: 0
 '''
 
 EXAMPLES = '''
@@ -58,6 +84,15 @@ EXAMPLES = '''
   until: not result|failed
   retries: 10
   delay: 30
+
+# Bootstrap freshly launched instances, waiting up to 10 minutes for SSH
+- name: set admin password on new instances
+  panos_admpwd:
+    devices: "{{ new_instances | map(attribute='private_ip') | list }}"
+    key_filename: "/tmp/ssh.key"
+    newpassword: "badpassword"
+    ready_timeout: 600
+    max_concurrency: 50
 '''
 
 RETURN = '''
@@ -66,6 +101,15 @@ status:
     returned: success
     type: string
     sample: "Last login: Fri Sep 16 11:09:20 2016 from 10.35.34.56.....Configuration committed successfully"
+stages:
+    description: seconds spent in each stage (connect, shell, password, commit), with the connection attempts
+    returned: success
+    type: list
+    sample: [{"stage": "connect", "seconds": 95.2, "attempts": 6}, {"stage": "shell", "seconds": 2.1}]
+devices:
+    description: with I(devices), result of each device (changed, failed, msg, stdout, stages, seconds)
+    returned: always
+    type: list
 '''
 
 ANSIBLE_METADATA = {'status': ['preview'],
@@ -73,6 +117,8 @@ ANSIBLE_METADATA = {'status': ['preview'],
                     'version': '1.0'}
 
 from ansible.module_utils.basic import AnsibleModule
+import socket
+import threading
 import time
 import sys
 
@@ -85,114 +131,290 @@ except ImportError:
 _PROMPTBUFF = 4096
 
 
+class DeviceFailure(Exception):
+    pass
+
+
+class _DeviceModule(object):
+    """
+    Stands in for the module while bootstrapping one device of a list:
+    fail_json fails that device only, not the whole task.
+    """
+    def __init__(self, module):
+        self.params = module.params
+        self.check_mode = module.check_mode
+
+    def fail_json(self, msg, **kwargs):
+        raise DeviceFailure(msg)
+
+
 def wait_with_timeout(module, shell, prompt, timeout=60):
-    now = time.time()
+    """
+    Read from shell until the output ends with prompt. recv blocks until
+    data arrives, for at most the time left, instead of spinning on
+    recv_ready.
+    """
+    deadline = time.time() + timeout
     result = ""
     while True:
-        if shell.recv_ready():
-            result += shell.recv(_PROMPTBUFF)
-            endresult = result.strip()
-            if len(endresult) != 0 and endresult[-1] == prompt:
-                break
-
-        if time.time()-now > timeout:
+        left = deadline - time.time()
+        if left <= 0:
             module.fail_json(msg="Timeout waiting for prompt")
+        shell.settimeout(left)
+        try:
+            data = shell.recv(_PROMPTBUFF)
+        except socket.timeout:
+            continue
+        if not data:
+            module.fail_json(msg="Connection closed waiting for prompt: " +
+                                 result)
+        if not isinstance(data, str):
+            data = data.decode('utf-8', 'replace')
+        result += data
+        endresult = result.strip()
+        if len(endresult) != 0 and endresult[-1] == prompt:
+            break
 
     return result
 
 
-def set_panwfw_password(module, ip_address, key_filename, newpassword, username):
+def connect(module, ip_address, username, key_filename, ready_timeout=0,
+            connect_timeout=10, interval=5, max_interval=30, backoff=1.5,
+            sleep=time.sleep):
+    """
+    Open the SSH connection. While the device is booting the connection
+    is refused or dropped, or the key rejected: it is retried, waiting interval seconds (growing
+    by backoff up to max_interval) between attempts, for ready_timeout
+    seconds at most. Returns the client and the number of attempts.
+    """
+    deadline = time.time() + ready_timeout
+    attempts = 0
+    while True:
+        attempts += 1
+        ssh = paramiko.SSHClient()
+
+        # add policy to accept all host keys, I haven't found
+        # a way to retrieve the instance SSH key fingerprint from AWS
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+        try:
+            ssh.connect(ip_address, username=username,
+                        key_filename=key_filename, timeout=connect_timeout)
+            return ssh, attempts
+        except (socket.error, paramiko.SSHException, EOFError):
+            # AuthenticationException included: a booting device rejects
+            # the bootstrap key until its management plane is up
+            ssh.close()
+            now = time.time()
+            if now >= deadline:
+                module.fail_json(msg="SSH not ready on %s after %d attempts: "
+                                     "%s" % (ip_address, attempts,
+                                             sys.exc_info()[1]))
+        sleep(min(interval, deadline - now))
+        interval = min(interval * backoff, max_interval)
+
+
+def set_panwfw_password(module, ip_address, key_filename, newpassword,
+                        username, ready_timeout=0, stages=None):
+    """
+    Set the password of username. The time spent in each stage is added
+    to stages, a list of dicts, when given.
+    """
     stdout = ""
+    if stages is None:
+        stages = []
 
-    ssh = paramiko.SSHClient()
+    def stage(name, start, **kwargs):
+        now = time.time()
+        stages.append(dict(stage=name, seconds=round(now - start, 3),
+                           **kwargs))
+        return now
 
-    # add policy to accept all host keys, I haven't found
-    # a way to retrieve the instance SSH key fingerprint from AWS
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    t = time.time()
+    ssh, attempts = connect(module, ip_address, username, key_filename,
+                            ready_timeout)
+    t = stage('connect', t, attempts=attempts)
 
-    ssh.connect(ip_address, username=username, key_filename=key_filename)
-    shell = ssh.invoke_shell()
-
-    # wait for the shell to start
-    buff = wait_with_timeout(module, shell, ">")
-    stdout += buff
+    try:
+        shell = ssh.invoke_shell()
 
-    # step into config mode
-    shell.send('configure\n')
-    # wait for the config prompt
-    buff = wait_with_timeout(module, shell, "#")
-    stdout += buff
+        # wait for the shell to start
+        buff = wait_with_timeout(module, shell, ">")
+        stdout += buff
 
-    if module.check_mode:
-        # exit and close connection
-        shell.send('exit\n')
-        ssh.close()
-        return False, 'Connection test successful. Password left intact.'
+        # step into config mode
+        shell.send('configure\n')
+        # wait for the config prompt
+        buff = wait_with_timeout(module, shell, "#")
+        stdout += buff
+        t = stage('shell', t)
 
-    # set admin password
-    shell.send('set mgt-config users ' + username + ' password\n')
+        if module.check_mode:
+            # exit and close connection
+            shell.send('exit\n')
+            return False, 'Connection test successful. Password left intact.'
 
-    # wait for the password prompt
-    buff = wait_with_timeout(module, shell, ":")
-    stdout += buff
+        # set admin password
+        shell.send('set mgt-config users ' + username + ' password\n')
 
-    # enter password for the first time
-    shell.send(newpassword+'\n')
+        # wait for the password prompt
+        buff = wait_with_timeout(module, shell, ":")
+        stdout += buff
 
-    # wait for the password prompt
-    buff = wait_with_timeout(module, shell, ":")
-    stdout += buff
+        # enter password for the first time
+        shell.send(newpassword+'\n')
 
-    # enter password for the second time
-    shell.send(newpassword+'\n')
+        # wait for the password prompt
+        buff = wait_with_timeout(module, shell, ":")
+        stdout += buff
 
-    # wait for the config mode prompt
-    buff = wait_with_timeout(module, shell, "#")
-    stdout += buff
+        # enter password for the second time
+        shell.send(newpassword+'\n')
 
-    # commit !
-    shell.send('commit\n')
+        # wait for the config mode prompt
+        buff = wait_with_timeout(module, shell, "#")
+        stdout += buff
+        t = stage('password', t)
 
-    # wait for the prompt
-    buff = wait_with_timeout(module, shell, "#", 120)
-    stdout += buff
+        # commit !
+        shell.send('commit\n')
 
-    if 'success' not in buff:
-        module.fail_json(msg="Error setting " + username + " password: " + stdout)
+        # wait for the prompt
+        buff = wait_with_timeout(module, shell, "#", 120)
+        stdout += buff
+        t = stage('commit', t)
 
-    # exit
-    shell.send('exit\n')
+        if 'success' not in buff:
+            module.fail_json(msg="Error setting " + username + " password: " + stdout)
 
-    ssh.close()
+        # exit
+        shell.send('exit\n')
+    finally:
+        ssh.close()
 
     return True, stdout
 
 
+def bootstrap_devices(module, devices, username, key_filename, newpassword,
+                      ready_timeout, max_concurrency):
+    """
+    Set the password on many devices from one process, running at most
+    max_concurrency SSH sessions at the same time. Returns a result per
+    device, with the time spent in each stage.
+    """
+    todo = list(devices)
+    done = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not todo:
+                    return
+                d = todo.pop(0)
+
+            stages = []
+            r = dict(ip_address=d['ip_address'], changed=False, stages=stages)
+            start = time.time()
+            try:
+                r['changed'], r['stdout'] = set_panwfw_password(
+                    _DeviceModule(module), d['ip_address'],
+                    d.get('key_filename') or key_filename,
+                    d.get('newpassword') or newpassword,
+                    d.get('username') or username,
+                    ready_timeout, stages)
+            except Exception:
+                r['failed'] = True
+                r['msg'] = str(sys.exc_info()[1])
+            r['seconds'] = round(time.time() - start, 3)
+
+            with lock:
+                done.append(r)
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(min(max_concurrency, len(devices)))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    order = dict([(d['ip_address'], n) for n, d in enumerate(devices)])
+    done.sort(key=lambda r: order[r['ip_address']])
+    return done
+
+
 def main():
     argument_spec = dict(
-        ip_address=dict(required=True),
+        ip_address=dict(),
         username=dict(default='admin'),
-        key_filename=dict(required=True),
-        newpassword=dict(no_log=True, required=True)
+        key_filename=dict(),
+        newpassword=dict(no_log=True),
+        devices=dict(type='list'),
+        device_passwords=dict(type='dict', no_log=True),
+        max_concurrency=dict(type='int', default=20),
+        ready_timeout=dict(type='int', default=0)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
     if not HAS_LIB:
         module.fail_json(msg='paramiko is required for this module')
 
     ip_address = module.params["ip_address"]
-    if not ip_address:
+    devices = module.params["devices"]
+    if not ip_address and not devices:
         module.fail_json(msg="ip_address should be specified")
     key_filename = module.params["key_filename"]
+    newpassword = module.params["newpassword"]
+    username = module.params['username']
+    ready_timeout = module.params['ready_timeout']
+
+    if devices:
+        device_passwords = module.params['device_passwords'] or {}
+        fleet = []
+        for d in devices:
+            if not isinstance(d, dict):
+                d = dict(ip_address=d)
+            if not d.get('ip_address'):
+                module.fail_json(msg="ip_address missing in devices entry %s"
+                                     % d)
+            if not (d.get('key_filename') or key_filename):
+                module.fail_json(msg="key_filename should be specified for %s"
+                                     % d['ip_address'])
+            if 'newpassword' in d:
+                module.fail_json(msg="newpassword of %s should be given in "
+                                     "device_passwords" % d['ip_address'])
+            d = dict(d, newpassword=device_passwords.get(d['ip_address']))
+            if not (d['newpassword'] or newpassword):
+                module.fail_json(msg="newpassword is required for %s" %
+                                     d['ip_address'])
+            fleet.append(d)
+
+        max_concurrency = module.params['max_concurrency']
+        if max_concurrency < 1:
+            module.fail_json(msg="max_concurrency should be at least 1")
+
+        results = bootstrap_devices(module, fleet, username, key_filename,
+                                    newpassword, ready_timeout,
+                                    max_concurrency)
+
+        changed = any([r['changed'] for r in results])
+        failed = [r['ip_address'] for r in results if r.get('failed')]
+        if failed:
+            module.fail_json(msg="password not set on %s" % ', '.join(failed),
+                             changed=changed, devices=results)
+
+        module.exit_json(changed=changed, devices=results)
+
     if not key_filename:
         module.fail_json(msg="key_filename should be specified")
-    newpassword = module.params["newpassword"]
     if not newpassword:
         module.fail_json(msg="newpassword is required")
-    username = module.params['username']
 
+    stages = []
     try:
-        changed, stdout = set_panwfw_password(module, ip_address, key_filename, newpassword, username)
-        module.exit_json(changed=changed, stdout=stdout)
+        changed, stdout = set_panwfw_password(module, ip_address, key_filename,
+                                              newpassword, username,
+                                              ready_timeout, stages)
+        module.exit_json(changed=changed, stdout=stdout, stages=stages)
     except Exception:
         x = sys.exc_info()[1]
         module.fail_json(msg=x)
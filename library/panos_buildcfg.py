@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+DOCUMENTATION = '''
+---
+module: panos_buildcfg
+short_description: build a loadable PAN-OS configuration file offline
+description:
+    - Merge address objects, service objects, NAT rules and security rules into a base configuration file and write
+      the result to a new file, without contacting any device. The output is meant to be uploaded with panos_import
+      (category configuration) and loaded with panos_loadcfg, so staging hundreds of objects on a new firewall takes
+      one upload, one load and one commit instead of one API round trip per object.
+    - Each list entry takes the same options as the matching panos_address, panos_service, panos_nat_policy and
+      panos_security_policy task, minus the connection and commit options.
+author: "Luigi Mori (@jtschichold), Ivan Bojer (@ivanbojer)"
+version_added: "2.3"
+notes:
+    - Runs locally, use it with connection local.
+    - New rules are appended after the rules already in the base configuration, in the order given.
+    - Checkmode is supported.
+options:
+    base_config:
+        description:
+            - configuration file to start from, e.g. an exported running config or samples/running-config_sample.xml
+        required: true
+    dest:
+        description:
+            - path of the configuration file to write
+        required: true
+    vsys:
+        description:
+            - vsys the objects and rules are added to
+        required: false
+        default: "vsys1"
+    addresses:
+        description:
+            - list of address objects, each with the panos_address options address_name, address, type,
+              description and tag
+        required: false
+        default: []
+    services:
+        description:
+            - list of service objects, each with the panos_service options service_name, protocol, port and
+              source_port
+        required: false
+        default: []
+    nat_rules:
+        description:
+            - list of NAT rules, each with the panos_nat_policy options rule_name, from_zone, to_zone, source,
+              destination, service, snat_type, snat_address, snat_interface, snat_interface_address,
+              snat_bidirectional, dnat_address and dnat_port
+        required: false
+        default: []
+    security_rules:
+        description:
+            - list of security rules, each with the panos_security_policy options rule_name, rule_type, description,
+              tag, from_zone, to_zone, source, source_user, destination, category, application, service,
+              hip_profiles, log_start, log_end, action, group_profile, antivirus, vulnerability, spyware,
+              url_filtering, file_blocking, data_filtering and wildfire_analysis
+        required: false
+        default: []
+    override:
+        description:
+            - replace objects and rules of the same name found in the base configuration. When false the base
+              configuration wins and the entry is skipped.
+        required: false
+        default: true
+'''
+
+EXAMPLES = '''
+# Stage objects and rules on a fresh firewall with a single load and commit
+  - name: build day-0 configuration
+    panos_buildcfg:
+      base_config: "{{playbook_dir}}/running-config_sample.xml"
+      dest: "/tmp/day0-config.xml"
+      addresses:
+        - address_name: "web-srv"
+          address: "10.0.1.101"
+          description: "web server"
+        - address_name: "apple-range"
+          type: "ip-range"
+          address: "17.0.0.0-17.255.255.255"
+      services:
+        - service_name: "service-tcp-221"
+          protocol: "tcp"
+          port: "221"
+      nat_rules:
+        - rule_name: "Web SSH"
+          from_zone: ["untrusted-l3"]
+          to_zone: "untrusted-l3"
+          destination: ["10.0.0.100"]
+          service: "service-tcp-221"
+          snat_type: "dynamic-ip-and-port"
+          snat_interface: "ethernet1/2"
+          dnat_address: "10.0.1.101"
+          dnat_port: "22"
+      security_rules:
+        - rule_name: "SSH permit"
+          from_zone: ["untrusted-l3"]
+          to_zone: ["trusted-l3"]
+          destination: ["web-srv"]
+          application: ["ssh"]
+          group_profile: "default"
+  - name: import configuration
+    panos_import:
+      ip_address: "192.168.1.1"
+      password: "admin"
+      file: "/tmp/day0-config.xml"
+      category: "configuration"
+    register: result
+  - name: load configuration
+    panos_loadcfg:
+      ip_address: "192.168.1.1"
+      password: "admin"
+      file: "{{result.filename}}"
+'''
+
+RETURN = '''
+dest:
+    description: path of the configuration file written
+    returned: success
+    type: string
+    sample: "/tmp/day0-config.xml"
+summary:
+    description: number of entries added, replaced and skipped for each kind of object
+    returned: success
+    type: dict
+    sample: {"addresses": {"added": 2, "replaced": 0, "skipped": 0}}
+'''
+
+ANSIBLE_METADATA = {'status': ['preview'],
+                    'supported_by': 'community',
+                    'version': '1.0'}
+
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_xml import XmlTemplateError, ADDRESS, \
+    SERVICE, DNAT, SNAT_STATIC_IP, SNAT_DIPP_INTERFACE, SNAT_DIPP_ADDRESS, \
+    NAT_RULE, SECURITY_RULE, SECURITY_GROUP_PROFILE, SECURITY_PROFILES
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+_VSYS_XPATH = "./devices/entry[@name='localhost.localdomain']" + \
+              "/vsys/entry[@name='%s']"
+
+# same options and defaults as the per-object modules
+_ADDRESS_SPEC = dict(
+    address_name=dict(required=True),
+    address=dict(required=True),
+    description=dict(),
+    tag=dict(),
+    type=dict(default='ip-netmask', choices=['ip-netmask', 'ip-range', 'fqdn'])
+)
+
+_SERVICE_SPEC = dict(
+    service_name=dict(required=True),
+    protocol=dict(required=True, choices=['tcp', 'udp']),
+    port=dict(required=True),
+    source_port=dict()
+)
+
+_NAT_RULE_SPEC = dict(
+    rule_name=dict(required=True),
+    from_zone=dict(type='list', required=True),
+    to_zone=dict(required=True),
+    source=dict(type='list', default=['any']),
+    destination=dict(type='list', default=['any']),
+    service=dict(default='any'),
+    snat_type=dict(choices=['static-ip', 'dynamic-ip-and-port']),
+    snat_address=dict(),
+    snat_interface=dict(),
+    snat_interface_address=dict(),
+    snat_bidirectional=dict(type='bool', default=False),
+    dnat_address=dict(),
+    dnat_port=dict()
+)
+
+_SECURITY_RULE_SPEC = dict(
+    rule_name=dict(required=True),
+    description=dict(),
+    tag=dict(),
+    to_zone=dict(type='list', default=['any']),
+    from_zone=dict(type='list', default=['any']),
+    source=dict(type='list', default=['any']),
+    source_user=dict(type='list', default=['any']),
+    destination=dict(type='list', default=['any']),
+    category=dict(type='list', default=['any']),
+    application=dict(type='list', default=['any']),
+    service=dict(type='list', default=['application-default']),
+    hip_profiles=dict(type='list', default=['any']),
+    group_profile=dict(),
+    antivirus=dict(),
+    vulnerability=dict(),
+    spyware=dict(),
+    url_filtering=dict(),
+    file_blocking=dict(),
+    data_filtering=dict(),
+    wildfire_analysis=dict(),
+    log_start=dict(type='bool', default=False),
+    log_end=dict(type='bool', default=True),
+    rule_type=dict(default='universal',
+                   choices=['universal', 'intrazone', 'interzone']),
+    action=dict(default='allow',
+                choices=['allow', 'deny', 'drop', 'reset-client',
+                         'reset-server', 'reset-both'])
+)
+
+
+def normalize(module, option, items, spec, name_key):
+    """
+    Check each entry of a list option against spec and fill in the
+    defaults, the same way AnsibleModule does for a single-object task.
+    """
+    result = []
+    names = set()
+    for idx, item in enumerate(items):
+        where = '%s[%d]' % (option, idx)
+        if not isinstance(item, dict):
+            module.fail_json(msg='%s: expected a dict, got %r' % (where, item))
+
+        unknown = set(item) - set(spec)
+        if unknown:
+            module.fail_json(msg='%s: unsupported options %s' %
+                                 (where, ', '.join(sorted(unknown))))
+
+        o = {}
+        for k, s in spec.items():
+            v = item.get(k)
+            if v is None:
+                if s.get('required'):
+                    module.fail_json(msg='%s: missing required option %s' %
+                                         (where, k))
+                v = s.get('default')
+            elif s.get('type') == 'list':
+                if isinstance(v, string_types):
+                    v = [x.strip() for x in v.split(',')]
+                elif not isinstance(v, list):
+                    v = [v]
+            elif s.get('type') == 'bool':
+                v = module.boolean(v)
+            elif not isinstance(v, string_types):
+                v = str(v)
+
+            if v is not None and 'choices' in s and v not in s['choices']:
+                module.fail_json(msg='%s: %s must be one of %s, got %s' %
+                                     (where, k, ', '.join(s['choices']), v))
+            o[k] = v
+
+        if o[name_key] in names:
+            module.fail_json(msg='%s: duplicate %s %s' %
+                                 (where, name_key, o[name_key]))
+        names.add(o[name_key])
+        result.append(o)
+
+    return result
+
+
+def nat_translations(module, rule):
+    if rule['dnat_address'] is not None or rule['dnat_port'] is not None:
+        rule['dnatxml'] = DNAT.render(rule)
+    else:
+        rule['dnatxml'] = None
+
+    snat_type = rule['snat_type']
+    if snat_type is None:
+        rule['snatxml'] = None
+    elif snat_type == 'static-ip':
+        if rule['snat_address'] is None:
+            module.fail_json(msg="%s: snat_address should be specified "
+                                 "for snat_type static-ip" % rule['rule_name'])
+        rule['snatxml'] = SNAT_STATIC_IP.render(rule)
+    elif rule['snat_interface'] is not None:
+        rule['snatxml'] = SNAT_DIPP_INTERFACE.render(rule)
+    elif rule['snat_address'] is not None:
+        rule['snatxml'] = SNAT_DIPP_ADDRESS.render(rule)
+    else:
+        module.fail_json(msg="%s: no snat_interface or snat_address specified "
+                             "for snat_type dynamic-ip-and-port" %
+                             rule['rule_name'])
+
+    return rule
+
+
+def profile_setting(rule):
+    # a profile group supersedes the individual profiles
+    if rule['group_profile']:
+        rule['profile_setting'] = SECURITY_GROUP_PROFILE.render(rule)
+    elif [k for k in ('antivirus', 'vulnerability', 'spyware',
+                      'url_filtering', 'file_blocking', 'data_filtering',
+                      'wildfire_analysis') if rule[k]]:
+        rule['profile_setting'] = SECURITY_PROFILES.render(rule)
+    else:
+        rule['profile_setting'] = None
+
+    return rule
+
+
+def container(parent, path):
+    """Find or create the element at path (tag names separated by /)."""
+    e = parent
+    for t in path.split('/'):
+        child = e.find(t)
+        if child is None:
+            child = ET.SubElement(e, t)
+        e = child
+    return e
+
+
+def merge_entries(parent, path, template, objects, name_key, override):
+    """
+    Render objects in one pass and merge the resulting <entry> elements
+    into the container at path. Entries with the same name are replaced in
+    place, or left alone when override is false; new entries are appended.
+    """
+    counts = dict(added=0, replaced=0, skipped=0)
+    if not objects:
+        return counts
+
+    c = container(parent, path)
+    existing = dict((e.get('name'), i) for i, e in enumerate(c)
+                    if e.tag == 'entry')
+
+    rendered = ET.fromstring('<entries>%s</entries>' %
+                             template.render_entries(objects, name_key))
+
+    for new in list(rendered):
+        idx = existing.get(new.get('name'))
+        if idx is None:
+            c.append(new)
+            counts['added'] += 1
+        elif override:
+            c[idx] = new
+            counts['replaced'] += 1
+        else:
+            counts['skipped'] += 1
+
+    return counts
+
+
+def build_config(module, base_config, vsys, addresses, services,
+                 nat_rules, security_rules, override):
+    try:
+        root = ET.parse(base_config).getroot()
+    except (IOError, OSError, ET.ParseError):
+        exc = get_exception()
+        module.fail_json(msg='cannot read %s: %s' % (base_config, exc))
+
+    vsys_entry = root.find(_VSYS_XPATH % vsys)
+    if vsys_entry is None:
+        module.fail_json(msg='vsys %s not found in %s' % (vsys, base_config))
+
+    summary = {}
+    try:
+        summary['addresses'] = merge_entries(
+            vsys_entry, 'address', ADDRESS,
+            addresses, 'address_name', override)
+        summary['services'] = merge_entries(
+            vsys_entry, 'service', SERVICE,
+            services, 'service_name', override)
+        summary['nat_rules'] = merge_entries(
+            vsys_entry, 'rulebase/nat/rules', NAT_RULE,
+            [nat_translations(module, r) for r in nat_rules],
+            'rule_name', override)
+        summary['security_rules'] = merge_entries(
+            vsys_entry, 'rulebase/security/rules', SECURITY_RULE,
+            [profile_setting(r) for r in security_rules],
+            'rule_name', override)
+    except XmlTemplateError:
+        exc = get_exception()
+        module.fail_json(msg=str(exc))
+
+    return ET.tostring(root, encoding='utf-8'), summary
+
+
+def main():
+    argument_spec = dict(
+        base_config=dict(required=True, type='path'),
+        dest=dict(required=True, type='path'),
+        vsys=dict(default='vsys1'),
+        addresses=dict(type='list', default=[]),
+        services=dict(type='list', default=[]),
+        nat_rules=dict(type='list', default=[]),
+        security_rules=dict(type='list', default=[]),
+        override=dict(type='bool', default=True)
+    )
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    base_config = module.params['base_config']
+    dest = module.params['dest']
+    vsys = module.params['vsys']
+    override = module.params['override']
+
+    addresses = normalize(module, 'addresses', module.params['addresses'],
+                          _ADDRESS_SPEC, 'address_name')
+    services = normalize(module, 'services', module.params['services'],
+                         _SERVICE_SPEC, 'service_name')
+    nat_rules = normalize(module, 'nat_rules', module.params['nat_rules'],
+                          _NAT_RULE_SPEC, 'rule_name')
+    security_rules = normalize(module, 'security_rules',
+                               module.params['security_rules'],
+                               _SECURITY_RULE_SPEC, 'rule_name')
+
+    config, summary = build_config(module, base_config, vsys, addresses,
+                                   services, nat_rules, security_rules,
+                                   override)
+
+    changed = True
+    if os.path.exists(dest):
+        f = open(dest, 'rb')
+        try:
+            changed = f.read() != config
+        finally:
+            f.close()
+
+    if changed and not module.check_mode:
+        fd, tmpname = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(dest)), prefix='.panos_buildcfg')
+        try:
+            os.write(fd, config)
+        finally:
+            os.close(fd)
+        module.atomic_move(tmpname, dest)
+
+    module.exit_json(changed=changed, dest=dest, summary=summary,
+                     msg="okey dokey")
+
+
+if __name__ == '__main__':
+    main()
@@ -45,24 +45,40 @@ options:
         default: null
     cert_friendly_name:
         description:
-            - Human friendly certificate name (not CN but just a friendly name).
-        required: true
+            - Human friendly certificate name (not CN but just a friendly name). Required unless I(certificates) is
+              set.
+        required: false
         default: null
     cert_cn:
         description:
-            - Certificate CN (common name) embeded in the certificate signature.
-        required: true
+            - Certificate CN (common name) embeded in the certificate signature. Required unless I(certificates) is
+              set.
+        required: false
         default: null
     signed_by:
         description:
-            - Undersigning authority (CA) that MUST already be presents on the device.
-        required: true
+            - Undersigning authority (CA) that MUST already be presents on the device. With I(certificates), the
+              default for the entries that do not set it.
+        required: false
         default: null
     rsa_nbits:
         description:
-            - Number of bits used by the RSA algorithm for the certificate generation.
+            - Number of bits used by the RSA algorithm for the certificate generation. With I(certificates), the
+              default for the entries that do not set it.
         required: false
         default: "2048"
+    certificates:
+        description:
+            - List of certificates to generate, each a dict with cert_cn, cert_friendly_name and optionally
+              signed_by and rsa_nbits. They are generated one after the other over a single SSH session; the output
+              of each one is checked as soon as it completes and the remaining ones are skipped after a failure.
+        required: false
+        default: null
+    timeout:
+        description:
+            - Seconds to wait for the generation of each certificate.
+        required: false
+        default: 60
 '''
 
 EXAMPLES = '''
@@ -74,10 +90,28 @@ EXAMPLES = '''
     cert_cn: "1.1.1.1"
     cert_friendly_name: "test123"
     signed_by: "root-ca"
+
+# Generates several certificates over one ssh session
+- name: generate certificates
+  panos_cert_gen_ssh:
+    ip_address: "192.168.1.1"
+    key_filename: "/tmp/ssh.key"
+    signed_by: "root-ca"
+    certificates:
+      - cert_cn: "gp.example.com"
+        cert_friendly_name: "gp-portal"
+      - cert_cn: "vpn.example.com"
+        cert_friendly_name: "gp-gateway"
+        rsa_nbits: "4096"
 '''
 
 RETURN='''
-# Default return values
+certificates:
+    description: result of each certificate, with the seconds taken to generate it, failed and msg on failure or
+                 skipped when a previous one failed
+    returned: always
+    type: list
+    sample: [{"cert_friendly_name": "gp-portal", "cert_cn": "gp.example.com", "seconds": 3.2}]
 '''
 
 ANSIBLE_METADATA = {'status': ['preview'],
@@ -86,6 +120,7 @@ ANSIBLE_METADATA = {'status': ['preview'],
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+import socket
 import time
 
 try:
@@ -98,24 +133,44 @@ _PROMPTBUFF = 4096
 
 
 def wait_with_timeout(module, shell, prompt, timeout=60):
-    now = time.time()
+    """
+    Read from shell until the output ends with prompt, blocking in recv
+    for at most the time left instead of spinning on recv_ready.
+    """
+    deadline = time.time() + timeout
     result = ""
     while True:
-        if shell.recv_ready():
-            result += shell.recv(_PROMPTBUFF)
-            endresult = result.strip()
-            if len(endresult) != 0 and endresult[-1] == prompt:
-                break
-
-        if time.time()-now > timeout:
+        left = deadline - time.time()
+        if left <= 0:
             module.fail_json(msg="Timeout waiting for prompt")
+        shell.settimeout(left)
+        try:
+            data = shell.recv(_PROMPTBUFF)
+        except socket.timeout:
+            continue
+        if not data:
+            module.fail_json(msg="Connection closed waiting for prompt: " +
+                                 result)
+        if not isinstance(data, str):
+            data = data.decode('utf-8', 'replace')
+        result += data
+        endresult = result.strip()
+        if len(endresult) != 0 and endresult[-1] == prompt:
+            break
 
     return result
 
 
-def generate_cert(module, ip_address, key_filename, password,
-                  cert_cn, cert_friendly_name, signed_by, rsa_nbits ):
+def generate_certs(module, ip_address, key_filename, password, certs,
+                   timeout=60):
+    """
+    Generate the certificates one after the other in a single SSH
+    session. Each command's output is checked as soon as its prompt comes
+    back; on the first failure the remaining certificates are not
+    attempted. Returns a result per certificate and the whole output.
+    """
     stdout = ""
+    results = []
 
     client = paramiko.SSHClient()
 
@@ -128,30 +183,68 @@ def generate_cert(module, ip_address, key_filename, password,
     else:
         client.connect(ip_address, username="admin", key_filename=key_filename)
 
-    shell = client.invoke_shell()
-    # wait for the shell to start
-    buff = wait_with_timeout(module, shell, ">")
-    stdout += buff
+    try:
+        shell = client.invoke_shell()
+        # wait for the shell to start
+        buff = wait_with_timeout(module, shell, ">")
+        stdout += buff
+
+        failed = False
+        for cert in certs:
+            r = dict(cert_friendly_name=cert['cert_friendly_name'],
+                     cert_cn=cert['cert_cn'])
+            results.append(r)
+            if failed:
+                r['skipped'] = True
+                continue
 
-    # generate self-signed certificate
-    if isinstance(cert_cn, list):
-        cert_cn = cert_cn[0]
-    cmd = 'request certificate generate signed-by {0} certificate-name {1} name {2} algorithm RSA rsa-nbits {3}\n'.format(
-        signed_by, cert_friendly_name, cert_cn, rsa_nbits)
-    shell.send(cmd)
+            # generate self-signed certificate
+            cmd = 'request certificate generate signed-by {0} certificate-name {1} name {2} algorithm RSA rsa-nbits {3}\n'.format(
+                cert['signed_by'], cert['cert_friendly_name'], cert['cert_cn'],
+                cert['rsa_nbits'])
+            start = time.time()
+            shell.send(cmd)
 
-    # wait for the shell to complete
-    buff = wait_with_timeout(module, shell, ">")
-    stdout += buff
+            # wait for the shell to complete
+            buff = wait_with_timeout(module, shell, ">", timeout)
+            stdout += buff
+            r['seconds'] = round(time.time() - start, 3)
 
-    # exit
-    shell.send('exit\n')
+            if 'Success' not in buff:
+                r['failed'] = True
+                r['msg'] = buff.strip()
+                failed = True
 
-    if 'Success' not in buff:
-        module.fail_json(msg="Error generating self signed certificate: "+stdout)
+        # exit
+        shell.send('exit\n')
+    finally:
+        client.close()
 
-    client.close()
-    return stdout
+    return results, stdout
+
+
+def parse_certs(module, certs):
+    """Validate the certificates list, filling in the module defaults."""
+    parsed = []
+    for idx, c in enumerate(certs):
+        if not isinstance(c, dict) or not c.get('cert_cn') or \
+                not c.get('cert_friendly_name'):
+            module.fail_json(msg="certificates[%d]: cert_cn and "
+                                 "cert_friendly_name are required" % idx)
+        signed_by = c.get('signed_by') or module.params['signed_by']
+        if not signed_by:
+            module.fail_json(msg="certificates[%d]: signed_by is required" %
+                                 idx)
+        cert_cn = c['cert_cn']
+        if isinstance(cert_cn, list):
+            cert_cn = cert_cn[0]
+        parsed.append(dict(
+            cert_cn=cert_cn,
+            cert_friendly_name=c['cert_friendly_name'],
+            signed_by=signed_by,
+            rsa_nbits=c.get('rsa_nbits') or module.params['rsa_nbits']
+        ))
+    return parsed
 
 
 def main():
@@ -159,39 +252,50 @@ def main():
         ip_address=dict(required=True),
         key_filename=dict(),
         password=dict(no_log=True),
-        cert_cn=dict(required=True),
-        cert_friendly_name=dict(required=True),
+        cert_cn=dict(),
+        cert_friendly_name=dict(),
         rsa_nbits=dict(default='2048'),
-        signed_by=dict(required=True)
-
+        signed_by=dict(),
+        certificates=dict(type='list'),
+        timeout=dict(type='int', default=60)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False,
-                           required_one_of=[['key_filename', 'password']])
+                           required_one_of=[['key_filename', 'password'],
+                                            ['cert_cn', 'certificates']])
     if not HAS_LIB:
         module.fail_json(msg='paramiko is required for this module')
 
     ip_address = module.params["ip_address"]
     key_filename = module.params["key_filename"]
     password = module.params["password"]
-    cert_cn = module.params["cert_cn"]
-    cert_friendly_name = module.params["cert_friendly_name"]
-    signed_by = module.params["signed_by"]
-    rsa_nbits = module.params["rsa_nbits"]
+    certificates = module.params["certificates"]
+
+    if certificates:
+        certs = parse_certs(module, certificates)
+    else:
+        certs = parse_certs(module, [dict(
+            cert_cn=module.params["cert_cn"],
+            cert_friendly_name=module.params["cert_friendly_name"],
+            signed_by=module.params["signed_by"]
+        )])
 
     try:
-        stdout = generate_cert(module,
-                               ip_address,
-                               key_filename,
-                               password,
-                               cert_cn,
-                               cert_friendly_name,
-                               signed_by,
-                               rsa_nbits)
+        results, stdout = generate_certs(module, ip_address, key_filename,
+                                         password, certs,
+                                         module.params['timeout'])
     except Exception:
         exc = get_exception()
-        module.fail_json(msg=exc.message)
+        module.fail_json(msg=str(exc))
+
+    generated = [r for r in results if 'seconds' in r and not r.get('failed')]
+    failed = [r for r in results if r.get('failed')]
+    if failed:
+        module.fail_json(msg="Error generating self signed certificate %s: %s"
+                             % (failed[0]['cert_friendly_name'],
+                                failed[0]['msg']),
+                         changed=bool(generated), certificates=results)
 
-    module.exit_json(changed=True, msg="okey dokey")
+    module.exit_json(changed=True, certificates=results, msg="okey dokey")
 
 if __name__ == '__main__':
     main()
@@ -79,6 +79,7 @@ ANSIBLE_METADATA = {'status': ['preview'],
                     'version': '1.0'}
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.panos_metrics import instrument
 import time
 
 try:
@@ -118,12 +119,12 @@ def main():
     timeout = module.params['timeout']
     interval = module.params['interval']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password,
         timeout=60
-    )
+    ))
 
     checkpnt = time.time()+timeout
     while True:
@@ -54,6 +54,46 @@ options:
             - if commit should be synchronous
         required: false
         default: true
+    admins:
+        description:
+            - commit only the changes made by these administrators (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: None
+    exclude_device_and_network:
+        description:
+            - leave the device and network configuration out of the commit (partial commit)
+        required: false
+        default: false
+    exclude_policy_and_objects:
+        description:
+            - leave the policy and objects configuration out of the commit (partial commit)
+        required: false
+        default: false
+    exclude_shared_object:
+        description:
+            - leave the shared objects out of the commit (partial commit)
+        required: false
+        default: false
+    vsys:
+        description:
+            - commit only the configuration of these vsys (partial commit)
+        required: false
+        default: None
+    no_vsys:
+        description:
+            - leave the configuration of all vsys out of the commit (partial commit)
+        required: false
+        default: false
+    description:
+        description:
+            - commit description
+        required: false
+        default: None
+    force:
+        description:
+            - force the commit
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
@@ -62,6 +102,14 @@ EXAMPLES = '''
     ip_address: "192.168.1.1"
     username: "admin"
     password: "admin"
+
+# Commit only the policy and object changes made by admin
+- panos_commit:
+    ip_address: "192.168.1.1"
+    username: "admin"
+    password: "admin"
+    admins: ["admin"]
+    exclude_device_and_network: true
 '''
 
 RETURN = '''
@@ -70,6 +118,13 @@ status:
     returned: success
     type: string
     sample: "okey dokey"
+jobs:
+    description: commit job waited on, with duration, number of status polls and status timeline; empty when
+                 sync is false or there was nothing to commit
+    returned: success
+    type: list
+    sample: [{"id": "42", "ids": ["42"], "type": "commit", "result": "OK", "seconds": 35.1, "polls": 8,
+              "timeline": [{"t": 0.3, "id": "42", "status": "ACT", "progress": "55"}]}]
 '''
 
 ANSIBLE_METADATA = {'status': ['preview'],
@@ -77,6 +132,9 @@ ANSIBLE_METADATA = {'status': ['preview'],
                     'version': '1.0'}
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    DEVICE_AND_NETWORK, POLICY_AND_OBJECTS, SHARED_OBJECT
 
 try:
     import pan.xapi
@@ -92,7 +150,15 @@ def main():
         username=dict(default='admin'),
         interval=dict(default=0.5),
         timeout=dict(),
-        sync=dict(type='bool', default=True)
+        sync=dict(type='bool', default=True),
+        admins=dict(type='list'),
+        exclude_device_and_network=dict(type='bool', default=False),
+        exclude_policy_and_objects=dict(type='bool', default=False),
+        exclude_shared_object=dict(type='bool', default=False),
+        vsys=dict(type='list'),
+        no_vsys=dict(type='bool', default=False),
+        description=dict(),
+        force=dict(type='bool', default=False)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
 
@@ -111,20 +177,35 @@ def main():
     timeout = module.params['timeout']
     sync = module.params['sync']
 
-    xapi = pan.xapi.PanXapi(
+    excluded = []
+    if module.params['exclude_device_and_network']:
+        excluded.append(DEVICE_AND_NETWORK)
+    if module.params['exclude_policy_and_objects']:
+        excluded.append(POLICY_AND_OBJECTS)
+    if module.params['exclude_shared_object']:
+        excluded.append(SHARED_OBJECT)
+
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
-
-    xapi.commit(
-        cmd="<commit></commit>",
+    ))
+
+    job = commit_candidate(
+        xapi,
+        admins=module.params['admins'],
+        excluded=excluded,
+        vsys=module.params['vsys'],
+        no_vsys=module.params['no_vsys'],
+        description=module.params['description'],
+        force=module.params['force'],
         sync=sync,
         interval=interval,
         timeout=timeout
     )
 
-    module.exit_json(changed=True, msg="okey dokey")
+    jobs = [job.to_dict()] if job is not None else []
+    module.exit_json(changed=True, jobs=jobs, msg="okey dokey")
 
 if __name__ == '__main__':
     main()
@@ -55,6 +55,12 @@ options:
             - commit if changed
         required: false
         default: true
+    partial_commit:
+        description:
+            - commit only the changes made by I(username), leaving out the device and network configuration
+              (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
@@ -75,6 +81,9 @@ ANSIBLE_METADATA = {'status': ['preview'],
                     'version': '1.0'}
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    partial_scope, POLICY_AND_OBJECTS
 
 try:
     import pan.xapi
@@ -118,7 +127,8 @@ def main():
         username=dict(default='admin'),
         dag_name=dict(required=True),
         dag_filter=dict(required=True),
-        commit=dict(type='bool', default=True)
+        commit=dict(type='bool', default=True),
+        partial_commit=dict(type='bool', default=False)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
     if not HAS_LIB:
@@ -128,11 +138,11 @@ def main():
     password = module.params["password"]
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     dag_name = module.params['dag_name']
     dag_filter = module.params['dag_filter']
@@ -141,7 +151,7 @@ def main():
     changed = add_dag(xapi, dag_name, dag_filter)
 
     if changed and commit:
-        xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+        commit_candidate(xapi, **partial_scope(module, POLICY_AND_OBJECTS))
 
     module.exit_json(changed=changed, msg="okey dokey")
 
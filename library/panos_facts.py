@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+DOCUMENTATION = '''
+---
+module: panos_facts
+short_description: gather facts about a PAN-OS device
+description:
+    - Gather system information, high availability state, interfaces, content versions, licenses and configuration
+      statistics of a device as ansible facts, all of them or a subset.
+    - Each API command is issued once even when several subsets need it (system and content both come from show
+      system info) and the commands run concurrently, so gathering everything takes about as long as the slowest
+      command.
+    - The facts are returned as ansible_facts and end up in the Ansible fact cache when fact caching is enabled. With
+      I(cache_ttl) they are also kept on the host running the module, so the next plays within the TTL do not query
+      the device at all.
+author: "Luigi Mori (@jtschichold), Ivan Bojer (@ivanbojer)"
+version_added: "2.3"
+requirements:
+    - pan-python
+notes:
+    - Checkmode is supported.
+options:
+    ip_address:
+        description:
+            - IP address (or hostname) of PAN-OS device
+        required: true
+    password:
+        description:
+            - password for authentication
+        required: false
+        default: None
+    username:
+        description:
+            - username for authentication
+        required: false
+        default: "admin"
+    api_key:
+        description:
+            - API key that can be used instead of I(username)/I(password) credentials.
+        required: false
+        default: None
+    gather_subset:
+        description:
+            - subsets to gather, among system, ha, interfaces, content, licenses and config, or all. A subset
+              prefixed with ! is left out, e.g. ["all", "!config"].
+        required: false
+        default: ["all"]
+    cache_ttl:
+        description:
+            - seconds the facts of each subset are reused from the cache instead of being gathered again, 0
+              disables the cache
+        required: false
+        default: 0
+    cache_file:
+        description:
+            - path of the cache, shared by all devices and tasks. Defaults to facts.json in $PANOS_CACHE_DIR or
+              ~/.ansible/cache/panos.
+        required: false
+        default: None
+'''
+
+EXAMPLES = '''
+- name: gather everything
+  panos_facts:
+    ip_address: "192.168.1.1"
+    password: "admin"
+
+- name: software version and HA state, at most once an hour
+  panos_facts:
+    ip_address: "192.168.1.1"
+    password: "admin"
+    gather_subset: ["system", "ha"]
+    cache_ttl: 3600
+
+- debug: msg="{{panos_system.sw_version}} {{panos_ha.local_state}}"
+'''
+
+RETURN = '''
+ansible_facts:
+    description: >
+        panos_system (the fields of show system info), panos_ha (enabled, mode, local_state, peer_state,
+        peer_connection, running_sync), panos_interfaces (state, speed, duplex, mac, zone, vsys, virtual router and
+        ip of each interface by name), panos_content (version and release date of each content type), panos_licenses
+        (feature, description, issued, expires, expired and authcode of each license) and panos_config (per vsys
+        object and rule counts, pending_changes), for the subsets gathered
+    returned: success
+    type: dict
+    sample: {"panos_system": {"hostname": "fw1", "model": "PA-VM", "serial": "007200001234", "sw_version": "8.0.2"},
+             "panos_ha": {"enabled": true, "mode": "Active-Passive", "local_state": "active",
+                          "peer_state": "passive", "peer_connection": "up", "running_sync": "synchronized"}}
+gathered_subset:
+    description: subsets gathered
+    returned: success
+    type: list
+    sample: ["ha", "system"]
+cached:
+    description: subsets taken from the cache instead of the device
+    returned: success
+    type: list
+    sample: ["system"]
+'''
+
+ANSIBLE_METADATA = {'status': ['preview'],
+                    'supported_by': 'community',
+                    'version': '1.0'}
+
+import threading
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_cache import TTLCache, default_cache_path
+
+try:
+    import pan.xapi
+    from pan.xapi import PanXapiError
+    HAS_LIB = True
+except ImportError:
+    HAS_LIB = False
+
+_VSYS_XPATH = "/config/devices/entry[@name='localhost.localdomain']/vsys"
+
+# API commands, (method, argument)
+_COMMANDS = {
+    'system_info': ('op', '<show><system><info></info></system></show>'),
+    'ha_state': ('op', '<show><high-availability><state></state>'
+                       '</high-availability></show>'),
+    'interfaces': ('op', '<show><interface>all</interface></show>'),
+    'licenses': ('op', '<request><license><info></info></license>'
+                       '</request>'),
+    'pending_changes': ('op', '<check><pending-changes></pending-changes>'
+                              '</check>'),
+    'vsys_config': ('show', _VSYS_XPATH),
+}
+
+
+def _text(e, path):
+    if e is None:
+        return None
+    t = e.find(path)
+    if t is None or t.text is None:
+        return None
+    return t.text.strip()
+
+
+def _fields(e):
+    """Leaf children of e as a dict, - in tags replaced by _."""
+    if e is None:
+        return {}
+    return dict((c.tag.replace('-', '_'), c.text.strip() if c.text else None)
+                for c in e if len(c) == 0)
+
+
+def parse_system(roots):
+    return _fields(roots['system_info'].find('./result/system'))
+
+
+def parse_content(roots):
+    system = parse_system(roots)
+    return dict((k, v) for k, v in system.items()
+                if k != 'sw_version' and
+                (k.endswith('_version') or k.endswith('_release_date')))
+
+
+def parse_ha(roots):
+    result = roots['ha_state'].find('./result')
+    group = result.find('group') if result is not None else None
+    return dict(
+        enabled=_text(result, 'enabled') == 'yes',
+        mode=_text(group, 'mode'),
+        local_state=_text(group, 'local-info/state'),
+        peer_state=_text(group, 'peer-info/state'),
+        peer_connection=_text(group, 'peer-info/conn-status'),
+        running_sync=_text(group, 'running-sync')
+    )
+
+
+def parse_interfaces(roots):
+    root = roots['interfaces']
+    interfaces = {}
+    for e in root.findall('./result/hw/entry'):
+        interfaces.setdefault(_text(e, 'name'), {}).update(
+            state=_text(e, 'state'),
+            speed=_text(e, 'speed'),
+            duplex=_text(e, 'duplex'),
+            mac=_text(e, 'mac')
+        )
+    for e in root.findall('./result/ifnet/entry'):
+        interfaces.setdefault(_text(e, 'name'), {}).update(
+            zone=_text(e, 'zone'),
+            vsys=_text(e, 'vsys'),
+            virtual_router=_text(e, 'fwd'),
+            ip=_text(e, 'ip'),
+            tag=_text(e, 'tag')
+        )
+    interfaces.pop(None, None)
+    return interfaces
+
+
+def parse_licenses(roots):
+    licenses = []
+    for e in roots['licenses'].findall('./result/licenses/entry'):
+        licenses.append(dict(
+            feature=_text(e, 'feature'),
+            description=_text(e, 'description'),
+            issued=_text(e, 'issued'),
+            expires=_text(e, 'expires'),
+            expired=_text(e, 'expired') == 'yes',
+            authcode=_text(e, 'authcode')
+        ))
+    return licenses
+
+
+_COUNTED = (
+    ('addresses', 'address/entry'),
+    ('address_groups', 'address-group/entry'),
+    ('services', 'service/entry'),
+    ('service_groups', 'service-group/entry'),
+    ('security_rules', 'rulebase/security/rules/entry'),
+    ('nat_rules', 'rulebase/nat/rules/entry'),
+    ('zones', 'zone/entry'),
+)
+
+
+def parse_config(roots):
+    vsys = {}
+    for e in roots['vsys_config'].findall('./result/vsys/entry'):
+        vsys[e.get('name')] = dict((name, len(e.findall(path)))
+                                   for name, path in _COUNTED)
+    pending = roots['pending_changes'].find('./result')
+    return dict(
+        vsys=vsys,
+        pending_changes=pending is not None and pending.text == 'yes'
+    )
+
+
+# subset: (commands needed, parser)
+SUBSETS = {
+    'system': (('system_info',), parse_system),
+    'content': (('system_info',), parse_content),
+    'ha': (('ha_state',), parse_ha),
+    'interfaces': (('interfaces',), parse_interfaces),
+    'licenses': (('licenses',), parse_licenses),
+    'config': (('vsys_config', 'pending_changes'), parse_config),
+}
+
+
+def select_subsets(gather_subset):
+    """Subsets named in gather_subset, ValueError on unknown names."""
+    selected = set()
+    excluded = set()
+    for s in gather_subset:
+        target = excluded if s.startswith('!') else selected
+        s = s.lstrip('!')
+        if s == 'all':
+            target.update(SUBSETS)
+        elif s in SUBSETS:
+            target.add(s)
+        else:
+            raise ValueError('unknown subset %s, valid subsets are all, %s' %
+                             (s, ', '.join(sorted(SUBSETS))))
+    if not selected and excluded:
+        selected = set(SUBSETS)
+    return sorted(selected - excluded)
+
+
+def run_commands(module, ip_address, username, password, api_key, commands):
+    """
+    Issue commands concurrently, each on its own connection, and return
+    the response root of each one. The API key is generated once and
+    shared by the connections.
+    """
+    if api_key is None:
+        xapi = instrument(module, pan.xapi.PanXapi(
+            hostname=ip_address,
+            api_username=username,
+            api_password=password
+        ))
+        api_key = xapi.keygen()
+
+    roots = {}
+    errors = []
+    lock = threading.Lock()
+
+    def worker(name, xapi):
+        method, arg = _COMMANDS[name]
+        try:
+            if method == 'op':
+                xapi.op(cmd=arg)
+            else:
+                xapi.show(xpath=arg)
+            root = xapi.element_root
+        except Exception:
+            # reported with the others, never a missing command
+            with lock:
+                errors.append('%s: %s' % (name, get_exception()))
+            return
+        with lock:
+            roots[name] = root
+
+    # xapi objects are created here, the workers only use them
+    threads = [threading.Thread(target=worker, args=(name, instrument(
+        module, pan.xapi.PanXapi(hostname=ip_address, api_key=api_key))))
+        for name in commands]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if errors:
+        raise PanXapiError('; '.join(sorted(errors)))
+    return roots
+
+
+def main():
+    argument_spec = dict(
+        ip_address=dict(required=True),
+        password=dict(no_log=True),
+        username=dict(default='admin'),
+        api_key=dict(no_log=True),
+        gather_subset=dict(type='list', default=['all']),
+        cache_ttl=dict(type='int', default=0),
+        cache_file=dict(type='path')
+    )
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True,
+                           required_one_of=[['api_key', 'password']])
+    if not HAS_LIB:
+        module.fail_json(msg='pan-python is required for this module')
+
+    ip_address = module.params["ip_address"]
+
+    try:
+        subsets = select_subsets(module.params['gather_subset'])
+    except ValueError:
+        exc = get_exception()
+        module.fail_json(msg=str(exc))
+
+    cache = None
+    if module.params['cache_ttl'] > 0:
+        cache = TTLCache(module.params['cache_file'] or
+                         default_cache_path('facts'),
+                         module.params['cache_ttl'])
+
+    facts = {}
+    cached = []
+    todo = []
+    for s in subsets:
+        value = None
+        if cache is not None:
+            value = cache.get('%s/%s' % (ip_address, s))
+        if value is None:
+            todo.append(s)
+        else:
+            facts['panos_%s' % s] = value
+            cached.append(s)
+
+    if todo:
+        commands = sorted(set(c for s in todo for c in SUBSETS[s][0]))
+        try:
+            roots = run_commands(module, ip_address,
+                                 module.params['username'],
+                                 module.params['password'],
+                                 module.params['api_key'], commands)
+        except PanXapiError:
+            exc = get_exception()
+            module.fail_json(msg=str(exc))
+
+        for s in todo:
+            value = SUBSETS[s][1](roots)
+            facts['panos_%s' % s] = value
+            if cache is not None:
+                cache.set('%s/%s' % (ip_address, s), value)
+
+    if cache is not None:
+        cache.save()
+
+    module.exit_json(changed=False, ansible_facts=facts,
+                     gathered_subset=subsets, cached=cached)
+
+
+if __name__ == '__main__':
+    main()
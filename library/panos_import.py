@@ -78,12 +78,14 @@ ANSIBLE_METADATA = {'status': ['preview'],
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
 
 import os.path
 import xml.etree
 import tempfile
 import shutil
 import os
+import time
 
 try:
     import pan.xapi
@@ -111,6 +113,7 @@ def import_file(xapi, module, ip_address, file_, category):
         }
     )
 
+    start = time.time()
     r = requests.post(
         'https://'+ip_address+'/api/',
         verify=False,
@@ -118,6 +121,8 @@ def import_file(xapi, module, ip_address, file_, category):
         headers={'Content-Type': mef.content_type},
         data=mef
     )
+    xapi.metrics.record(ip_address, 'import', time.time()-start,
+                        mef.len, len(r.content))
 
     # if something goes wrong just raise an exception
     r.raise_for_status()
@@ -160,11 +165,11 @@ def main():
     password = module.params["password"]
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     file_ = module.params['file']
     url = module.params['url']
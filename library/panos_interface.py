@@ -17,9 +17,13 @@
 DOCUMENTATION = '''
 ---
 module: panos_interface
-short_description: configure data-port network interface for DHCP
+short_description: configure data-port layer3 network interfaces and subinterfaces
 description:
-    - Configure data-port (DP) network interface for DHCP. By default DP interfaces are static.
+    - Configure data-port (DP) layer3 network interfaces and VLAN subinterfaces, with DHCP or static addresses, and
+      their zone and default virtual router membership.
+    - The interfaces, virtual routers and zones of the device are read once and compared locally, everything missing
+      is then configured in a single request, so the number of API calls does not depend on the number of interfaces.
+      Interfaces that already exist as layer3 are not modified.
 author: "Luigi Mori (@jtschichold), Ivan Bojer (@ivanbojer)"
 version_added: "2.3"
 requirements:
@@ -41,21 +45,46 @@ options:
         required: true
     if_name:
         description:
-            - Name of the interface to configure.
-        required: true
+            - Name of the interface to configure. Required unless I(interfaces) is set.
+        required: false
     zone_name:
-        description: >
-            Name of the zone for the interface. If the zone does not exist it is created but if the zone exists and
-            it is not of the layer3 type the operation will fail.
-        required: true
+        description:
+            - Name of the zone for the interface. If the zone does not exist it is created but if the zone exists and
+              it is not of the layer3 type the operation will fail. Required unless I(interfaces) is set.
+        required: false
     create_default_route:
         description:
             - Whether or not to add default route with router learned via DHCP.
         default: "false"
+    ip:
+        description:
+            - List of static addresses of the interface, e.g. 10.0.0.1/24. Without it the interface uses DHCP.
+        required: false
+    tag:
+        description:
+            - VLAN tag of a subinterface (if_name like ethernet1/1.10). Defaults to the unit number of the
+              subinterface.
+        required: false
+    vsys:
+        description:
+            - vsys of the zones.
+        default: "vsys1"
+    interfaces:
+        description:
+            - List of interfaces to configure, each a dict with if_name, zone_name and optionally ip, tag and
+              create_default_route, with the same meaning as the options of the same name. All the missing interfaces
+              and memberships are configured in a single request followed by a single commit.
+        required: false
     commit:
         description:
             - Commit if changed
         default: true
+    partial_commit:
+        description:
+            - commit only the changes made by I(username), leaving out the policy and objects configuration
+              (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
@@ -66,10 +95,43 @@ EXAMPLES = '''
     if_name: "ethernet1/1"
     zone_name: "public"
     create_default_route: "yes"
+
+- name: enable DHCP client on several interfaces with one request and one commit
+  panos_interface:
+    password: "admin"
+    ip_address: "192.168.1.1"
+    interfaces:
+      - if_name: "ethernet1/1"
+        zone_name: "public"
+        create_default_route: "yes"
+      - if_name: "ethernet1/2"
+        zone_name: "private"
+      - if_name: "ethernet1/3"
+        zone_name: "private"
+
+- name: static addresses and VLAN subinterfaces
+  panos_interface:
+    password: "admin"
+    ip_address: "192.168.1.1"
+    interfaces:
+      - if_name: "ethernet1/4"
+        zone_name: "dmz"
+        ip: ["172.16.0.1/24"]
+      - if_name: "ethernet1/5.100"
+        zone_name: "users"
+        ip: ["10.100.0.1/24"]
+      - if_name: "ethernet1/5.200"
+        zone_name: "voice"
+        tag: 200
+        ip: ["10.200.0.1/24"]
 '''
 
 RETURN='''
-# Default return values
+configured:
+    description: names of the interfaces configured or added to their zone or virtual router
+    returned: success
+    type: list
+    sample: ["ethernet1/2", "ethernet1/3"]
 '''
 
 ANSIBLE_METADATA = {'status': ['preview'],
@@ -78,6 +140,11 @@ ANSIBLE_METADATA = {'status': ['preview'],
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    partial_scope, DEVICE_AND_NETWORK
+from ansible.module_utils.panos_xml import LAYER3, XmlTemplate, entry, \
+    members
 
 
 try:
@@ -87,46 +154,222 @@ try:
 except ImportError:
     HAS_LIB = False
 
-_IF_XPATH = "/config/devices/entry[@name='localhost.localdomain']" +\
-            "/network/interface/ethernet/entry[@name='%s']"
+_DEVICE_XPATH = "/config/devices/entry[@name='localhost.localdomain']"
+_IF_XPATH = _DEVICE_XPATH + "/network/interface/ethernet"
+_VR_XPATH = _DEVICE_XPATH + "/network/virtual-router"
+_ZONE_XPATH = _DEVICE_XPATH + "/vsys/entry[@name='%s']/zone"
+
+# children of a zone <network> holding its type and member interfaces, the
+# others (zone-protection-profile, log-setting...) are settings
+_ZONE_TYPES = ('layer3', 'layer2', 'virtual-wire', 'tap', 'tunnel', 'external')
+
+_DEFAULT_VR = 'default'
+_NETWORK = XmlTemplate(
+    '[<interface><ethernet>{interfaces!raw}</ethernet></interface>]'
+    '[<virtual-router>{vr!raw}</virtual-router>]'
+)
+_BATCH = XmlTemplate(
+    '[<network>{network!raw}</network>]'
+    '[<vsys><entry name="{vsys}"><zone>{zones!raw}</zone></entry></vsys>]'
+)
 
-_ZONE_XPATH = "/config/devices/entry[@name='localhost.localdomain']" +\
-              "/vsys/entry/zone/entry"
-_ZONE_XPATH_QUERY = _ZONE_XPATH+"[network/layer3/member/text()='%s']"
-_ZONE_XPATH_IF = _ZONE_XPATH+"[@name='%s']/network/layer3/member[text()='%s']"
-_VR_XPATH = "/config/devices/entry[@name='localhost.localdomain']" +\
-            "/network/virtual-router/entry"
 
+class InterfaceState(object):
+    """
+    Interfaces, virtual routers and zones of the device, fetched with one
+    get per tree, so that any number of interfaces can be checked
+    without further API calls.
+    """
+    def __init__(self, xapi, vsys):
+        self.layer3 = {}
+        self.other = set()
+        xapi.get(xpath=_IF_XPATH)
+        for e in xapi.element_root.findall('.//ethernet/entry'):
+            layer3 = e.find('layer3')
+            if layer3 is None:
+                if len(e):
+                    # layer2, virtual-wire, tap, ... or an aggregate member
+                    self.other.add(e.get('name'))
+                continue
+            self.layer3[e.get('name')] = layer3
+            for u in layer3.findall('units/entry'):
+                self.layer3[u.get('name')] = u
 
-def add_dhcp_if(xapi, if_name, zone_name, create_default_route):
-    if_xml = [
-        '<entry name="%s">',
-        '<layer3>',
-        '<dhcp-client>',
-        '<create-default-route>%s</create-default-route>',
-        '</dhcp-client>'
-        '</layer3>'
-        '</entry>'
-    ]
-    cdr = 'yes'
-    if not create_default_route:
-        cdr = 'no'
-    if_xml = (''.join(if_xml)) % (if_name, cdr)
-    xapi.edit(xpath=_IF_XPATH % if_name, element=if_xml)
+        self.vr_of = {}
+        xapi.get(xpath=_VR_XPATH)
+        for vr in xapi.element_root.findall('.//virtual-router/entry'):
+            for m in vr.findall('interface/member'):
+                self.vr_of[m.text] = vr.get('name')
 
-    xapi.set(xpath=_ZONE_XPATH+"[@name='%s']/network/layer3" % zone_name,
-             element='<member>%s</member>' % if_name)
-    xapi.set(xpath=_VR_XPATH+"[@name='default']/interface",
-             element='<member>%s</member>' % if_name)
+        self.zone_of = {}
+        self.zone_type = {}
+        xapi.get(xpath=_ZONE_XPATH % vsys)
+        for z in xapi.element_root.findall('.//zone/entry'):
+            network = z.find('network')
+            if network is None:
+                continue
+            ztypes = [t for t in _ZONE_TYPES if network.find(t) is not None]
+            if not ztypes:
+                continue
+            ztype = ztypes[0]
+            self.zone_type[z.get('name')] = ztype
+            for m in network.findall('%s/member' % ztype):
+                self.zone_of[m.text] = z.get('name')
 
-    return True
+    def is_layer3(self, if_name):
+        return if_name in self.layer3
 
 
-def if_exists(xapi, if_name):
-    xpath = _IF_XPATH % if_name
-    xapi.get(xpath=xpath)
-    network = xapi.element_root.find('.//layer3')
-    return (network is not None)
+def parse_interface(module, spec, idx=None):
+    """Validate one interface of the plan, return it normalized."""
+    where = 'interfaces[%d]: ' % idx if idx is not None else ''
+    if not isinstance(spec, dict) or not spec.get('if_name') or \
+            not spec.get('zone_name'):
+        module.fail_json(msg=where + "if_name and zone_name are required")
+
+    if_name = spec['if_name']
+    ip = spec.get('ip') or []
+    if not isinstance(ip, list):
+        ip = [ip]
+
+    parent, unit = if_name, None
+    tag = spec.get('tag')
+    if '.' in if_name:
+        parent, unit = if_name.split('.', 1)
+        if tag is None:
+            tag = unit
+        try:
+            tag = int(tag)
+        except (TypeError, ValueError):
+            module.fail_json(msg=where + "%s: tag must be a VLAN id" % if_name)
+        if not 1 <= tag <= 4094:
+            module.fail_json(msg=where + "%s: tag %d out of range" %
+                             (if_name, tag))
+    elif tag is not None:
+        module.fail_json(msg=where + "%s: tag is only valid on subinterfaces"
+                         % if_name)
+
+    create_default_route = spec.get('create_default_route', False)
+    if ip:
+        if create_default_route:
+            module.fail_json(msg=where + "%s: create_default_route needs "
+                                         "DHCP, not a static ip" % if_name)
+        create_default_route = None
+    else:
+        create_default_route = module.boolean(create_default_route)
+
+    return dict(
+        if_name=if_name,
+        parent=parent,
+        unit=unit,
+        zone_name=spec['zone_name'],
+        tag=tag,
+        ip=''.join([entry(a) for a in ip]) or None,
+        create_default_route=create_default_route
+    )
+
+
+def plan_changes(state, interfaces):
+    """
+    Compare the wanted interfaces with the device state. Returns the
+    interfaces to configure, the (interface, zone) pairs and the interfaces
+    to add to the default virtual router, or raises ValueError when an
+    interface cannot be put in place without touching other configuration.
+    """
+    configure, zone_members, vr_members = [], [], []
+    for i in interfaces:
+        if_name = i['if_name']
+        if i['unit'] is None and if_name in state.other:
+            raise ValueError("%s is not a layer3 interface" % if_name)
+        if i['unit'] is not None and i['parent'] in state.other:
+            raise ValueError("%s: parent interface %s is not layer3" %
+                             (if_name, i['parent']))
+        if not state.is_layer3(if_name):
+            configure.append(i)
+
+        zone = state.zone_of.get(if_name)
+        ztype = state.zone_type.get(i['zone_name'], 'layer3')
+        if ztype != 'layer3':
+            raise ValueError("zone %s is of type %s, not layer3" %
+                             (i['zone_name'], ztype))
+        if zone is None:
+            zone_members.append((if_name, i['zone_name']))
+        elif zone != i['zone_name']:
+            raise ValueError("%s is already in zone %s" % (if_name, zone))
+
+        vr = state.vr_of.get(if_name)
+        if vr is None:
+            vr_members.append(if_name)
+        elif vr != _DEFAULT_VR:
+            raise ValueError("%s is already in virtual router %s" %
+                             (if_name, vr))
+
+    return configure, zone_members, vr_members
+
+
+def _grouped(pairs):
+    """[(value, key), ...] as [(key, [values]), ...] in first seen order."""
+    groups = {}
+    order = []
+    for value, key in pairs:
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(value)
+    return [(k, groups[k]) for k in order]
+
+
+def batch_element(vsys, configure, zone_members, vr_members):
+    """
+    The element merging every change at once on the device node:
+    interfaces (subinterfaces grouped under their parent), zone membership
+    grouped per zone and default virtual router membership.
+    """
+    parents = []
+    for i in configure:
+        parents.append((i, i['parent']))
+
+    interfaces = []
+    for parent, items in _grouped(parents):
+        own = ''.join([LAYER3.render(i) for i in items if i['unit'] is None])
+        units = ''.join([entry(i['if_name'], LAYER3.render(i))
+                         for i in items if i['unit'] is not None])
+        if units:
+            own += '<units>%s</units>' % units
+        interfaces.append(entry(parent, '<layer3>%s</layer3>' % own))
+
+    zones = ''.join([entry(z, '<network><layer3>%s</layer3></network>' %
+                           members(ifs))
+                     for z, ifs in _grouped(zone_members)])
+
+    vr = None
+    if vr_members:
+        vr = entry(_DEFAULT_VR, '<interface>%s</interface>' %
+                   members(vr_members))
+
+    network = _NETWORK.render(interfaces=''.join(interfaces), vr=vr)
+    return _BATCH.render(network=network, vsys=vsys, zones=zones)
+
+
+def configure_interfaces(xapi, vsys, interfaces):
+    """
+    Put the interfaces in place: three gets to read the state, then a
+    single set when anything is missing. Returns the names of the
+    interfaces changed.
+    """
+    state = InterfaceState(xapi, vsys)
+    configure, zone_members, vr_members = plan_changes(state, interfaces)
+
+    changed = set([i['if_name'] for i in configure])
+    changed.update([i for i, _ in zone_members])
+    changed.update(vr_members)
+    if not changed:
+        return []
+
+    xapi.set(xpath=_DEVICE_XPATH,
+             element=batch_element(vsys, configure, zone_members, vr_members))
+
+    return [i['if_name'] for i in interfaces if i['if_name'] in changed]
 
 
 def main():
@@ -134,12 +377,18 @@ def main():
         ip_address=dict(required=True),
         password=dict(required=True, no_log=True),
         username=dict(default='admin'),
-        if_name=dict(required=True),
-        zone_name=dict(required=True),
+        if_name=dict(),
+        zone_name=dict(),
+        interfaces=dict(type='list'),
+        ip=dict(type='list'),
+        tag=dict(type='int'),
+        vsys=dict(default='vsys1'),
         create_default_route=dict(type='bool', default=False),
-        commit=dict(type='bool', default=True)
+        commit=dict(type='bool', default=True),
+        partial_commit=dict(type='bool', default=False)
     )
-    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False,
+                           mutually_exclusive=[['if_name', 'interfaces']])
     if not HAS_LIB:
         module.fail_json(msg='pan-python is required for this module')
 
@@ -147,32 +396,52 @@ def main():
     password = module.params["password"]
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
-    if_name = module.params['if_name']
-    zone_name = module.params['zone_name']
-    create_default_route = module.params['create_default_route']
+    vsys = module.params['vsys']
     commit = module.params['commit']
 
-    ifexists = if_exists(xapi, if_name)
+    if module.params['interfaces']:
+        interfaces = [parse_interface(module, i, idx) for idx, i in
+                      enumerate(module.params['interfaces'])]
+    else:
+        if not module.params['if_name'] or not module.params['zone_name']:
+            module.fail_json(msg="if_name and zone_name are required without "
+                                 "interfaces")
+        interfaces = [parse_interface(module, dict(
+            if_name=module.params['if_name'],
+            zone_name=module.params['zone_name'],
+            ip=module.params['ip'],
+            tag=module.params['tag'],
+            create_default_route=module.params['create_default_route']
+        ))]
 
-    if ifexists:
-        module.exit_json(changed=False, msg="interface exists, not changed")
+    names = [i['if_name'] for i in interfaces]
+    dups = set([n for n in names if names.count(n) > 1])
+    if dups:
+        module.fail_json(msg="interfaces listed more than once: %s" %
+                         ', '.join(sorted(dups)))
 
     try:
-        changed = add_dhcp_if(xapi, if_name, zone_name, create_default_route)
+        configured = configure_interfaces(xapi, vsys, interfaces)
+        if configured and commit:
+            commit_candidate(xapi, **partial_scope(module, DEVICE_AND_NETWORK))
+    except ValueError:
+        exc = get_exception()
+        module.fail_json(msg=str(exc))
     except PanXapiError:
         exc = get_exception()
         module.fail_json(msg=exc.message)
 
-    if changed and commit:
-        xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+    if not configured:
+        module.exit_json(changed=False, configured=[],
+                         msg="interfaces exist, not changed")
 
-    module.exit_json(changed=changed, msg="okey dokey")
+    module.exit_json(changed=True, configured=configured, msg="okey dokey")
 
 if __name__ == '__main__':
     main()
@@ -80,6 +80,7 @@ ANSIBLE_METADATA = {'status': ['preview'],
                     'version': '1.0'}
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.panos_metrics import instrument
 
 try:
     import pan.xapi
@@ -151,11 +152,11 @@ def main():
     force = module.params['force']
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     if not force:
         serialnumber = get_serial(xapi, module)
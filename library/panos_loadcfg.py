@@ -75,6 +75,7 @@ ANSIBLE_METADATA = {'status': ['preview'],
                     'version': '1.0'}
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.panos_metrics import instrument
 
 try:
     import pan.xapi
@@ -111,11 +112,11 @@ def main():
     file_ = module.params['file']
     commit = module.params['commit']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     changed = load_cfgfile(xapi, module, ip_address, file_)
     if changed and commit:
@@ -63,6 +63,12 @@ options:
             - commit if changed
         required: false
         default: true
+    partial_commit:
+        description:
+            - commit only the changes made by I(username), leaving out the policy and objects configuration
+              (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
@@ -86,6 +92,9 @@ ANSIBLE_METADATA = {'status': ['preview'],
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    partial_scope, DEVICE_AND_NETWORK
 
 try:
     import pan.xapi
@@ -156,7 +165,8 @@ def main():
         dns_server_secondary=dict(),
         panorama_primary=dict(),
         panorama_secondary=dict(),
-        commit=dict(type='bool', default=True)
+        commit=dict(type='bool', default=True),
+        partial_commit=dict(type='bool', default=False)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
     if not HAS_LIB:
@@ -171,11 +181,11 @@ def main():
     panorama_secondary = module.params['panorama_secondary']
     commit = module.params['commit']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     changed = False
     try:
@@ -189,7 +199,7 @@ def main():
             changed |= set_panorama_server(xapi, panorama_secondary, primary=False)
 
         if changed and commit:
-            xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+            commit_candidate(xapi, **partial_scope(module, DEVICE_AND_NETWORK))
     except PanXapiError:
         exc = get_exception()
         module.fail_json(msg=exc.message)
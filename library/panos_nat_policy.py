@@ -110,6 +110,12 @@ options:
             - commit if changed
         required: false
         default: true
+    partial_commit:
+        description:
+            - commit only the changes made by I(username), leaving out the device and network configuration
+              (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
@@ -141,6 +147,11 @@ ANSIBLE_METADATA = {'status': ['preview'],
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    partial_scope, POLICY_AND_OBJECTS
+from ansible.module_utils.panos_xml import XmlTemplateError, DNAT, \
+    SNAT_STATIC_IP, SNAT_DIPP_INTERFACE, SNAT_DIPP_ADDRESS, NAT_RULE
 
 try:
     import pan.xapi
@@ -167,16 +178,7 @@ def dnat_xml(m, dnat_address, dnat_port):
     if dnat_address is None and dnat_port is None:
         return None
 
-    exml = ["<destination-translation>"]
-    if dnat_address is not None:
-        exml.append("<translated-address>%s</translated-address>" %
-                    dnat_address)
-    if dnat_port is not None:
-        exml.append("<translated-port>%s</translated-port>" %
-                    dnat_port)
-    exml.append('</destination-translation>')
-
-    return ''.join(exml)
+    return DNAT.render(dnat_address=dnat_address, dnat_port=dnat_port)
 
 
 def snat_xml(m, snat_type, snat_address, snat_interface,
@@ -186,68 +188,31 @@ def snat_xml(m, snat_type, snat_address, snat_interface,
             m.fail_json(msg="snat_address should be speicified "
                             "for snat_type static-ip")
 
-        exml = ["<source-translation>", "<static-ip>"]
-        if snat_bidirectional:
-            exml.append('<bi-directional>%s</bi-directional>' % 'yes')
-        else:
-            exml.append('<bi-directional>%s</bi-directional>' % 'no')
-        exml.append('<translated-address>%s</translated-address>' %
-                    snat_address)
-        exml.append('</static-ip>')
-        exml.append('</source-translation>')
+        return SNAT_STATIC_IP.render(snat_address=snat_address,
+                                     snat_bidirectional=snat_bidirectional)
     elif snat_type == 'dynamic-ip-and-port':
-        exml = ["<source-translation>",
-                "<dynamic-ip-and-port>"]
         if snat_interface is not None:
-            exml = exml + [
-                "<interface-address>",
-                "<interface>%s</interface>" % snat_interface]
-            if snat_interface_address is not None:
-                exml.append("<ip>%s</ip>" % snat_interface_address)
-            exml.append("</interface-address>")
+            return SNAT_DIPP_INTERFACE.render(
+                snat_interface=snat_interface,
+                snat_interface_address=snat_interface_address)
         elif snat_address is not None:
-            exml.append("<translated-address>")
-            for t in snat_address:
-                exml.append("<member>%s</member>" % t)
-            exml.append("</translated-address>")
+            return SNAT_DIPP_ADDRESS.render(snat_address=snat_address)
         else:
             m.fail_json(msg="no snat_interface or snat_address "
                             "specified for snat_type dynamic-ip-and-port")
-        exml.append('</dynamic-ip-and-port>')
-        exml.append('</source-translation>')
     else:
         m.fail_json(msg="unknown snat_type %s" % snat_type)
 
-    return ''.join(exml)
-
 
 def add_nat(xapi, module, rule_name, from_zone, to_zone,
             source, destination, service, dnatxml=None, snatxml=None):
-    exml = []
-    if dnatxml:
-        exml.append(dnatxml)
-    if snatxml:
-        exml.append(snatxml)
-
-    exml.append("<to><member>%s</member></to>" % to_zone)
-
-    exml.append("<from>")
-    exml = exml + ["<member>%s</member>" % e for e in from_zone]
-    exml.append("</from>")
-
-    exml.append("<source>")
-    exml = exml + ["<member>%s</member>" % e for e in source]
-    exml.append("</source>")
-
-    exml.append("<destination>")
-    exml = exml + ["<member>%s</member>" % e for e in destination]
-    exml.append("</destination>")
-
-    exml.append("<service>%s</service>" % service)
-
-    exml.append("<nat-type>ipv4</nat-type>")
-
-    exml = ''.join(exml)
+    exml = NAT_RULE.render(dnatxml=dnatxml,
+                           snatxml=snatxml,
+                           to_zone=to_zone,
+                           from_zone=from_zone,
+                           source=source,
+                           destination=destination,
+                           service=service)
 
     xapi.set(xpath=_NAT_XPATH % rule_name, element=exml)
 
@@ -273,7 +238,8 @@ def main():
         dnat_address=dict(),
         dnat_port=dict(),
         override=dict(type='bool', default=False),
-        commit=dict(type='bool', default=True)
+        commit=dict(type='bool', default=True),
+        partial_commit=dict(type='bool', default=False)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
     if not HAS_LIB:
@@ -283,11 +249,11 @@ def main():
     password = module.params["password"]
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     rule_name = module.params['rule_name']
     from_zone = module.params['from_zone']
@@ -327,13 +293,16 @@ def main():
         )
 
         if changed and commit:
-            xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+            commit_candidate(xapi, **partial_scope(module, POLICY_AND_OBJECTS))
 
         module.exit_json(changed=changed, msg="okey dokey")
 
     except PanXapiError:
         exc = get_exception()
         module.fail_json(msg=exc.message)
+    except XmlTemplateError:
+        exc = get_exception()
+        module.fail_json(msg=str(exc))
 
 
 if __name__ == '__main__':
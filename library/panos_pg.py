@@ -82,6 +82,12 @@ options:
             - commit if changed
         required: false
         default: true
+    partial_commit:
+        description:
+            - commit only the changes made by I(username), leaving out the device and network configuration
+              (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
@@ -106,6 +112,10 @@ ANSIBLE_METADATA = {'status': ['preview'],
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    partial_scope, POLICY_AND_OBJECTS
+from ansible.module_utils.panos_xml import XmlTemplateError, PROFILE_GROUP
 
 
 try:
@@ -133,31 +143,13 @@ def add_pg(xapi, pg_name, data_filtering, file_blocking, spyware,
     if pg_exists(xapi, pg_name):
         return False
 
-    exml = []
-
-    if data_filtering is not None:
-        exml.append('<data-filtering><member>%s</member></data-filtering>' %
-                    data_filtering)
-    if file_blocking is not None:
-        exml.append('<file-blocking><member>%s</member></file-blocking>' %
-                    file_blocking)
-    if spyware is not None:
-        exml.append('<spyware><member>%s</member></spyware>' %
-                    spyware)
-    if url_filtering is not None:
-        exml.append('<url-filtering><member>%s</member></url-filtering>' %
-                    url_filtering)
-    if virus is not None:
-        exml.append('<virus><member>%s</member></virus>' %
-                    virus)
-    if vulnerability is not None:
-        exml.append('<vulnerability><member>%s</member></vulnerability>' %
-                    vulnerability)
-    if wildfire is not None:
-        exml.append('<wildfire-analysis><member>%s</member></wildfire-analysis>' %
-                    wildfire)
-
-    exml = ''.join(exml)
+    exml = PROFILE_GROUP.render(data_filtering=data_filtering,
+                                file_blocking=file_blocking,
+                                spyware=spyware,
+                                url_filtering=url_filtering,
+                                virus=virus,
+                                vulnerability=vulnerability,
+                                wildfire=wildfire)
     xapi.set(xpath=_PG_XPATH % pg_name, element=exml)
 
     return True
@@ -176,7 +168,8 @@ def main():
         virus=dict(),
         vulnerability=dict(),
         wildfire=dict(),
-        commit=dict(type='bool', default=True)
+        commit=dict(type='bool', default=True),
+        partial_commit=dict(type='bool', default=False)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
     if not HAS_LIB:
@@ -186,11 +179,11 @@ def main():
     password = module.params["password"]
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     pg_name = module.params['pg_name']
     data_filtering = module.params['data_filtering']
@@ -207,10 +200,13 @@ def main():
                          spyware, url_filtering, virus, vulnerability, wildfire)
 
         if changed and commit:
-            xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+            commit_candidate(xapi, **partial_scope(module, POLICY_AND_OBJECTS))
     except PanXapiError:
         exc = get_exception()
         module.fail_json(msg=exc.message)
+    except XmlTemplateError:
+        exc = get_exception()
+        module.fail_json(msg=str(exc))
 
     module.exit_json(changed=changed, msg="okey dokey")
 
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+DOCUMENTATION = '''
+---
+module: panos_rulematch
+short_description: find the security rule matching flows in a configuration file
+description:
+    - Look up, for each flow, the first security rule of a vsys that would match it, the way the firewall evaluates
+      the rulebase, without contacting any device. The configuration is typically a running config exported with
+      panos_import or downloaded from the device.
+    - The rulebase and its address, service and application objects are indexed once, each query then costs a few
+      lookups whatever the size of the rulebase, so thousands of flows can be checked in one task.
+author: "Luigi Mori (@jtschichold), Ivan Bojer (@ivanbojer)"
+version_added: "2.3"
+notes:
+    - Runs locally, use it with connection local.
+    - Disabled rules never match. Rules set to application-default match any port.
+    - FQDN addresses, dynamic address groups and other objects that cannot be resolved offline never match an address,
+      the rules using them are listed in unresolved.
+    - Checkmode is supported.
+options:
+    config_file:
+        description:
+            - configuration file to read the rulebase from
+        required: true
+    vsys:
+        description:
+            - vsys whose rulebase is searched, shared objects are resolved as well
+        required: false
+        default: "vsys1"
+    flows:
+        description:
+            - list of flows, each a dict with any of from_zone, to_zone, source, destination, source_user,
+              category, application, protocol (tcp, udp, sctp or their number, default tcp) and port.
+              Fields left out are not checked.
+        required: false
+        default: []
+    all_matches:
+        description:
+            - also return every rule matching each flow, not only the first one
+        required: false
+        default: false
+    find_shadowed:
+        description:
+            - also report the rules that can never be hit because an earlier rule matches every flow they match.
+              Rules using objects that cannot be resolved offline are not reported.
+        required: false
+        default: false
+'''
+
+EXAMPLES = '''
+# Check what a change request would hit before opening it
+  - name: match flows
+    panos_rulematch:
+      config_file: "/tmp/running-config.xml"
+      flows:
+        - from_zone: "untrust"
+          to_zone: "dmz"
+          source: "203.0.113.7"
+          destination: "10.0.1.101"
+          application: "ssl"
+          port: 443
+        - from_zone: "trust"
+          to_zone: "untrust"
+          destination: "8.8.8.8"
+          application: "dns"
+          protocol: "udp"
+          port: 53
+    register: result
+  - debug: msg="{{result.matches[0].rule_name}} {{result.matches[0].action}}"
+
+# Clean up a rulebase
+  - name: find shadowed rules
+    panos_rulematch:
+      config_file: "/tmp/running-config.xml"
+      find_shadowed: true
+'''
+
+RETURN = '''
+matches:
+    description: first matching rule of each flow, in the order of flows, rule_name and action are null when no rule
+                 matches. With all_matches, rules lists the name of every matching rule.
+    returned: success
+    type: list
+    sample: [{"rule_name": "web", "action": "allow", "rules": ["web", "default-allow"]}]
+shadowed:
+    description: rules that can never be hit, with the first rule matching all of their flows and whether both have
+                 the same action, in which case the shadowed rule is redundant and can be removed
+    returned: when find_shadowed is true
+    type: list
+    sample: [{"rule_name": "web-2", "shadowed_by": "web", "redundant": true}]
+unresolved:
+    description: names that could not be resolved offline, per rule
+    returned: success
+    type: dict
+    sample: {"web": ["web-fqdn"]}
+'''
+
+ANSIBLE_METADATA = {'status': ['preview'],
+                    'supported_by': 'community',
+                    'version': '1.0'}
+
+import xml.etree.ElementTree as ET
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_rulematch import RuleMatcher
+
+_FLOW_FIELDS = ('from_zone', 'to_zone', 'source', 'destination',
+                'source_user', 'category', 'application', 'protocol', 'port')
+
+
+def parse_flows(module, flows):
+    result = []
+    for idx, flow in enumerate(flows):
+        where = 'flows[%d]' % idx
+        if not isinstance(flow, dict):
+            module.fail_json(msg='%s: expected a dict, got %r' % (where, flow))
+        unknown = set(flow) - set(_FLOW_FIELDS)
+        if unknown:
+            module.fail_json(msg='%s: unsupported fields %s' %
+                                 (where, ', '.join(sorted(unknown))))
+        f = dict((k, v) for k, v in flow.items() if v is not None)
+        if 'port' in f:
+            try:
+                f['port'] = int(f['port'])
+            except ValueError:
+                module.fail_json(msg='%s: invalid port %s' % (where, f['port']))
+        result.append(f)
+    return result
+
+
+def match_flows(module, matcher, flows, all_matches):
+    matches = []
+    for idx, flow in enumerate(flows):
+        try:
+            if all_matches:
+                rules = matcher.match_all(flow)
+                rule = rules[0] if rules else None
+            else:
+                rule = matcher.match(flow)
+        except ValueError:
+            exc = get_exception()
+            module.fail_json(msg='flows[%d]: %s' % (idx, exc))
+
+        m = dict(
+            rule_name=rule['rule_name'] if rule else None,
+            action=rule['action'] if rule else None
+        )
+        if all_matches:
+            m['rules'] = [r['rule_name'] for r in rules]
+        matches.append(m)
+    return matches
+
+
+def main():
+    argument_spec = dict(
+        config_file=dict(required=True, type='path'),
+        vsys=dict(default='vsys1'),
+        flows=dict(type='list', default=[]),
+        all_matches=dict(type='bool', default=False),
+        find_shadowed=dict(type='bool', default=False)
+    )
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    config_file = module.params['config_file']
+    vsys = module.params['vsys']
+
+    flows = parse_flows(module, module.params['flows'])
+
+    try:
+        root = ET.parse(config_file).getroot()
+    except (IOError, OSError, ET.ParseError):
+        exc = get_exception()
+        module.fail_json(msg='cannot read %s: %s' % (config_file, exc))
+
+    try:
+        matcher = RuleMatcher.from_config(root, vsys)
+    except ValueError:
+        exc = get_exception()
+        module.fail_json(msg='%s: %s' % (config_file, exc))
+
+    matches = match_flows(module, matcher, flows,
+                          module.params['all_matches'])
+
+    result = dict(matches=matches, unresolved=matcher.unresolved)
+    if module.params['find_shadowed']:
+        result['shadowed'] = matcher.shadowed()
+
+    module.exit_json(changed=False, msg="okey dokey", **result)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,10 +22,10 @@ DOCUMENTATION = '''
 ---
 module: panos_security_policy
 short_description: create security rule policy
-description: >
-    Security policies allow you to enforce rules and take action, and can be as general or specific as needed.
-    The policy rules are compared against the incoming traffic in sequence, and because the first rule that matches
-    the traffic is applied, the more specific rules must precede the more general ones.
+description:
+    - Security policies allow you to enforce rules and take action, and can be as general or specific as needed.
+      The policy rules are compared against the incoming traffic in sequence, and because the first rule that
+      matches the traffic is applied, the more specific rules must precede the more general ones.
 author: "Ivan Bojer (@ivanbojer)"
 version_added: "2.3"
 requirements:
@@ -90,11 +90,16 @@ options:
             - Use users to enforce policy for individual users or a group of users.
         required: false
         default: "any"
+    category:
+        description:
+            - URL categories the rule applies to.
+        required: false
+        default: "any"
     hip_profiles:
-        description: >
-            If you are using GlobalProtect with host information profile (HIP) enabled, you can also base the policy
-            on information collected by GlobalProtect. For example, the user access level can be determined HIP that
-            notifies the firewall about the user's local configuration.
+        description:
+            - If you are using GlobalProtect with host information profile (HIP) enabled, you can also base the policy
+              on information collected by GlobalProtect. For example, the user access level can be determined HIP that
+              notifies the firewall about the user's local configuration.
         required: false
         default: "any"
     destination:
@@ -128,9 +133,9 @@ options:
         required: false
         default: "allow"
     group_profile:
-        description: >
-            Security profile group that is already defined in the system. This property supersedes antivirus,
-            vulnerability, spyware, url_filtering, file_blocking, data_filtering, and wildfire_analysis properties.
+        description:
+            - Security profile group that is already defined in the system. This property supersedes antivirus,
+              vulnerability, spyware, url_filtering, file_blocking, data_filtering, and wildfire_analysis properties.
         required: false
         default: None
     antivirus:
@@ -169,9 +174,9 @@ options:
         required: false
         default: None
     devicegroup:
-        description: >
-            Device groups are used for the Panorama interaction with Firewall(s). The group must exists on Panorama.
-            If device group is not define we assume that we are contacting Firewall.
+        description:
+            - Device groups are used for the Panorama interaction with Firewall(s). The group must exists on Panorama.
+              If device group is not define we assume that we are contacting Firewall.
         required: false
         default: None
     commit:
@@ -179,6 +184,23 @@ options:
             - Commit if changed
         required: false
         default: true
+    partial_commit:
+        description:
+            - commit only the changes made by I(username), leaving out the device and network configuration
+              (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: false
+    shadow_check:
+        description:
+            - check, before adding the rule, whether an existing rule already matches every flow the new rule
+              matches, in which case the new rule would never be hit. With warn the rule is added and a warning
+              returned, also when the check itself fails, with fail the task fails without adding it.
+            - Address, service and application objects and groups are resolved. Rules using FQDN addresses or
+              dynamic address groups are not checked, a rule set to application-default is only shadowed by rules
+              set to application-default or any service.
+        required: false
+        default: "warn"
+        choices: ["warn", "fail", "ignore"]
 '''
 
 EXAMPLES = '''
@@ -270,11 +292,20 @@ EXAMPLES = '''
 '''
 
 RETURN = '''
-# Default return values
+shadowed_by:
+    description: name of the existing rule shadowing the new one, null when there is none
+    returned: success
+    type: string
+    sample: "Allow outbound"
 '''
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    partial_scope, POLICY_AND_OBJECTS
+from ansible.module_utils.panos_rulematch import ObjectStore, RuleMatcher, \
+    OBJECT_CONTAINERS, rule_from_pandevice
 
 try:
     import pan.xapi
@@ -290,7 +321,7 @@ except ImportError:
     HAS_LIB = False
 
 
-def security_rule_exists(device, rule_name):
+def get_rulebase(device):
     if isinstance(device, pandevice.firewall.Firewall):
         rule_base = pandevice.policies.Rulebase.refreshall(device)
     elif isinstance(device, pandevice.panorama.Panorama):
@@ -298,7 +329,12 @@ def security_rule_exists(device, rule_name):
         rule_base = pandevice.policies.PreRulebase.refreshall(device)
 
     if rule_base:
-        rule_base = rule_base[0]
+        return rule_base[0]
+    return None
+
+
+def security_rule_exists(rule_base, rule_name):
+    if rule_base:
         security_rules = rule_base.findall(pandevice.policies.SecurityRule)
 
         if security_rules:
@@ -352,16 +388,47 @@ def create_security_rule(**kwargs):
     return security_rule
 
 
-def add_security_rule(device, sec_rule):
+def fetch_objects(device):
+    """
+    ObjectStore with the shared objects and, on a firewall, those of its
+    vsys: one get per object container.
+    """
+    scopes = ['/config/shared']
     if isinstance(device, pandevice.firewall.Firewall):
-        rule_base = pandevice.policies.Rulebase.refreshall(device)
-    elif isinstance(device, pandevice.panorama.Panorama):
-        # look for only pre-rulebase ATM
-        rule_base = pandevice.policies.PreRulebase.refreshall(device)
+        scopes.append("/config/devices/entry[@name='localhost.localdomain']"
+                      "/vsys/entry[@name='%s']" % (device.vsys or 'vsys1'))
 
-    if rule_base:
-        rule_base = rule_base[0]
+    store = ObjectStore()
+    for scope in scopes:
+        for container in OBJECT_CONTAINERS:
+            device.xapi.get(xpath='%s/%s' % (scope, container))
+            result = device.xapi.element_root.find('result')
+            if result is not None:
+                store.load(result)
+    return store
 
+
+def find_shadowing_rule(device, rule_base, sec_rule):
+    """
+    Name of the first rule of rule_base matching every flow sec_rule
+    matches, None if sec_rule would be hit once appended.
+    """
+    if not rule_base:
+        return None
+    rules = [rule_from_pandevice(r)
+             for r in rule_base.findall(pandevice.policies.SecurityRule)]
+    if not rules:
+        return None
+
+    matcher = RuleMatcher(rules, fetch_objects(device))
+    shadow = matcher.shadowing(rule_from_pandevice(sec_rule))
+    if shadow is None:
+        return None
+    return shadow['rule_name']
+
+
+def add_security_rule(rule_base, sec_rule):
+    if rule_base:
         rule_base.add(sec_rule)
         sec_rule.create()
 
@@ -370,13 +437,17 @@ def add_security_rule(device, sec_rule):
         return False
 
 
-def _commit(device, device_group=None):
+def _commit(device, device_group=None, scope=None):
     """
     :param device: either firewall or panorama
     :param device_group: panorama device group or if none then 'all'
+    :param scope: partial commit scope, see panos_commit.partial_scope
     :return: True if successful
     """
-    result = device.commit(sync=True)
+    if scope:
+        result = commit_candidate(device.xapi, **scope)
+    else:
+        result = device.commit(sync=True)
 
     if isinstance(device, pandevice.panorama.Panorama):
         result = device.commit_all(sync=True, sync_all=True, devicegroup=device_group)
@@ -415,7 +486,9 @@ def main():
         rule_type=dict(default='universal'),
         action=dict(default='allow'),
         devicegroup=dict(),
-        commit=dict(type='bool', default=True)
+        commit=dict(type='bool', default=True),
+        partial_commit=dict(type='bool', default=False),
+        shadow_check=dict(default='warn', choices=['warn', 'fail', 'ignore'])
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False,
                            required_one_of=[['api_key', 'password']])
@@ -455,9 +528,11 @@ def main():
     devicegroup = module.params['devicegroup']
 
     commit = module.params['commit']
+    shadow_check = module.params['shadow_check']
 
     if devicegroup:
         device = pandevice.panorama.Panorama(ip_address, username, password, api_key=api_key)
+        device._xapi_private = instrument(module, device.generate_xapi())
         dev_grps = device.refresh_devices()
 
         for grp in dev_grps:
@@ -466,10 +541,15 @@ def main():
             module.fail_json(msg=' \'%s\' device group not found in Panorama. Is the name correct?' % devicegroup)
     else:
         device = pandevice.firewall.Firewall(ip_address, username, password, api_key=api_key)
+        device._xapi_private = instrument(module, device.generate_xapi())
 
-    if security_rule_exists(device, rule_name):
+    rule_base = get_rulebase(device)
+    if security_rule_exists(rule_base, rule_name):
         module.fail_json(msg='Rule with the same name already exists.')
 
+    warnings = []
+    shadowed_by = None
+
     try:
         sec_rule = create_security_rule(
             rule_name=rule_name,
@@ -498,15 +578,37 @@ def main():
             action=action
         )
 
-        changed = add_security_rule(device, sec_rule)
+        if shadow_check != 'ignore':
+            try:
+                shadowed_by = find_shadowing_rule(device, rule_base, sec_rule)
+            except ValueError:
+                exc = get_exception()
+                warnings.append('shadow check skipped: %s' % exc)
+            except PanXapiError:
+                # the check must not fail the task unless asked to
+                if shadow_check == 'fail':
+                    raise
+                exc = get_exception()
+                warnings.append('shadow check skipped: %s' % exc)
+
+        if shadowed_by is not None:
+            msg = "rule %s is shadowed by rule %s and would never be hit" % \
+                (rule_name, shadowed_by)
+            if shadow_check == 'fail':
+                module.fail_json(msg=msg, shadowed_by=shadowed_by)
+            warnings.append(msg)
+
+        changed = add_security_rule(rule_base, sec_rule)
     except PanXapiError:
         exc = get_exception()
         module.fail_json(msg=exc.message)
 
     if changed and commit:
-        result = _commit(device, devicegroup)
+        result = _commit(device, devicegroup,
+                         partial_scope(module, POLICY_AND_OBJECTS))
 
-    module.exit_json(changed=changed, msg="okey dokey")
+    module.exit_json(changed=changed, shadowed_by=shadowed_by,
+                     warnings=warnings, msg="okey dokey")
 
 
 if __name__ == '__main__':
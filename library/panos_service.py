@@ -46,6 +46,7 @@ options:
         description:
             - protocol for the service, should be tcp or udp
         required: true
+        choices: ["tcp", "udp"]
     port:
         description:
             - destination port
@@ -60,6 +61,12 @@ options:
             - commit if changed
         required: false
         default: true
+    partial_commit:
+        description:
+            - commit only the changes made by I(username), leaving out the device and network configuration
+              (partial commit, requires PAN-OS 8.0 or later)
+        required: false
+        default: false
 '''
 
 EXAMPLES = '''
@@ -84,6 +91,10 @@ ANSIBLE_METADATA = {'status': ['preview'],
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_commit import commit_candidate, \
+    partial_scope, POLICY_AND_OBJECTS
+from ansible.module_utils.panos_xml import SERVICE
 
 try:
     import pan.xapi
@@ -109,15 +120,8 @@ def add_service(xapi, module, service_name, protocol, port, source_port):
     if service_exists(xapi, service_name):
         return False
 
-    exml = ['<protocol>']
-    exml.append('<%s>' % protocol)
-    exml.append('<port>%s</port>' % port)
-    if source_port:
-        exml.append('<source-port>%s</source-port>' % source_port)
-    exml.append('</%s>' % protocol)
-    exml.append('</protocol>')
-
-    exml = ''.join(exml)
+    exml = SERVICE.render(protocol=protocol, port=port,
+                          source_port=source_port)
 
     xapi.set(xpath=_SERVICE_XPATH % service_name, element=exml)
 
@@ -133,7 +137,8 @@ def main():
         protocol=dict(required=True, choices=['tcp', 'udp']),
         port=dict(required=True),
         source_port=dict(),
-        commit=dict(type='bool', default=True)
+        commit=dict(type='bool', default=True),
+        partial_commit=dict(type='bool', default=False)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
     if not HAS_LIB:
@@ -148,11 +153,11 @@ def main():
     source_port = module.params['source_port']
     commit = module.params['commit']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     try:
         changed = add_service(xapi, module,
@@ -161,7 +166,7 @@ def main():
                               port,
                               source_port)
         if changed and commit:
-            xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+            commit_candidate(xapi, **partial_scope(module, POLICY_AND_OBJECTS))
     except PanXapiError:
         exc = get_exception()
         module.fail_json(msg=exc.message)
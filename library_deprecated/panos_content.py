@@ -27,11 +27,12 @@ requirements:
 options:
     ip_address:
         description:
-            - IP address (or hostname) of PAN-OS device
-        required: true
+            - IP address (or hostname) of PAN-OS device, required unless I(devices) is set
+        required: false
+        default: None
     password:
         description:
-            - password for authentication
+            - password for authentication, can be overridden per device with I(device_passwords)
         required: true
     username:
         description:
@@ -64,6 +65,54 @@ options:
             - timeout for download and install jobs in seconds
         required: false
         default: 240
+    pipeline:
+        description:
+            - when more than one of content, Anti-Virus and Wildfire should be updated, check all of them first, run
+              the downloads in parallel and install each update as soon as it is downloaded, instead of upgrading
+              them one after the other. Installs still run one at a time, content first.
+        required: false
+        default: "false"
+    devices:
+        description:
+            - update a fleet of devices from a single task instead of the device at I(ip_address). Each entry is
+              an IP address (or hostname) or a dict with ip_address and optionally username.
+        required: false
+        default: None
+    device_passwords:
+        description:
+            - with I(devices), password of some of the devices by IP address, overriding I(password). Kept apart
+              from I(devices) so that only the passwords are hidden from the logs.
+        required: false
+        default: None
+    wave_size:
+        description:
+            - with I(devices), number of devices updated per wave. A wave starts when the previous one is finished,
+              0 updates all the devices in one wave.
+        required: false
+        default: 0
+    max_concurrency:
+        description:
+            - with I(devices), maximum number of devices updated at the same time
+        required: false
+        default: 10
+    stop_on_failure:
+        description:
+            - with I(devices), do not start the next wave when a device of the current wave failed
+        required: false
+        default: "true"
+    version_cache_ttl:
+        description:
+            - remember the latest content, Anti-Virus and Wildfire versions found on each device for this many
+              seconds. While they are fresh and still installed, one show system info replaces the check against
+              the update server. 0 disables the cache.
+        required: false
+        default: 0
+    version_cache_file:
+        description:
+            - file holding the version cache, by default content_versions.json in $PANOS_CACHE_DIR or
+              ~/.ansible/cache/panos on the host running the module
+        required: false
+        default: None
 '''
 
 EXAMPLES = '''
@@ -83,6 +132,38 @@ EXAMPLES = '''
     anti_virus_update: yes
     wildfire_update: yes
 
+# upgrade all three, overlapping the downloads
+- name: upgrade content, anti-virus and wildfire
+  panos_content:
+    ip_address: "192.168.1.1"
+    password: "admin"
+    content_update: yes
+    anti_virus_update: yes
+    wildfire_update: yes
+    pipeline: yes
+
+# roll out content to a fleet, 20 devices at a time, at most 10 of them
+# downloading from the update server at the same time
+- name: upgrade content on all firewalls
+  panos_content:
+    devices: "{{groups['firewalls']}}"
+    password: "{{admin_password}}"
+    content_update: yes
+    anti_virus_update: yes
+    pipeline: yes
+    wave_size: 20
+    max_concurrency: 10
+  run_once: true
+
+# skip the update server check on devices known to run the latest
+# content, as seen in the last hour
+- name: upgrade content unless already current
+  panos_content:
+    ip_address: "192.168.1.1"
+    password: "admin"
+    content_update: yes
+    version_cache_ttl: 3600
+
 # download PAN-DB seed for Europe region
 - name: upgrade pan-db
   panos_content:
@@ -96,6 +177,23 @@ status:
     description: success status
     returned: success
     type: string
+jobs:
+    description: download and install jobs waited on, with duration, number of status polls and status timeline
+    returned: single device
+    type: list
+    sample: [{"id": "12", "ids": ["12", "13"], "type": "content-install", "result": "OK", "seconds": 41.2, "polls": 9,
+              "timeline": [{"t": 0.4, "id": "12", "status": "ACT", "progress": "10"}]}]
+devices:
+    description: with I(devices), result of each device with its jobs, duration in seconds and wave
+    returned: fleet
+    type: list
+    sample: [{"ip_address": "10.0.0.1", "wave": 0, "changed": true, "seconds": 212.4, "jobs": []}]
+waves:
+    description: with I(devices), duration of each wave and number of devices changed and failed
+    returned: fleet
+    type: list
+    sample: [{"wave": 0, "devices": 20, "changed": 18, "failed": 0, "seconds": 251.7, "max_device_seconds": 250.9,
+              "avg_device_seconds": 198.2}]
 '''
 
 ANSIBLE_METADATA = {'status': ['preview'],
@@ -103,6 +201,12 @@ ANSIBLE_METADATA = {'status': ['preview'],
                     'version': '1.0'}
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_jobs import JobException, JobTracker, \
+    wait_for_job
+from ansible.module_utils.panos_cache import TTLCache, default_cache_path
+import threading
 import time
 
 try:
@@ -121,36 +225,11 @@ PAN_DB_REGIONS = [
 ]
 
 
-class JobException(Exception):
-    pass
-
-
-def check_job(xapi, jobnum, timeout=240):
-    now = time.time()
-    while time.time() < now+timeout:
-        xapi.op(cmd='<show><jobs><id>%s</id></jobs></show>' % jobnum)
-        status = xapi.element_root.find('.//status')
-        if status is None:
-            raise JobException("Invalid job %s: no status information %s" %
-                               (jobnum, xapi.xml_document))
-        if status.text == 'FIN':
-            result = xapi.element_root.find('.//job/result')
-            if result is None:
-                raise JobException("Invalid FIN job %s: no result %s" %
-                                   (jobnum, xapi.xml_document))
-            if result.text != 'OK':
-                raise JobException("Job %s failed: %s" %
-                                   (jobnum, xapi.xml_document))
-            nextjob = xapi.element_root.find('.//nextjob')
-            if nextjob is not None:
-                return nextjob.text
-            return None
-
-    raise JobException("Timeout in job %s" % jobnum)
-
-
-def upgrade_something(xapi, module, something, job_timeout):
-    # check something updates
+def check_latest(xapi, module, something, seen=None):
+    """
+    Return (version, current, downloaded) of the latest update, also
+    stored in seen[something] when seen is a dict.
+    """
     xapi.op(cmd="<request><%(something)s><upgrade>"
                 "<check></check>"
                 "</upgrade></%(something)s></request>" %
@@ -170,24 +249,25 @@ def upgrade_something(xapi, module, something, job_timeout):
         module.fail_json(msg="no content-updates after check")
     cus = sorted(cus, key=lambda x: x[0], reverse=True)
 
-    latestcus = cus[0]
-    if latestcus[1] == 'yes':
-        # latest already current
-        return False
+    if seen is not None:
+        seen[something] = cus[0][0]
+
+    return cus[0]
 
-    if not latestcus[2] == 'yes':
-        # let's download it
-        xapi.op(cmd="<request><%(something)s><upgrade>"
-                    "<download><latest></latest></download>"
-                    "</upgrade></%(something)s></request>" %
-                    dict(something=something))
-        job = xapi.element_root.find('.//job')
-        if job is None:
-            module.fail_json(msg="no job from download latest %s request" %
-                             something)
-        job = job.text
-        check_job(xapi, job, job_timeout)
 
+def request_download(xapi, module, something):
+    xapi.op(cmd="<request><%(something)s><upgrade>"
+                "<download><latest></latest></download>"
+                "</upgrade></%(something)s></request>" %
+                dict(something=something))
+    job = xapi.element_root.find('.//job')
+    if job is None:
+        module.fail_json(msg="no job from download latest %s request" %
+                         something)
+    return job.text
+
+
+def request_install(xapi, module, something):
     xapi.op(cmd="<request><%(something)s><upgrade>"
                 "<install><version>latest</version></install>"
                 "</upgrade></%(something)s></request>" %
@@ -196,26 +276,96 @@ def upgrade_something(xapi, module, something, job_timeout):
     if job is None:
         module.fail_json(msg="no hob from install latest %s request" %
                          something)
-    job = job.text
-    jobresult = check_job(xapi, job, job_timeout)
-    if jobresult is None:
+    return job.text
+
+
+def check_install(module, something, job):
+    # the install job chains into the job activating the new content
+    if len(job.ids) == 1:
         module.fail_json(msg="no nextjob from install latest %s job" %
                          something)
-    check_job(xapi, jobresult, job_timeout)
 
-    return True
 
+def upgrade_something(xapi, module, something, job_timeout, jobs,
+                      seen=None):
+    latestcus = check_latest(xapi, module, something, seen)
+    if latestcus[1] == 'yes':
+        # latest already current
+        return False
 
-def upgrade_content(xapi, module, job_timeout):
-    return upgrade_something(xapi, module, 'content', job_timeout)
+    if not latestcus[2] == 'yes':
+        # let's download it
+        job = wait_for_job(xapi, request_download(xapi, module, something),
+                           '%s-download' % something, timeout=job_timeout)
+        jobs.append(job.to_dict())
+
+    job = wait_for_job(xapi, request_install(xapi, module, something),
+                       '%s-install' % something, follow=True,
+                       timeout=job_timeout)
+    jobs.append(job.to_dict())
+    check_install(module, something, job)
+
+    return True
 
 
-def upgrade_anti_virus(xapi, module, job_timeout):
-    return upgrade_something(xapi, module, 'anti-virus', job_timeout)
+def upgrade_pipelined(xapi, module, somethings, job_timeout, jobs,
+                      seen=None):
+    """
+    Upgrade several kinds of dynamic updates at once: check all of them,
+    run the downloads side by side and install each update as soon as it
+    is downloaded and the installs before it, in the order of somethings,
+    are done. The device runs one install at a time.
+    """
+    tracker = JobTracker(xapi, timeout=job_timeout)
+
+    # installs still to do, in order, and which of them are downloaded
+    queue = []
+    ready = set()
+    downloads = {}
+    installs = {}
+
+    for something in somethings:
+        latestcus = check_latest(xapi, module, something, seen)
+        if latestcus[1] == 'yes':
+            continue
+        queue.append(something)
+        if latestcus[2] == 'yes':
+            ready.add(something)
+        else:
+            job = tracker.add(request_download(xapi, module, something),
+                              '%s-download' % something)
+            downloads[job] = something
+
+    if not queue:
+        return False
 
+    def next_install():
+        if installs and not all(j.done for j in installs):
+            return
+        if queue and queue[0] in ready:
+            something = queue.pop(0)
+            job = tracker.add(request_install(xapi, module, something),
+                              '%s-install' % something, follow=True)
+            installs[job] = something
+
+    def on_finish(job):
+        if job in downloads:
+            if job.ok:
+                ready.add(downloads[job])
+        elif job.ok:
+            check_install(module, installs[job], job)
+        else:
+            # later updates may depend on this one, stop here
+            del queue[:]
+        next_install()
+
+    next_install()
+    try:
+        tracker.wait(on_finish=on_finish)
+    finally:
+        jobs.extend([j.to_dict() for j in tracker.jobs])
 
-def upgrade_wildfire(xapi, module, job_timeout):
-    return upgrade_something(xapi, module, 'wildfire', job_timeout)
+    return True
 
 
 def download_url_region(xapi, module, region, job_timeout):
@@ -235,54 +385,273 @@ def download_url_region(xapi, module, region, job_timeout):
     return True
 
 
+# show system info element holding the installed version of each update
+_INSTALLED_VERSION = {
+    'content': 'app-version',
+    'anti-virus': 'av-version',
+    'wildfire': 'wildfire-version'
+}
+
+
+def installed_versions(xapi):
+    xapi.op(cmd='<show><system><info></info></system></show>')
+    versions = {}
+    for something, tag in _INSTALLED_VERSION.items():
+        v = xapi.element_root.find('.//system/%s' % tag)
+        if v is not None and v.text:
+            versions[something] = v.text.strip()
+    return versions
+
+
+def update_device(xapi, module, somethings, url_download_region,
+                  job_timeout, pipeline, jobs, cache=None):
+    """
+    With a cache of the latest versions seen on each device, a single
+    show system info tells which updates are still on the latest version
+    and need no check against the update server.
+    """
+    seen = None
+    if cache is not None and somethings:
+        seen = {}
+        installed = installed_versions(xapi)
+        todo = []
+        for something in somethings:
+            latest = cache.get('%s/%s' % (xapi.hostname, something))
+            if latest is None or latest != installed.get(something):
+                todo.append(something)
+        somethings = todo
+
+    changed = False
+    if pipeline and len(somethings) > 1:
+        changed |= upgrade_pipelined(xapi, module, somethings,
+                                     job_timeout, jobs, seen)
+    else:
+        for something in somethings:
+            changed |= upgrade_something(xapi, module, something,
+                                         job_timeout, jobs, seen)
+    if url_download_region:
+        changed |= download_url_region(xapi, module,
+                                       url_download_region, job_timeout)
+
+    if seen:
+        for something, latest in seen.items():
+            cache.set('%s/%s' % (xapi.hostname, something), latest)
+
+    return changed
+
+
+class DeviceFailure(Exception):
+    pass
+
+
+class _DeviceModule(object):
+    """
+    Stands in for the module while updating one device of a fleet:
+    fail_json fails that device only, not the whole task.
+    """
+    def __init__(self, module):
+        self.params = module.params
+
+    def fail_json(self, msg, **kwargs):
+        raise DeviceFailure(msg)
+
+
+def update_fleet(module, devices, username, password, somethings,
+                 url_download_region, job_timeout, pipeline, wave_size,
+                 max_concurrency, stop_on_failure, cache=None):
+    """
+    Update devices in waves of wave_size devices, running at most
+    max_concurrency of them at the same time. The next wave starts when
+    the previous one is done, and only if it had no failure when
+    stop_on_failure is set.
+    """
+    if wave_size <= 0:
+        wave_size = len(devices)
+    waves = [devices[i:i+wave_size] for i in range(0, len(devices), wave_size)]
+
+    results = []
+    wave_results = []
+    stopped = False
+    for n, wave in enumerate(waves):
+        if stopped:
+            for d in wave:
+                results.append(dict(ip_address=d['ip_address'], wave=n,
+                                    skipped=True))
+            continue
+
+        # xapi objects are created here, the workers only use them
+        todo = [(d, instrument(module, pan.xapi.PanXapi(
+            hostname=d['ip_address'],
+            api_username=d.get('username') or username,
+            api_password=d.get('password') or password
+        ))) for d in wave]
+        done = []
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not todo:
+                        return
+                    d, xapi = todo.pop(0)
+
+                jobs = []
+                r = dict(ip_address=d['ip_address'], wave=n, jobs=jobs,
+                         changed=False)
+                start = time.time()
+                try:
+                    r['changed'] = update_device(
+                        xapi, _DeviceModule(module), somethings,
+                        url_download_region, job_timeout, pipeline, jobs,
+                        cache)
+                except Exception:
+                    # whatever the error, the device must be reported
+                    r['failed'] = True
+                    r['msg'] = str(get_exception())
+                r['seconds'] = round(time.time() - start, 3)
+
+                with lock:
+                    done.append(r)
+
+        start = time.time()
+        threads = [threading.Thread(target=worker)
+                   for _ in range(min(max_concurrency, len(wave)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        failed = [r for r in done if r.get('failed')]
+        seconds = [r['seconds'] for r in done]
+        wave_results.append(dict(
+            wave=n,
+            devices=len(wave),
+            changed=len([r for r in done if r['changed']]),
+            failed=len(failed),
+            seconds=round(time.time() - start, 3),
+            max_device_seconds=max(seconds) if seconds else 0,
+            avg_device_seconds=round(sum(seconds) / len(seconds), 3)
+            if seconds else 0
+        ))
+        results.extend(done)
+        if failed and stop_on_failure:
+            stopped = True
+
+    return results, wave_results
+
+
 def main():
     argument_spec = dict(
-        ip_address=dict(required=True),
-        password=dict(required=True, no_log=True),
+        ip_address=dict(),
+        password=dict(no_log=True),
         username=dict(default='admin'),
+        devices=dict(type='list'),
+        device_passwords=dict(type='dict', no_log=True),
+        wave_size=dict(type='int', default=0),
+        max_concurrency=dict(type='int', default=10),
+        stop_on_failure=dict(type='bool', default=True),
         url_download_region=dict(),
         content_update=dict(type='bool', default=False),
         anti_virus_update=dict(type='bool', default=False),
         wildfire_update=dict(type='bool', default=False),
-        job_timeout=dict(type='int', default=240)
+        job_timeout=dict(type='int', default=240),
+        pipeline=dict(type='bool', default=False),
+        version_cache_ttl=dict(type='int', default=0),
+        version_cache_file=dict(type='path')
     )
-    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False,
+                           mutually_exclusive=[['ip_address', 'devices']])
     if not HAS_LIB:
         module.fail_json(msg='pan-python is required for this module')
 
     ip_address = module.params["ip_address"]
-    if not ip_address:
-        module.fail_json(msg="ip_address should be specified")
+    devices = module.params["devices"]
+    if not ip_address and not devices:
+        module.fail_json(msg="ip_address or devices should be specified")
     password = module.params["password"]
-    if not password:
-        module.fail_json(msg="password is required")
     username = module.params['username']
 
     job_timeout = module.params['job_timeout']
+    pipeline = module.params['pipeline']
+    url_download_region = module.params["url_download_region"]
 
-    xapi = pan.xapi.PanXapi(
+    cache = None
+    if module.params['version_cache_ttl'] > 0:
+        cache = TTLCache(module.params['version_cache_file'] or
+                         default_cache_path('content_versions'),
+                         module.params['version_cache_ttl'])
+
+    somethings = []
+    if module.params['content_update']:
+        somethings.append('content')
+    if module.params['anti_virus_update']:
+        somethings.append('anti-virus')
+    if module.params['wildfire_update']:
+        somethings.append('wildfire')
+
+    if devices:
+        device_passwords = module.params['device_passwords'] or {}
+        fleet = []
+        for d in devices:
+            if not isinstance(d, dict):
+                d = dict(ip_address=d)
+            if not d.get('ip_address'):
+                module.fail_json(msg="ip_address missing in devices entry %s"
+                                     % d)
+            if 'password' in d:
+                module.fail_json(msg="password of %s should be given in "
+                                     "device_passwords" % d['ip_address'])
+            d = dict(d, password=device_passwords.get(d['ip_address']))
+            if not (d['password'] or password):
+                module.fail_json(msg="password is required for %s" %
+                                     d['ip_address'])
+            fleet.append(d)
+
+        max_concurrency = module.params['max_concurrency']
+        if max_concurrency < 1:
+            module.fail_json(msg="max_concurrency should be at least 1")
+
+        results, waves = update_fleet(
+            module, fleet, username, password, somethings,
+            url_download_region, job_timeout, pipeline,
+            module.params['wave_size'], max_concurrency,
+            module.params['stop_on_failure'], cache)
+        if cache is not None:
+            cache.save()
+
+        changed = any([r.get('changed') for r in results])
+        failed = [r['ip_address'] for r in results if r.get('failed')]
+        skipped = [r['ip_address'] for r in results if r.get('skipped')]
+        if failed or skipped:
+            module.fail_json(msg="update failed on %s, %d devices skipped" %
+                                 (', '.join(failed), len(skipped)),
+                             changed=changed, devices=results, waves=waves)
+
+        module.exit_json(changed=changed, devices=results, waves=waves,
+                         msg="okey dokey")
+
+    if not password:
+        module.fail_json(msg="password is required")
+
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     changed = False
-
-    content_update = module.params['content_update']
-    if content_update:
-        changed |= upgrade_content(xapi, module, job_timeout)
-    anti_virus_update = module.params['anti_virus_update']
-    if anti_virus_update:
-        changed |= upgrade_anti_virus(xapi, module, job_timeout)
-    wildfire_update = module.params['wildfire_update']
-    if wildfire_update:
-        changed |= upgrade_wildfire(xapi, module, job_timeout)
-    url_download_region = module.params["url_download_region"]
-    if url_download_region:
-        changed |= download_url_region(xapi, module,
-                                       url_download_region, job_timeout)
-
-    module.exit_json(changed=changed, msg="okey dokey")
+    jobs = []
+
+    try:
+        changed = update_device(xapi, module, somethings, url_download_region,
+                                job_timeout, pipeline, jobs, cache)
+        if cache is not None:
+            cache.save()
+    except JobException:
+        exc = get_exception()
+        module.fail_json(msg=str(exc), jobs=jobs)
+
+    module.exit_json(changed=changed, jobs=jobs, msg="okey dokey")
 
 
 if __name__ == '__main__':
@@ -40,17 +40,30 @@ options:
         default: "admin"
     app_name:
         description:
-            - name of the new custom application
-        required: true
+            - name of the new custom application. Required unless I(apps) is set.
+        required: false
     host_regex:
         description:
-            - regex to match against the Host header
-        required: true
+            - regex to match against the Host header. Required unless I(apps) is set.
+        required: false
     convert_hostname:
         description:
             - wheter convert string given as regex in a real regex
         required: false
         default: "false"
+    apps:
+        description:
+            - catalog of custom applications, a list of dicts with app_name, host_regex and optionally
+              convert_hostname (defaults to I(convert_hostname)). All the regexes are checked before anything is
+              changed, the applications are read with a single request, the missing ones are created
+              I(batch_size) per request and the ones whose host regex differs get their host pattern edited in
+              place. Applications not in the catalog are left alone.
+        required: false
+    batch_size:
+        description:
+            - with I(apps), maximum number of applications per request
+        required: false
+        default: 200
     commit:
         description:
             - commit if changed
@@ -67,6 +80,18 @@ EXAMPLES = '''
     username: "admin"
     app_name: "test"
     host_regex: "test\\.example\\.com"
+
+# keep the catalog of internal web applications in sync
+- name: sync custom applications
+  panos_cstapphost:
+    ip_address: "192.168.1.1"
+    password: "admin"
+    convert_hostname: true
+    apps:
+      - app_name: "wiki"
+        host_regex: "wiki.example.com"
+      - app_name: "jira"
+        host_regex: "jira.example.com"
 '''
 
 RETURN = '''
@@ -74,23 +99,38 @@ status:
     description: success status
     returned: success
     type: string
+created:
+    description: with I(apps), names of the applications created
+    returned: success
+    type: list
+updated:
+    description: with I(apps), names of the applications whose host regex was updated
+    returned: success
+    type: list
 '''
 
 ANSIBLE_METADATA = {'status': ['preview'],
                     'supported_by': 'community',
                     'version': '1.0'}
 
+import re
+
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_xml import entry, escape
 
 
 try:
     import pan.xapi
+    from pan.xapi import PanXapiError
     HAS_LIB = True
 except ImportError:
     HAS_LIB = False
 
-_CUSTOM_APP_XPATH = "/config/devices/entry[@name='localhost.localdomain']/" +\
-                    "vsys/entry[@name='vsys1']/application/entry[@name='%s']"
+_APPLICATION_XPATH = "/config/devices/entry[@name='localhost.localdomain']/" +\
+                     "vsys/entry[@name='vsys1']/application"
+_CUSTOM_APP_XPATH = _APPLICATION_XPATH + "/entry[@name='%s']"
 
 _CUSTOM_APP_TEMPLATE = """<default><port><member>tcp/80</member></port></default>
 <signature>
@@ -150,13 +190,106 @@ def convert_to_regex(hname):
     return hname.replace('.', '\.')
 
 
+def compile_catalog(module, apps, convert_hostname=False):
+    """
+    Validate the catalog and return {app_name: host regex}, converting
+    hostnames first where asked. Every regex is checked before anything is
+    sent to the device; raises ValueError on the first invalid entry.
+    """
+    catalog = {}
+    for idx, app in enumerate(apps):
+        if not isinstance(app, dict) or not app.get('app_name') or \
+                not app.get('host_regex'):
+            raise ValueError("apps[%d]: app_name and host_regex are required"
+                             % idx)
+        host_regex = app['host_regex']
+        if module.boolean(app.get('convert_hostname', convert_hostname)):
+            host_regex = convert_to_regex(host_regex)
+        try:
+            re.compile(host_regex)
+        except re.error:
+            raise ValueError("apps[%d]: invalid host_regex %s: %s" %
+                             (idx, host_regex, get_exception()))
+        if app['app_name'] in catalog:
+            raise ValueError("apps[%d]: duplicate app_name %s" %
+                             (idx, app['app_name']))
+        catalog[app['app_name']] = host_regex
+    return catalog
+
+
+def _host_pattern(app):
+    """
+    (pattern, xpath of the pattern relative to the application entry) of
+    the first host pattern of app, (None, None) if it has none.
+    """
+    for sig in app.findall('signature/entry'):
+        for and_ in sig.findall('and-condition/entry'):
+            for or_ in and_.findall('or-condition/entry'):
+                p = or_.find('operator/pattern-match/pattern')
+                if p is not None:
+                    return ((p.text or '').strip(),
+                            "/signature/entry[@name='%s']"
+                            "/and-condition/entry[@name='%s']"
+                            "/or-condition/entry[@name='%s']"
+                            "/operator/pattern-match/pattern" %
+                            (sig.get('name'), and_.get('name'),
+                             or_.get('name')))
+    return None, None
+
+
+def fetch_host_patterns(xapi):
+    """
+    {app_name: (host pattern, pattern xpath)} of the custom applications,
+    one get.
+    """
+    xapi.get(_APPLICATION_XPATH)
+    patterns = {}
+    for e in xapi.element_root.findall('.//application/entry'):
+        patterns[e.get('name')] = _host_pattern(e)
+    return patterns
+
+
+def _chunks(items, size):
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+
+def sync_custom_apps(xapi, catalog, batch_size=200):
+    """
+    Make the custom applications match the catalog: apps missing on the
+    device are created, batch_size per call, apps whose host pattern
+    differs get their pattern edited in place, so that apps referenced by
+    rules can be updated too. Apps not in the catalog are left alone.
+    Returns the names of the apps created and updated.
+    """
+    current = fetch_host_patterns(xapi)
+    names = sorted(catalog)
+    created = [n for n in names if n not in current]
+    updated = [n for n in names if n in current and
+               current[n][0] != catalog[n]]
+
+    # apps without a host pattern get the whole signature, merged by set
+    merged = [n for n in updated if current[n][1] is None]
+    for n in updated:
+        if current[n][1] is not None:
+            xapi.edit(xpath=_CUSTOM_APP_XPATH % n + current[n][1],
+                      element='<pattern>%s</pattern>' % escape(catalog[n]))
+    for chunk in _chunks(sorted(created + merged), batch_size):
+        xapi.set(xpath=_APPLICATION_XPATH, element=''.join(
+            [entry(n, _CUSTOM_APP_TEMPLATE % (escape(n), escape(catalog[n])))
+             for n in chunk]))
+
+    return created, updated
+
+
 def main():
     argument_spec = dict(
         ip_address=dict(required=True),
         password=dict(required=True, no_log=True),
         username=dict(default='admin'),
-        app_name=dict(required=True),
-        host_regex=dict(required=True),
+        app_name=dict(),
+        host_regex=dict(),
+        apps=dict(type='list'),
+        batch_size=dict(type='int', default=200),
         convert_hostname=dict(type='bool', default=False),
         commit=dict(type='bool', default=True)
     )
@@ -172,11 +305,33 @@ def main():
         module.fail_json(msg="password is required")
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
+
+    convert_hostname = module.params['convert_hostname']
+    commit = module.params['commit']
+
+    apps = module.params['apps']
+    if apps:
+        batch_size = module.params['batch_size']
+        if batch_size < 1:
+            module.fail_json(msg="batch_size should be at least 1")
+        try:
+            catalog = compile_catalog(module, apps, convert_hostname)
+            created, updated = sync_custom_apps(xapi, catalog, batch_size)
+            changed = bool(created or updated)
+            if changed and commit:
+                xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+        except ValueError:
+            module.fail_json(msg=str(get_exception()))
+        except PanXapiError:
+            module.fail_json(msg=get_exception().message)
+
+        module.exit_json(changed=changed, created=created, updated=updated,
+                         msg="okey dokey")
 
     app_name = module.params['app_name']
     if not app_name:
@@ -184,10 +339,8 @@ def main():
     host_regex = module.params['host_regex']
     if not host_regex:
         module.fail_json(msg='host_regex is required')
-    convert_hostname = module.params['convert_hostname']
     if convert_hostname:
         host_regex = convert_to_regex(host_regex)
-    commit = module.params['commit']
 
     changed = add_custom_app(xapi, app_name, host_regex)
 
@@ -44,12 +44,26 @@ options:
         required: true
     config_name:
         description:
-            - name of the client config
-        required: true
+            - name of the client config. Required unless I(config_names) is set.
+        required: false
     gateway_address:
         description:
-            - name address of the gateway
-        required: true
+            - name address of the gateway. Required unless I(gateways) is set.
+        required: false
+    gateways:
+        description:
+            - desired list of gateways of the client configs, each a dict with gateway_address and optionally type
+              (default external), manual, description and priority. The gateways of each config are read with a
+              single request and, when they differ, replaced with a single request; gateways not in the list, internal
+              and external, are removed. Settings not given are kept for existing gateways. An empty list removes all
+              the gateways.
+        required: false
+        default: None
+    config_names:
+        description:
+            - with I(gateways), names of the client configs to apply the list to, instead of I(config_name)
+        required: false
+        default: None
     type:
         description:
             - internal or external gateway
@@ -106,18 +120,42 @@ EXAMPLES = '''
       type: "external"
       gateway_address: "{{elastic_ip0}}"
       state: "absent"
+
+# Sets the gateway list of two portal configs
+  - name: roll out the gateway list
+    panos_gpp_gateway:
+      ip_address: "192.168.1.1"
+      password: "admin"
+      portal_name: "GP-Portal"
+      config_names: ["GPClientConfig", "GPContractors"]
+      gateways:
+        - gateway_address: "gw1.example.com"
+          description: "us-east"
+        - gateway_address: "gw2.example.com"
+          description: "eu-west"
+          priority: 2
+        - gateway_address: "10.0.0.1"
+          type: "internal"
 '''
 
 RETURN = '''
-# Default return values
+changed_configs:
+    description: with I(gateways), names of the client configs whose gateways were replaced
+    returned: success
+    type: list
+    sample: ["GPContractors"]
 '''
 
 ANSIBLE_METADATA = {'status': ['preview'],
                     'supported_by': 'community',
                     'version': '1.0'}
 
+import copy
+import xml.etree.ElementTree as ET
+
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.basic import get_exception
+from ansible.module_utils.panos_metrics import instrument
 
 try:
     import pan.xapi
@@ -127,11 +165,14 @@ try:
 except ImportError:
     HAS_LIB = False
 
-_GW_PATH = "/config/devices/entry[@name='localhost.localdomain']" + \
-           "/vsys/entry[@name='vsys1']" + \
-           "/global-protect/global-protect-portal/entry[@name='%s']" + \
-           "/client-config/configs/entry[@name='%s']" + \
-           "/gateways/%s/list/entry[@name='%s']"
+_GATEWAYS_PATH = "/config/devices/entry[@name='localhost.localdomain']" + \
+                 "/vsys/entry[@name='vsys1']" + \
+                 "/global-protect/global-protect-portal/entry[@name='%s']" + \
+                 "/client-config/configs/entry[@name='%s']" + \
+                 "/gateways"
+_GW_PATH = _GATEWAYS_PATH + "/%s/list/entry[@name='%s']"
+
+_GW_TYPES = ('external', 'internal')
 
 
 def get_gpp_gateway(xapi, module, portal_name, config_name,
@@ -232,14 +273,143 @@ def check_gpp_gateway(xapi, module, portal_name, config_name, gateway_address,
                               cgw is not None)
 
 
+def fetch_gateways(xapi, portal_name, config_name):
+    """The gateways subtree of a client config, from a single get."""
+    xapi.get(_GATEWAYS_PATH % (portal_name, config_name))
+    gateways = xapi.element_root.find('.//gateways')
+    if gateways is None:
+        gateways = ET.Element('gateways')
+    return gateways
+
+
+def _set_child(e, tag, text):
+    c = e.find(tag)
+    if c is None:
+        c = ET.SubElement(e, tag)
+    c.text = text
+
+
+def _gateway_fields(gw_list):
+    """
+    (name, manual, priority, description) of each entry of a gateway
+    list, whitespace stripped, so that the indentation of a device
+    response does not count as a difference.
+    """
+    fields = []
+    for e in gw_list.findall('entry'):
+        values = [e.get('name')]
+        for tag in ('manual', 'priority', 'description'):
+            c = e.find(tag)
+            values.append(c.text.strip() if c is not None and c.text else None)
+        fields.append(tuple(values))
+    return fields
+
+
+def apply_gateways(gateways, wanted):
+    """
+    Replace the gateway lists of the gateways element with wanted, a list
+    of dicts with gateway_address, type, manual, description and priority.
+    Gateways already configured keep the settings not given in wanted.
+    Returns True if anything differs from what was there.
+    """
+    changed = False
+    for type_ in _GW_TYPES:
+        want = [w for w in wanted if w['type'] == type_]
+        t = gateways.find(type_)
+        current = t.find('list') if t is not None else None
+        if current is None and not want:
+            continue
+
+        existing = {}
+        if current is not None:
+            existing = dict([(e.get('name'), e) for e in current.findall('entry')])
+
+        new = ET.Element('list')
+        for w in want:
+            e = existing.get(w['gateway_address'])
+            if e is not None:
+                e = copy.deepcopy(e)
+            else:
+                e = ET.Element('entry', name=w['gateway_address'])
+                _set_child(e, 'manual', 'yes')
+                _set_child(e, 'priority', '1')
+            if w['manual'] is not None:
+                _set_child(e, 'manual', 'yes' if w['manual'] else 'no')
+            if w['priority'] is not None:
+                _set_child(e, 'priority', str(w['priority']))
+            if w['description'] is not None:
+                _set_child(e, 'description', w['description'])
+            new.append(e)
+
+        if current is None or _gateway_fields(current) != _gateway_fields(new):
+            changed = True
+            if t is None:
+                t = ET.SubElement(gateways, type_)
+            if current is not None:
+                t.remove(current)
+            t.append(new)
+
+    return changed
+
+
+def sync_gpp_gateways(xapi, portal_name, config_names, wanted):
+    """
+    Desired state of the gateway lists: for each client config, one get
+    of its gateways and, if they differ from wanted, one edit replacing
+    them. Returns the names of the configs changed.
+    """
+    changed = []
+    for config_name in config_names:
+        gateways = fetch_gateways(xapi, portal_name, config_name)
+        if not apply_gateways(gateways, wanted):
+            continue
+
+        element = ET.tostring(gateways)
+        if not isinstance(element, str):
+            element = element.decode('utf-8')
+        xapi.edit(xpath=_GATEWAYS_PATH % (portal_name, config_name),
+                  element=element)
+        changed.append(config_name)
+
+    return changed
+
+
+def parse_gateways(module, gateways):
+    wanted = []
+    seen = set()
+    for idx, g in enumerate(gateways):
+        if not isinstance(g, dict) or not g.get('gateway_address'):
+            module.fail_json(msg="gateways[%d]: gateway_address is required"
+                                 % idx)
+        type_ = g.get('type', 'external')
+        if type_ not in _GW_TYPES:
+            module.fail_json(msg="gateways[%d]: type should be one of %s" %
+                                 (idx, ', '.join(_GW_TYPES)))
+        if (type_, g['gateway_address']) in seen:
+            module.fail_json(msg="gateways[%d]: %s listed twice" %
+                                 (idx, g['gateway_address']))
+        seen.add((type_, g['gateway_address']))
+        manual = g.get('manual')
+        wanted.append(dict(
+            gateway_address=g['gateway_address'],
+            type=type_,
+            manual=module.boolean(manual) if manual is not None else None,
+            description=g.get('description'),
+            priority=g.get('priority')
+        ))
+    return wanted
+
+
 def main():
     argument_spec = dict(
         ip_address=dict(required=True),
         password=dict(required=True, no_log=True),
         username=dict(default='admin'),
         portal_name=dict(required=True),
-        config_name=dict(required=True),
-        gateway_address=dict(required=True),
+        config_name=dict(),
+        gateway_address=dict(),
+        gateways=dict(type='list'),
+        config_names=dict(type='list'),
         type=dict(default="external", choices=['internal', 'external']),
         state=dict(default="present", choices=['absent', 'present']),
         manual=dict(type='bool', default=None),
@@ -254,21 +424,46 @@ def main():
     password = module.params["password"]
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     portal_name = module.params['portal_name']
     config_name = module.params['config_name']
     gateway_address = module.params['gateway_address']
+    commit = module.params['commit']
+
+    gateways = module.params['gateways']
+    if gateways is not None:
+        config_names = module.params['config_names'] or \
+            ([config_name] if config_name else [])
+        if not config_names:
+            module.fail_json(msg="config_name or config_names is required")
+
+        wanted = parse_gateways(module, gateways)
+        changed = []
+        try:
+            changed = sync_gpp_gateways(xapi, portal_name, config_names,
+                                        wanted)
+            if changed and commit:
+                xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
+        except PanXapiError:
+            exc = get_exception()
+            module.fail_json(msg=exc.message)
+
+        module.exit_json(changed=bool(changed), changed_configs=changed,
+                         msg="okey dokey")
+
+    if not config_name or not gateway_address:
+        module.fail_json(msg="config_name and gateway_address are required "
+                             "without gateways")
 
     type_ = module.params['type']
     state = module.params['state']
     manual = module.params['manual']
     description = module.params['description']
-    commit = module.params['commit']
 
     changed = False
     try:
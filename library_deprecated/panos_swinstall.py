@@ -54,6 +54,24 @@ options:
             - timeout for download and install jobs in seconds
         required: false
         default: 240
+    upgrade_path:
+        description:
+            - upgrade to I(version) from the running version, going through every feature release in between.
+              All the images needed are downloaded first, then each release is installed in turn, rebooting the
+              device and waiting for it to be ready after each install. Fails before changing anything when
+              I(version) or a feature release in between is not in the list of available images.
+        required: false
+        default: false
+    reboot:
+        description:
+            - with I(upgrade_path), reboot after installing. Without reboots only a single install step is possible.
+        required: false
+        default: true
+    ready_timeout:
+        description:
+            - with I(upgrade_path), seconds to wait for the device to be ready after a reboot
+        required: false
+        default: 1800
 '''
 
 EXAMPLES = '''
@@ -64,6 +82,16 @@ EXAMPLES = '''
     username: admin
     password: admin
     file: PanOS_vm-6.1.1
+
+# upgrade from 7.0.x to 8.0.3, installing 7.1 on the way
+- name: upgrade to 8.0.3
+  panos_swinstall:
+    ip_address: 192.168.1.1
+    username: admin
+    password: admin
+    version: 8.0.3
+    upgrade_path: true
+    job_timeout: 1800
 '''
 
 RETURN = '''
@@ -71,6 +99,20 @@ status:
     description: success status
     returned: success
     type: string
+jobs:
+    description: install jobs waited on, with duration, number of status polls and status timeline
+    returned: without upgrade_path
+    type: list
+    sample: [{"id": "12", "ids": ["12"], "type": "software-install", "result": "OK", "seconds": 41.2, "polls": 9,
+              "timeline": [{"t": 0.4, "id": "12", "status": "ACT", "progress": "10"}]}]
+phases:
+    description: with I(upgrade_path), time spent in each phase (check, download, install and reboot of each step)
+    returned: upgrade_path
+    type: list
+    sample: [{"phase": "check", "seconds": 4.1, "current": "7.0.5", "path": ["7.1.9", "8.0.3"]},
+             {"phase": "download", "seconds": 310.7, "images": ["7.1.0", "7.1.9", "8.0.0", "8.0.3"], "jobs": []},
+             {"phase": "install", "version": "7.1.9", "seconds": 402.3, "jobs": []},
+             {"phase": "reboot", "version": "7.1.9", "seconds": 611.0}]
 '''
 
 ANSIBLE_METADATA = {'status': ['preview'],
@@ -78,56 +120,31 @@ ANSIBLE_METADATA = {'status': ['preview'],
                     'version': '1.0'}
 
 from ansible.module_utils.basic import *
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_jobs import JobException, JobTracker, \
+    wait_for_job
+import re
 import time
 
 try:
     import pan.xapi
+    from pan.xapi import PanXapiError
     HAS_LIB = True
 except ImportError:
     HAS_LIB = False
 
 
-class JobException(Exception):
-    pass
-
-
-def check_job(xapi, jobnum, timeout=240):
-    now = time.time()
-    while time.time() < now+timeout:
-        xapi.op(cmd='<show><jobs><id>%s</id></jobs></show>' % jobnum)
-        status = xapi.element_root.find('.//status')
-        if status is None:
-            raise JobException("Invalid job %s: no status information %s" %
-                               (jobnum, xapi.xml_document))
-
-        if status.text == 'FIN':
-            result = xapi.element_root.find('.//job/result')
-            if result is None:
-                raise JobException("Invalid FIN job %s: no result %s" %
-                                   (jobnum, xapi.xml_document))
-            if result.text != 'OK':
-                raise JobException("Job %s failed: %s" %
-                                   (jobnum, xapi.xml_document))
-            nextjob = xapi.element_root.find('.//nextjob')
-            if nextjob is not None:
-                return nextjob.text
-
-            return None
-
-    raise JobException("Timeout in job %s" % jobnum)
-
-
 def install_software(xapi, module, version, file_, job_timeout):
     # check something updates
     if version is not None:
-        cmd = '<request><system><software>' +\
-              '<install><version>%s</version></install>' +\
-              '</software></system></request>' % version
+        cmd = ('<request><system><software>' +
+               '<install><version>%s</version></install>' +
+               '</software></system></request>') % version
         something = version
     else:
-        cmd = '<request><system><software>' +\
-              '<install><file>%s</file></install>' +\
-              '</software></system></request>' % file_
+        cmd = ('<request><system><software>' +
+               '<install><file>%s</file></install>' +
+               '</software></system></request>') % file_
         something = file_
 
     xapi.op(cmd=cmd)
@@ -135,8 +152,189 @@ def install_software(xapi, module, version, file_, job_timeout):
     if job is None:
         module.fail_json(msg="no job from install software image %s" %
                          something)
-    job = job.text
-    check_job(xapi, job, timeout=job_timeout)
+    job = wait_for_job(xapi, job.text, 'software-install',
+                       timeout=job_timeout)
+
+    return job.to_dict()
+
+
+_VERSION = re.compile(r'^(\d+)\.(\d+)\.(\d+)(?:-h(\d+))?$')
+
+
+def parse_version(version):
+    """(major, minor, maintenance, hotfix) of a release, None otherwise."""
+    m = _VERSION.match(version or '')
+    if m is None:
+        return None
+    return tuple([int(x or 0) for x in m.groups()])
+
+
+def plan_upgrade(current, target, available):
+    """
+    Return the upgrade path from current to target as a list of
+    (version to install, images to download before) steps. Every feature
+    release in between is installed at its highest maintenance release;
+    the base image of each feature release has to be downloaded first.
+    Raises ValueError when target or a feature release on the way is not
+    in available, PAN-OS refuses to skip one.
+    """
+    cur = parse_version(current)
+    tgt = parse_version(target)
+    if cur is None or tgt is None:
+        raise ValueError("cannot parse version %s" %
+                         (current if cur is None else target))
+    if tgt < cur:
+        raise ValueError("downgrade from %s to %s is not supported" %
+                         (current, target))
+    if tgt == cur:
+        return []
+    if target not in available:
+        raise ValueError("%s is not available" % target)
+    if tgt[:2] == cur[:2]:
+        return [(target, [target])]
+
+    features = {}
+    for v in available:
+        pv = parse_version(v)
+        if pv is not None and cur[:2] < pv[:2] <= tgt[:2]:
+            features.setdefault(pv[:2], []).append((pv, v))
+
+    # feature releases that must be on the way whatever available lists:
+    # the .0 of every major release, those of the target major up to the
+    # target and, in each major, those below a feature release listed
+    required = set([(major, 0) for major in range(cur[0] + 1, tgt[0] + 1)])
+    for major, minor in list(features) + [tgt[:2]]:
+        first = cur[1] + 1 if major == cur[0] else 0
+        required.update([(major, m) for m in range(first, minor)])
+    missing = sorted(required - set(features))
+    if missing:
+        raise ValueError("feature release %s is not available" %
+                         ', '.join(['%d.%d' % f for f in missing]))
+
+    steps = []
+    for feature in sorted(features):
+        base = '%d.%d.0' % feature
+        if base not in available:
+            raise ValueError("base image %s is not available" % base)
+        if feature == tgt[:2]:
+            install = target
+        else:
+            install = max(features[feature])[1]
+        images = [base]
+        if install != base:
+            images.append(install)
+        steps.append((install, images))
+
+    return steps
+
+
+def software_versions(xapi):
+    """Refresh the list of software images, {version: downloaded}."""
+    xapi.op(cmd='<request><system><software><check></check>'
+                '</software></system></request>')
+    versions = {}
+    for e in xapi.element_root.findall('.//versions/entry'):
+        v = e.find('version')
+        d = e.find('downloaded')
+        if v is not None and v.text:
+            versions[v.text.strip()] = d is not None and d.text == 'yes'
+    return versions
+
+
+def running_version(xapi):
+    xapi.op(cmd='<show><system><info></info></system></show>')
+    v = xapi.element_root.find('.//system/sw-version')
+    if v is None:
+        return None
+    return v.text
+
+
+def restart(xapi):
+    try:
+        xapi.op(cmd='<request><restart><system></system></restart></request>')
+    except PanXapiError:
+        # the device may drop the connection before answering
+        pass
+
+
+def wait_ready(xapi, version, timeout, interval=10):
+    """
+    Wait for the device to come back after a reboot: the API answers,
+    the chassis is ready and version is running.
+    """
+    deadline = time.time() + timeout
+    # give the device time to actually go down
+    time.sleep(interval)
+    while time.time() < deadline:
+        try:
+            xapi.op(cmd='<show><chassis-ready></chassis-ready></show>')
+            ready = xapi.element_root.find('.//result')
+            if ready is not None and (ready.text or '').strip() == 'yes' \
+                    and running_version(xapi) == version:
+                return
+        except PanXapiError:
+            pass
+        time.sleep(interval)
+    raise JobException("device not ready on %s after %d seconds" %
+                       (version, timeout))
+
+
+def upgrade_software(xapi, module, target, job_timeout, reboot,
+                     ready_timeout, phases):
+    """
+    Upgrade to target through every feature release on the way: download
+    all the images needed at once, then install each step, rebooting and
+    waiting for the device to be ready in between.
+    """
+    start = time.time()
+    current = running_version(xapi)
+    available = software_versions(xapi)
+    try:
+        steps = plan_upgrade(current, target, available)
+    except ValueError:
+        module.fail_json(msg=str(get_exception()), phases=phases)
+    phases.append(dict(phase='check', seconds=round(time.time() - start, 3),
+                       current=current, path=[s[0] for s in steps]))
+    if not steps:
+        return False
+    if not reboot and len(steps) > 1:
+        module.fail_json(msg="upgrade from %s to %s needs reboots" %
+                         (current, target), phases=phases)
+
+    # pre-stage every image, the device queues the downloads
+    start = time.time()
+    images = []
+    for _, step_images in steps:
+        for image in step_images:
+            if not available.get(image) and image not in images:
+                images.append(image)
+    # queued downloads only start when the previous ones are done
+    tracker = JobTracker(xapi, timeout=job_timeout * max(1, len(images)))
+    for image in images:
+        xapi.op(cmd='<request><system><software><download>'
+                    '<version>%s</version>'
+                    '</download></software></system></request>' % image)
+        if tracker.add_from_response('software-download') is None:
+            module.fail_json(msg="no job from download software image %s" %
+                                 image, phases=phases)
+    tracker.wait()
+    phases.append(dict(phase='download', seconds=round(time.time() - start, 3),
+                       images=images,
+                       jobs=[j.to_dict() for j in tracker.jobs]))
+
+    for version, _ in steps:
+        start = time.time()
+        job = install_software(xapi, module, version, None, job_timeout)
+        phases.append(dict(phase='install', version=version,
+                           seconds=round(time.time() - start, 3), jobs=[job]))
+        if not reboot:
+            break
+
+        start = time.time()
+        restart(xapi)
+        wait_ready(xapi, version, ready_timeout)
+        phases.append(dict(phase='reboot', version=version,
+                           seconds=round(time.time() - start, 3)))
 
     return True
 
@@ -148,7 +346,10 @@ def main():
         username=dict(default='admin'),
         version=dict(default=None),
         file=dict(default=None),
-        job_timeout=dict(type='int', default=240)
+        job_timeout=dict(type='int', default=240),
+        upgrade_path=dict(type='bool', default=False),
+        reboot=dict(type='bool', default=True),
+        ready_timeout=dict(type='int', default=1800)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
     if not HAS_LIB:
@@ -162,11 +363,11 @@ def main():
         module.fail_json(msg="password is required")
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     job_timeout = module.params['job_timeout']
     file_ = module.params['file']
@@ -174,9 +375,26 @@ def main():
     if version is None and file_ is None:
         module.fail_json(msg="one of version or file should be specified")
 
-    changed = install_software(xapi, module, version, file_, job_timeout)
+    if module.params['upgrade_path']:
+        if version is None:
+            module.fail_json(msg="version is required with upgrade_path")
+        phases = []
+        try:
+            changed = upgrade_software(xapi, module, version, job_timeout,
+                                       module.params['reboot'],
+                                       module.params['ready_timeout'], phases)
+        except JobException:
+            exc = get_exception()
+            module.fail_json(msg=str(exc), phases=phases)
+        module.exit_json(changed=changed, phases=phases, msg="okey dokey")
+
+    try:
+        job = install_software(xapi, module, version, file_, job_timeout)
+    except JobException:
+        exc = get_exception()
+        module.fail_json(msg=str(exc))
 
-    module.exit_json(changed=changed, msg="okey dokey")
+    module.exit_json(changed=True, jobs=[job], msg="okey dokey")
 
 
 if __name__ == '__main__':
@@ -51,6 +51,24 @@ options:
             - "capture: optional, deafult is 'disable'"
         required: false
         default: None
+    exception_ids:
+        description:
+            - list of threat IDs to add as threat exceptions (action reset-client)
+        required: false
+        default: None
+    incremental:
+        description:
+            - when the profile already exists, update it instead of leaving it untouched. The profile is read once,
+              threat exceptions missing from I(exception_ids) are deleted and new ones added, I(batch_size) per
+              call, existing ones are not rewritten. The rules are replaced in a single call when they differ from
+              I(rule_tuples). Options left unset are not changed.
+        required: false
+        default: false
+    batch_size:
+        description:
+            - with I(incremental), maximum number of threat exceptions added or removed per API call
+        required: false
+        default: 500
     commit:
         description:
             - commit if changed
@@ -67,6 +85,14 @@ panos_vulnprofile:
   rule_tuples: [{'rule_name': 'simple-client-critical', 'threat_name': 'any', 'vendor_id': 'any', 'cve': '1.1.1.1', 'host_type': 'client', 'severity': 'critical', 'action': 'default', 'capture': 'disable'}, {'rule_name': 'simple-client-high', 'threat_name': 'any', 'cve': 'any', 'vendor_id': '1.1.1.1', 'host_type': 'client', 'severity': 'high', 'action': 'default', 'capture': 'disable'}]
   exception_ids: ["35931","35933"]
   commit: False
+
+# keep the exceptions in sync with a feed, only the differences are sent
+panos_vulnprofile:
+  ip_address: "10.0.0.43"
+  password: "admin"
+  vulnprofile_name: "SampleVRule"
+  exception_ids: "{{ feed_threat_ids }}"
+  incremental: true
 '''
 
 RETURN = '''
@@ -74,6 +100,16 @@ status:
     description: success status
     returned: success
     type: string
+exceptions_added:
+    description: number of threat exceptions added
+    returned: success
+    type: int
+    sample: 12
+exceptions_removed:
+    description: number of threat exceptions removed
+    returned: success
+    type: int
+    sample: 3
 '''
 
 ANSIBLE_METADATA = {'status': ['preview'],
@@ -81,6 +117,9 @@ ANSIBLE_METADATA = {'status': ['preview'],
                     'version': '1.0'}
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.panos_metrics import instrument
+from ansible.module_utils.panos_xml import XmlTemplate, XmlTemplateError, \
+    escape
 import json
 # import pydevd
 # pydevd.settrace('localhost', port=62980, stdoutToServer=True, stderrToServer=True)
@@ -97,6 +136,29 @@ _SERVICE_XPATH = "/config/devices/entry[@name='localhost.localdomain']" +\
                  "/vsys/entry[@name='vsys1']" +\
                  "/profiles/vulnerability/entry[@name='%s']"
 
+_RULE_DEFAULTS = dict(
+    cve='any',
+    vendor_id='any',
+    threat_name='any',
+    host_type='client',
+    action='default',
+    capture='disable',
+    category='any'
+)
+
+_RULE_TEMPLATE = XmlTemplate(
+    '<cve>{cve!members}</cve>'
+    '<vendor-id>{vendor_id!members}</vendor-id>'
+    '<severity>{severity!members}</severity>'
+    '<threat-name>{threat_name}</threat-name>'
+    '<host>{host_type}</host>'
+    '<category>{category}</category>'
+    '<packet-capture>{capture}</packet-capture>'
+    '<action><{action!tag}/></action>'
+)
+
+_EXCEPTION_TEMPLATE = XmlTemplate('<action><reset-client/></action>')
+
 
 def debug(msg):
     print json.dumps({
@@ -105,11 +167,90 @@ def debug(msg):
 
 
 def vulnerability_profile_exists(xapi, vulnprofile_name):
+    return fetch_vulnerability_profile(xapi, vulnprofile_name) is not None
+
+
+def fetch_vulnerability_profile(xapi, vulnprofile_name):
     xapi.get(_SERVICE_XPATH % vulnprofile_name)
-    e = xapi.element_root.find('.//entry')
-    if e is None:
-        return False
-    return True
+    return xapi.element_root.find('.//entry')
+
+
+def _text(e, tag):
+    t = e.find(tag)
+    if t is None:
+        return None
+    return t.text
+
+
+def parse_rule(e):
+    """A rule entry of the profile as the dict rendered by _RULE_TEMPLATE."""
+    rule = dict(
+        rule_name=e.get('name'),
+        cve=[m.text for m in e.findall('cve/member')],
+        vendor_id=[m.text for m in e.findall('vendor-id/member')],
+        severity=[m.text for m in e.findall('severity/member')],
+        threat_name=_text(e, 'threat-name'),
+        host_type=_text(e, 'host'),
+        category=_text(e, 'category'),
+        capture=_text(e, 'packet-capture')
+    )
+    action = e.find('action')
+    if action is not None and len(action):
+        rule['action'] = action[0].tag
+    return dict(_RULE_DEFAULTS, **dict([(k, v) for k, v in rule.items()
+                                         if v is not None]))
+
+
+def _chunks(items, size):
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+
+def update_vulnerability_profile(xapi, profile, batch_size=500, **kwargs):
+    """
+    Bring the existing profile to the wanted state with as few calls as
+    possible: the threat exceptions are diffed by threat ID and only the
+    added ones are set and the removed ones deleted, batch_size per call.
+    The rules, whose order matters, are replaced in a single edit when
+    they differ. Returns (changed, number added, number removed).
+    """
+    xpath = _SERVICE_XPATH % kwargs['vulnprofile_name']
+    changed = False
+
+    if kwargs['rule_tuples'] is not None:
+        rules = [dict(_RULE_DEFAULTS, **item) for item in kwargs['rule_tuples']]
+        wanted = _RULE_TEMPLATE.render_entries(rules, name_key='rule_name')
+        current = _RULE_TEMPLATE.render_entries(
+            [parse_rule(e) for e in profile.findall('rules/entry')],
+            name_key='rule_name')
+        if wanted != current:
+            xapi.edit(xpath=xpath+'/rules', element='<rules>%s</rules>' % wanted)
+            changed = True
+
+    added, removed = [], []
+    if kwargs['exception_ids'] is not None:
+        current = set([e.get('name') for e in
+                       profile.findall('threat-exception/entry')])
+        wanted = set([str(t) for t in kwargs['exception_ids']])
+        added = sorted(wanted - current)
+        removed = sorted(current - wanted)
+
+        for chunk in _chunks(removed, batch_size):
+            xapi.delete(xpath=xpath+"/threat-exception/entry[%s]" %
+                        ' or '.join(["@name='%s'" % t for t in chunk]))
+        for chunk in _chunks(added, batch_size):
+            xapi.set(xpath=xpath+'/threat-exception',
+                     element=_EXCEPTION_TEMPLATE.render_entries(
+                         [dict(name=t) for t in chunk]))
+        changed = changed or bool(added or removed)
+
+    if kwargs['description'] is not None and \
+            _text(profile, 'description') != kwargs['description']:
+        xapi.edit(xpath=xpath+'/description',
+                  element='<description>%s</description>' %
+                  escape(kwargs['description']))
+        changed = True
+
+    return changed, len(added), len(removed)
 
 
 def add_vulnerability_profile(xapi, **kwargs):
@@ -119,58 +260,20 @@ def add_vulnerability_profile(xapi, **kwargs):
     exml = []
 
     if kwargs['rule_tuples'] is not None:
+        rules = [dict(_RULE_DEFAULTS, **item) for item in kwargs['rule_tuples']]
         exml.append('<rules>')
-        for item in kwargs['rule_tuples']:
-            cve = "any"
-            vendor_id = "any"
-            threat_name = "any"
-            host_type = "client"
-            action = "default"
-            capture = "disable"
-            category = "any"
-
-            if 'cve' in item:
-                cve = item['cve']
-            if 'vendor_id' in item:
-                vendor_id = item['vendor_id']
-            if 'threat_name' in item:
-                threat_name = item['threat_name']
-            if 'host_type' in item:
-                host_type = item['host_type']
-            if 'action' in item:
-                action = item['action']
-            if 'capture' in item:
-                capture = item['capture']
-            if 'category' in item:
-                category = item['category']
-
-            exml.append('<entry name=\"%s\">' % item['rule_name'])
-            exml.append('<cve><member>%s</member></cve>' % cve)
-            exml.append('<vendor-id><member>%s</member></vendor-id>' %
-                        vendor_id)
-            exml.append('<severity><member>%s</member></severity>' %
-                        item['severity'])
-            exml.append('<threat-name>%s</threat-name>' %
-                        threat_name)
-            exml.append('<host>%s</host>' % host_type)
-            exml.append('<category>%s</category>' % category)
-            exml.append('<packet-capture>%s</packet-capture>' %
-                        capture)
-            exml.append('<action><%s/></action>' %
-                        action)
-            exml.append('</entry>')
+        exml.append(_RULE_TEMPLATE.render_entries(rules, name_key='rule_name'))
         exml.append('</rules>')
 
     if kwargs['exception_ids'] is not None:
         exml.append('<threat-exception>')
-        for t in kwargs['exception_ids']:
-            exml.append('<entry name=\"%s\">'
-                        '<action><reset-client/></action>'
-                        '</entry>' % t)
+        exml.append(_EXCEPTION_TEMPLATE.render_entries(
+            [dict(name=t) for t in kwargs['exception_ids']]))
         exml.append('</threat-exception>')
 
     if kwargs['description'] is not None:
-        exml.append('<description>%s</description>' % kwargs['description'])
+        exml.append('<description>%s</description>' %
+                    escape(kwargs['description']))
 
     exml = ''.join(exml)
 
@@ -189,7 +292,9 @@ def main():
         vulnprofile_name=dict(required=True),
         description=dict(default=None),
         rule_tuples=dict(default=None),
-        exception_ids=dict(default=None),
+        exception_ids=dict(type='list', default=None),
+        incremental=dict(type='bool', default=False),
+        batch_size=dict(type='int', default=500),
         commit=dict(type='bool', default=True)
     )
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=False)
@@ -204,11 +309,11 @@ def main():
         module.fail_json(msg="password is required")
     username = module.params['username']
 
-    xapi = pan.xapi.PanXapi(
+    xapi = instrument(module, pan.xapi.PanXapi(
         hostname=ip_address,
         api_username=username,
         api_password=password
-    )
+    ))
 
     vulnprofile_name = module.params["vulnprofile_name"]
     if not vulnprofile_name:
@@ -216,21 +321,41 @@ def main():
 
     description = module.params["description"]
     rule_tuples = module.params["rule_tuples"]
-    rule_tuples = rule_tuples.replace('\'','"') #get rid of double-quotes
-    rule_tuples = json.loads(rule_tuples)
+    if rule_tuples is not None:
+        rule_tuples = rule_tuples.replace('\'','"') #get rid of double-quotes
+        rule_tuples = json.loads(rule_tuples)
     exception_ids = module.params["exception_ids"]
 
     if not rule_tuples and not exception_ids:
         module.fail_json(msg="You cannot have both exception and rules empty")
 
     commit = module.params['commit']
+    incremental = module.params['incremental']
+    batch_size = module.params['batch_size']
+    if batch_size < 1:
+        module.fail_json(msg="batch_size should be at least 1")
 
+    added = removed = 0
     try:
-        changed = add_vulnerability_profile(xapi,
-                                            vulnprofile_name=vulnprofile_name,
-                                            description=description,
-                                            rule_tuples=rule_tuples,
-                                            exception_ids=exception_ids)
+        profile = None
+        if incremental:
+            profile = fetch_vulnerability_profile(xapi, vulnprofile_name)
+
+        if profile is not None:
+            changed, added, removed = update_vulnerability_profile(
+                xapi, profile, batch_size,
+                vulnprofile_name=vulnprofile_name,
+                description=description,
+                rule_tuples=rule_tuples,
+                exception_ids=exception_ids)
+        else:
+            changed = add_vulnerability_profile(xapi,
+                                                vulnprofile_name=vulnprofile_name,
+                                                description=description,
+                                                rule_tuples=rule_tuples,
+                                                exception_ids=exception_ids)
+            if changed and exception_ids:
+                added = len(exception_ids)
 
         if changed and commit:
             xapi.commit(cmd="<commit></commit>", sync=True, interval=1)
@@ -238,8 +363,13 @@ def main():
         import sys
         x = sys.exc_info()[1]
         module.fail_json(msg=x.message)
+    except XmlTemplateError:
+        import sys
+        x = sys.exc_info()[1]
+        module.fail_json(msg=str(x))
 
-    module.exit_json(changed=changed, msg="okey dokey")
+    module.exit_json(changed=changed, exceptions_added=added,
+                     exceptions_removed=removed, msg="okey dokey")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Compare the precompiled XML templates in module_utils/panos_xml.py with
+the fragment concatenation the modules used before, rendering address
+objects and NAT rules in bulk. The plain concatenation does not escape
+values, so it is also measured with every value passed through
+xml.sax.saxutils.escape, which is what a correct version would need.
+
+    $ python misc/bench_xml_builders.py [count]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+from xml.sax.saxutils import escape as sax_escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'module_utils'))
+
+from panos_xml import ADDRESS, NAT_RULE, escape  # noqa: E402
+
+
+_ENTITIES = {'"': '&quot;', "'": '&apos;'}
+
+
+def esc(value):
+    return sax_escape(value, _ENTITIES)
+
+
+def concat_address(address, description, type, tag, esc=str):
+    exml = []
+    exml.append('<%s>' % type)
+    exml.append('%s' % esc(address))
+    exml.append('</%s>' % type)
+
+    if description:
+        exml.append('<description>')
+        exml.append('%s' % esc(description))
+        exml.append('</description>')
+
+    if tag:
+        exml.append('<tag>')
+        exml.append('<member>%s</member>' % esc(tag))
+        exml.append('</tag>')
+
+    return ''.join(exml)
+
+
+def concat_nat(to_zone, from_zone, source, destination, service, esc=str):
+    exml = []
+    exml.append("<to><member>%s</member></to>" % esc(to_zone))
+
+    exml.append("<from>")
+    exml = exml + ["<member>%s</member>" % esc(e) for e in from_zone]
+    exml.append("</from>")
+
+    exml.append("<source>")
+    exml = exml + ["<member>%s</member>" % esc(e) for e in source]
+    exml.append("</source>")
+
+    exml.append("<destination>")
+    exml = exml + ["<member>%s</member>" % esc(e) for e in destination]
+    exml.append("</destination>")
+
+    exml.append("<service>%s</service>" % esc(service))
+
+    exml.append("<nat-type>ipv4</nat-type>")
+
+    return ''.join(exml)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    addresses = [dict(name='host-%d' % i,
+                      address='10.%d.%d.%d/32' % (i >> 16, (i >> 8) & 255,
+                                                  i & 255),
+                      description='web server <%d> & friends' % i,
+                      type='ip-netmask',
+                      tag='servers') for i in range(count)]
+    rules = [dict(name='nat-%d' % i,
+                  to_zone='untrust',
+                  from_zone=['trust', 'dmz'],
+                  source=['10.0.%d.0/24' % (i & 255)],
+                  destination=['any'],
+                  service='service-http') for i in range(count)]
+
+    def old_addresses(esc=str):
+        return ''.join(['<entry name="%s">%s</entry>' % (
+            esc(a['name']), concat_address(a['address'], a['description'],
+                                           a['type'], a['tag'], esc))
+            for a in addresses])
+
+    def new_addresses():
+        return ADDRESS.render_entries(addresses)
+
+    def old_rules(esc=str):
+        return ''.join(['<entry name="%s">%s</entry>' % (
+            esc(r['name']), concat_nat(r['to_zone'], r['from_zone'],
+                                       r['source'], r['destination'],
+                                       r['service'], esc))
+            for r in rules])
+
+    def new_rules():
+        return NAT_RULE.render_entries(rules)
+
+    print('%d objects, best of 5 runs' % count)
+    print('%-10s %18s %18s %18s' % ('', 'concat (unsafe)', 'concat + escape',
+                                    'template'))
+    for label, old, new in (('address', old_addresses, new_addresses),
+                            ('nat rule', old_rules, new_rules)):
+        t_old = min(timeit.repeat(old, number=1, repeat=5))
+        t_esc = min(timeit.repeat(lambda: old(esc), number=1, repeat=5))
+        t_new = min(timeit.repeat(new, number=1, repeat=5))
+        print('%-10s %15.2f ms %15.2f ms %15.2f ms' %
+              (label, t_old * 1000, t_esc * 1000, t_new * 1000))
+
+    # same output as the escaping concatenation
+    assert new_addresses() == old_addresses(esc)
+    assert new_rules() == old_rules(esc)
+    assert escape('<') == '&lt;'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+IPv4 and IPv6 address values as integer intervals.
+
+An address value (a host 10.0.0.1, an ip-netmask 10.0.0.0/8, an ip-range
+10.0.0.1-10.0.0.9) becomes a (family, first, last) tuple, family being 4
+or 6 and first/last integers, so that containment and overlap are plain
+integer comparisons::
+
+    >>> parse_address('10.0.0.0/30')
+    (4, 167772160, 167772163)
+    >>> merge([(4, 1, 5), (4, 6, 9), (4, 20, 30)])
+    [(4, 1, 9), (4, 20, 30)]
+
+fqdn values cannot be turned into addresses without a resolver, parse_address
+returns None for them.
+
+analyze_addresses() works on a whole set of address objects at once and
+reports duplicates, overlaps and the objects that could be consolidated.
+"""
+
+import binascii
+import socket
+
+BITS = {4: 32, 6: 128}
+_AF = {4: socket.AF_INET, 6: socket.AF_INET6}
+
+ANY = [(4, 0, (1 << 32) - 1), (6, 0, (1 << 128) - 1)]
+
+
+def parse_ip(text):
+    """(family, integer) of an IPv4 or IPv6 address, ValueError if invalid."""
+    family = 6 if ':' in text else 4
+    try:
+        packed = socket.inet_pton(_AF[family], text.strip())
+    except (socket.error, UnicodeError, TypeError):
+        raise ValueError('invalid IP address %r' % (text,))
+    return family, int(binascii.hexlify(packed), 16)
+
+
+def format_ip(family, value):
+    packed = binascii.unhexlify('%0*x' % (BITS[family] // 4, value))
+    return socket.inet_ntop(_AF[family], packed)
+
+
+def parse_netmask(text):
+    """Interval of a host or network, host bits of a network are ignored."""
+    if '/' in text:
+        addr, plen = text.split('/', 1)
+    else:
+        addr, plen = text, None
+    family, value = parse_ip(addr)
+    bits = BITS[family]
+    if plen is None:
+        return family, value, value
+    try:
+        plen = int(plen)
+    except ValueError:
+        raise ValueError('invalid prefix length in %r' % (text,))
+    if not 0 <= plen <= bits:
+        raise ValueError('invalid prefix length in %r' % (text,))
+    hostmask = (1 << (bits - plen)) - 1
+    first = value & ~hostmask
+    return family, first, first | hostmask
+
+
+def parse_range(text):
+    if '-' not in text:
+        raise ValueError('invalid ip-range %r' % (text,))
+    first, last = text.split('-', 1)
+    f1, first = parse_ip(first)
+    f2, last = parse_ip(last)
+    if f1 != f2 or first > last:
+        raise ValueError('invalid ip-range %r' % (text,))
+    return f1, first, last
+
+
+def parse_address(value, type_=None):
+    """
+    Interval of an address value of type ip-netmask, ip-range or fqdn,
+    None for fqdn. Without type_ the value is taken as an ip-range or an
+    ip-netmask if it parses as one and None is returned otherwise.
+    """
+    if type_ is None:
+        try:
+            if '-' in value:
+                return parse_range(value)
+            return parse_netmask(value)
+        except ValueError:
+            return None
+    if type_ == 'ip-netmask':
+        return parse_netmask(value)
+    if type_ == 'ip-range':
+        return parse_range(value)
+    if type_ == 'fqdn':
+        return None
+    raise ValueError('unknown address type %r' % (type_,))
+
+
+def merge(intervals):
+    """Sorted union of intervals, adjacent ones joined."""
+    merged = []
+    for family, first, last in sorted(intervals):
+        if merged and merged[-1][0] == family and first <= merged[-1][2] + 1:
+            if last > merged[-1][2]:
+                merged[-1] = (family, merged[-1][1], last)
+        else:
+            merged.append((family, first, last))
+    return merged
+
+
+def complement(intervals):
+    """Every address, of both families, not in intervals."""
+    result = []
+    merged = merge(intervals)
+    for family in (4, 6):
+        nxt = 0
+        for f, first, last in merged:
+            if f != family:
+                continue
+            if first > nxt:
+                result.append((family, nxt, first - 1))
+            nxt = last + 1
+        top = (1 << BITS[family]) - 1
+        if nxt <= top:
+            result.append((family, nxt, top))
+    return result
+
+
+def contains(outer, inner):
+    """True if the merged intervals outer cover every interval of inner."""
+    outer = merge(outer)
+    for family, first, last in merge(inner):
+        if not [o for o in outer if o[0] == family and o[1] <= first and
+                last <= o[2]]:
+            return False
+    return True
+
+
+def range_to_cidrs(family, first, last):
+    """Smallest list of networks, as strings, covering first-last."""
+    bits = BITS[family]
+    cidrs = []
+    while first <= last:
+        # largest block aligned on first that does not go past last
+        size = (first & -first).bit_length() - 1 if first else bits
+        while size and first + (1 << size) - 1 > last:
+            size -= 1
+        cidrs.append('%s/%d' % (format_ip(family, first), bits - size))
+        first += 1 << size
+    return cidrs
+
+
+def canonical(family, first, last, type_=None):
+    """
+    Canonical text of an interval: a host without mask or a network with
+    its host bits cleared for ip-netmask, first-last for ip-range. Without
+    type_, the ip-netmask form when the interval is a host or a network.
+    """
+    if type_ != 'ip-range':
+        if first == last:
+            return format_ip(family, first)
+        size = last - first + 1
+        if not size & (size - 1) and not first & (size - 1):
+            return '%s/%d' % (format_ip(family, first),
+                              BITS[family] - size.bit_length() + 1)
+        if type_ == 'ip-netmask':
+            raise ValueError('not a network')
+    return '%s-%s' % (format_ip(family, first), format_ip(family, last))
+
+
+def analyze_addresses(objects):
+    """
+    Normalization, duplicates, containment, overlaps and possible
+    consolidations of address objects, given as (name, type, value).
+
+    The objects are parsed once into (family, first, last, name) tuples
+    and sorted; duplicates are grouped by interval, containment, partial
+    overlaps and mergeable blocks come out of a single sweep keeping the
+    interval reaching the furthest so far. Each object is compared with
+    that one only, so the whole analysis is O(n log n) but an object
+    overlapping several others is reported once.
+    """
+    invalid = []
+    normalized = []
+    intervals = []
+    fqdns = {}
+    for name, type_, value in objects:
+        value = (value or '').strip()
+        if type_ == 'fqdn':
+            norm = value.lower().rstrip('.')
+            if norm != value:
+                normalized.append(dict(name=name, value=value,
+                                       normalized=norm))
+            fqdns.setdefault(norm, []).append(name)
+            continue
+        try:
+            family, first, last = parse_address(value, type_)
+        except ValueError:
+            invalid.append(dict(name=name, value=value))
+            continue
+        norm = canonical(family, first, last, type_)
+        if norm != value:
+            normalized.append(dict(name=name, value=value, normalized=norm))
+        intervals.append((family, first, last, name))
+
+    by_value = {}
+    for family, first, last, name in intervals:
+        by_value.setdefault((family, first, last), []).append(name)
+    duplicates = [dict(value=canonical(*k), objects=sorted(v))
+                  for k, v in by_value.items() if len(v) > 1]
+    duplicates.extend(dict(value=k, objects=sorted(v))
+                      for k, v in fqdns.items() if len(v) > 1)
+    duplicates.sort(key=lambda d: d['objects'])
+
+    # one object per distinct interval from here on, widest first on ties
+    unique = sorted(((k[0], k[1], -k[2], sorted(v))
+                     for k, v in by_value.items()))
+
+    contained = []
+    overlaps = []
+    consolidations = []
+    reach = None
+    block = []
+
+    def close_block():
+        if len(block) < 2:
+            return
+        f = block[0][0]
+        cidrs = range_to_cidrs(f, block[0][1], max(b[2] for b in block))
+        if len(cidrs) < len(block):
+            consolidations.append(dict(
+                objects=sorted(n for b in block for n in b[3]),
+                replace_with=cidrs))
+
+    for family, first, neg_last, names in unique:
+        last = -neg_last
+        name = names[0]
+        if reach is not None and reach[0] == family and first <= reach[2]:
+            if last <= reach[2]:
+                contained.append(dict(name=name, contained_in=reach[3]))
+            else:
+                overlaps.append(dict(name=name, overlaps=reach[3]))
+        if reach is None or reach[0] != family or first > reach[2] + 1:
+            close_block()
+            block = []
+        block.append((family, first, last, names))
+        if reach is None or reach[0] != family or last > reach[2]:
+            reach = (family, first, last, name)
+    close_block()
+
+    return dict(
+        invalid=invalid,
+        normalized=normalized,
+        duplicates=duplicates,
+        contained=contained,
+        overlaps=overlaps,
+        consolidations=consolidations
+    )
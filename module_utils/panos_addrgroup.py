@@ -0,0 +1,357 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Membership of static and dynamic address groups.
+
+The address objects, the address groups and the registered IPs of a vsys
+are parsed once into an AddressGroupResolver, which indexes address
+objects and registered IPs by tag. A dynamic group filter is compiled to
+set operations on that index ('a' and ('b' or 'c') is the intersection of
+the members tagged a with the union of those tagged b and c), a static
+group is the union of its members, nested groups included::
+
+    resolver = AddressGroupResolver()
+    resolver.load(shared_element)
+    resolver.load(vsys_element)
+    resolver.load_registered_ips(op_result_element)
+    members = resolver.resolve('web-servers')
+
+Flattened memberships are memoized. Every change made through the
+resolver (set_address, set_group, register...) invalidates the groups
+depending on what changed, directly, through a nested group or through a
+tag their filter uses, and nothing else.
+"""
+
+import re
+import sys
+
+from ansible.module_utils.panos_addr import canonical, merge, parse_address
+
+VSYS_XPATH = "/config/devices/entry[@name='localhost.localdomain']" + \
+             "/vsys/entry[@name='%s']"
+SHARED_XPATH = "/config/shared"
+
+REGISTERED_IP_CMD = '<show><object><registered-ip><all></all>' + \
+                    '</registered-ip></object></show>'
+
+_ADDRESS_TYPES = ('ip-netmask', 'ip-range', 'fqdn', 'ip-wildcard')
+
+_TOKEN = re.compile(r"\s*(\(|\)|'[^']*'|\"[^\"]*\"|[^\s()]+)")
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _members(e, path):
+    return [m.text.strip() for m in e.findall(path) if m.text]
+
+
+def parse_filter(text):
+    """
+    Tree of a dynamic group filter: ('tag', name), ('and', left, right)
+    or ('or', left, right), and binding tighter than or.
+    """
+    tokens = []
+    pos = 0
+    text = text or ''
+    while pos < len(text.rstrip()):
+        m = _TOKEN.match(text, pos)
+        if m is None:
+            raise FilterError('invalid filter %r' % (text,))
+        tokens.append(m.group(1))
+        pos = m.end()
+    if not tokens:
+        raise FilterError('empty filter')
+
+    def operator(i, op):
+        return i < len(tokens) and tokens[i].lower() == op
+
+    def parse_or(i):
+        left, i = parse_and(i)
+        while operator(i, 'or'):
+            right, i = parse_and(i + 1)
+            left = ('or', left, right)
+        return left, i
+
+    def parse_and(i):
+        left, i = parse_atom(i)
+        while operator(i, 'and'):
+            right, i = parse_atom(i + 1)
+            left = ('and', left, right)
+        return left, i
+
+    def parse_atom(i):
+        if i >= len(tokens):
+            raise FilterError('unexpected end of filter %r' % (text,))
+        t = tokens[i]
+        if t == '(':
+            node, i = parse_or(i + 1)
+            if i >= len(tokens) or tokens[i] != ')':
+                raise FilterError('unbalanced parenthesis in %r' % (text,))
+            return node, i + 1
+        if t == ')' or t.lower() in ('and', 'or'):
+            raise FilterError('unexpected %s in filter %r' % (t, text))
+        if t[0] in '\'"':
+            t = t[1:-1]
+        return ('tag', t), i + 1
+
+    node, i = parse_or(0)
+    if i != len(tokens):
+        raise FilterError('unexpected %s in filter %r' % (tokens[i], text))
+    return node
+
+
+def filter_tags(node):
+    if node[0] == 'tag':
+        return set([node[1]])
+    return filter_tags(node[1]) | filter_tags(node[2])
+
+
+class AddressGroupResolver(object):
+    def __init__(self):
+        # {name: (type, value, frozenset(tags))}
+        self.addresses = {}
+        # {name: dict(static=[members] or None, filter=text or None)}
+        self.groups = {}
+        # {ip: frozenset(tags)}
+        self.registered = {}
+
+        self._tagged_addresses = {}
+        self._tagged_ips = {}
+        self._filters = {}
+        # memo and reverse dependencies: the groups to invalidate when a
+        # name (address or group) or a tag changes
+        self._memo = {}
+        self._parents = {}
+        self._tag_users = {}
+
+    # loading
+
+    def load(self, scope):
+        """
+        Address objects and groups of a <shared> or vsys <entry> element,
+        or of a <result> holding <address> and <address-group>. Objects
+        loaded later override those with the same name, so load shared
+        before the vsys.
+        """
+        for e in scope.findall('address/entry'):
+            for type_ in _ADDRESS_TYPES:
+                value = e.find(type_)
+                if value is not None:
+                    self.set_address(e.get('name'), type_,
+                                     (value.text or '').strip(),
+                                     _members(e, 'tag/member'))
+                    break
+        for e in scope.findall('address-group/entry'):
+            dynamic = e.find('dynamic/filter')
+            if dynamic is not None:
+                self.set_group(e.get('name'), filter=dynamic.text or '')
+            else:
+                self.set_group(e.get('name'),
+                               static=_members(e, 'static/member') +
+                               _members(e, 'member'))
+
+    def load_registered_ips(self, result):
+        """Registered IPs of a show object registered-ip result."""
+        for e in result.findall('.//entry'):
+            ip = e.get('ip')
+            if ip is not None:
+                self.register(ip, _members(e, 'tag/member'))
+
+    # changes
+
+    def invalidate(self, name=None, tags=()):
+        """
+        Forget the memberships depending on name and on tags, everything
+        when both are empty.
+        """
+        if name is None and not tags:
+            self._memo = {}
+            return
+        pending = []
+        if name is not None:
+            pending.append(name)
+        for t in tags:
+            pending.extend(self._tag_users.get(t, ()))
+        seen = set()
+        while pending:
+            n = pending.pop()
+            if n in seen:
+                continue
+            seen.add(n)
+            self._memo.pop(n, None)
+            pending.extend(self._parents.get(n, ()))
+
+    def _index(self, index, key, tags, add):
+        for t in tags:
+            members = index.setdefault(t, set())
+            if add:
+                members.add(key)
+            else:
+                members.discard(key)
+
+    def set_address(self, name, type_, value, tags=()):
+        old = self.addresses.get(name)
+        if old is not None:
+            self._index(self._tagged_addresses, name, old[2], False)
+        tags = frozenset(tags)
+        self.addresses[name] = (type_, value, tags)
+        self._index(self._tagged_addresses, name, tags, True)
+        self.invalidate(name, tags | (old[2] if old else frozenset()))
+
+    def remove_address(self, name):
+        old = self.addresses.pop(name, None)
+        if old is not None:
+            self._index(self._tagged_addresses, name, old[2], False)
+            self.invalidate(name, old[2])
+
+    def set_group(self, name, static=None, filter=None):
+        self.groups[name] = dict(static=static, filter=filter)
+        self._filters.pop(name, None)
+        self.invalidate(name)
+
+    def remove_group(self, name):
+        if self.groups.pop(name, None) is not None:
+            self._filters.pop(name, None)
+            self.invalidate(name)
+
+    def register(self, ip, tags):
+        """Add tags to a registered IP, as the User-ID API does."""
+        old = self.registered.get(ip, frozenset())
+        tags = old | frozenset(tags)
+        self.registered[ip] = tags
+        self._index(self._tagged_ips, ip, tags, True)
+        if tags - old:
+            self.invalidate(tags=tags - old)
+
+    def unregister(self, ip, tags=None):
+        """Remove tags from a registered IP, all of them when tags is None."""
+        old = self.registered.get(ip)
+        if old is None:
+            return
+        removed = old if tags is None else old & frozenset(tags)
+        self._index(self._tagged_ips, ip, removed, False)
+        if old - removed:
+            self.registered[ip] = old - removed
+        else:
+            del self.registered[ip]
+        if removed:
+            self.invalidate(tags=removed)
+
+    # resolution
+
+    def _filter(self, name):
+        node = self._filters.get(name)
+        if node is None:
+            node = parse_filter(self.groups[name]['filter'])
+            self._filters[name] = node
+        return node
+
+    def _evaluate(self, node):
+        if node[0] == 'tag':
+            return (set(self._tagged_addresses.get(node[1], ())),
+                    set(self._tagged_ips.get(node[1], ())))
+        la, li = self._evaluate(node[1])
+        ra, ri = self._evaluate(node[2])
+        if node[0] == 'and':
+            return la & ra, li & ri
+        return la | ra, li | ri
+
+    def resolve(self, name, _stack=()):
+        """
+        (address object names, registered IPs, unresolved names) that
+        group or address name flattens to, as frozensets.
+        """
+        memo = self._memo.get(name)
+        if memo is not None:
+            return memo
+
+        if name in self.addresses:
+            result = (frozenset([name]), frozenset(), frozenset())
+        elif name not in self.groups or name in _stack:
+            # unknown, or a group containing itself
+            return frozenset(), frozenset(), frozenset([name])
+        elif self.groups[name]['filter'] is not None:
+            node = self._filter(name)
+            for t in filter_tags(node):
+                self._tag_users.setdefault(t, set()).add(name)
+            addresses, ips = self._evaluate(node)
+            result = (frozenset(addresses), frozenset(ips), frozenset())
+        else:
+            addresses, ips, unresolved = set(), set(), set()
+            for m in self.groups[name]['static'] or []:
+                self._parents.setdefault(m, set()).add(name)
+                a, i, u = self.resolve(m, _stack + (name,))
+                addresses |= a
+                ips |= i
+                unresolved |= u
+            result = (frozenset(addresses), frozenset(ips),
+                      frozenset(unresolved))
+            if unresolved.intersection(_stack):
+                # part of a cycle, only complete from where it was entered
+                return result
+
+        self._memo[name] = result
+        return result
+
+    def values(self, name):
+        """
+        Addresses of group name: the merged intervals of its address
+        objects and registered IPs, as canonical strings, and its fqdns.
+        """
+        addresses, ips, _ = self.resolve(name)
+        intervals = []
+        fqdns = []
+        for a in addresses:
+            type_, value, _ = self.addresses[a]
+            if type_ == 'fqdn':
+                fqdns.append(value)
+                continue
+            try:
+                interval = parse_address(value, type_)
+            except ValueError:
+                continue
+            if interval is not None:
+                intervals.append(interval)
+        for ip in ips:
+            interval = parse_address(ip)
+            if interval is not None:
+                intervals.append(interval)
+        return [canonical(*i) for i in merge(intervals)], sorted(fqdns)
+
+    def facts(self, names=None):
+        """Flattened membership of groups names, all groups by default."""
+        if names is None:
+            names = sorted(self.groups)
+        result = {}
+        for name in names:
+            group = self.groups.get(name)
+            if group is None:
+                raise KeyError(name)
+            f = dict(dynamic=group['filter'] is not None,
+                     filter=group['filter'], members=[], registered_ips=[],
+                     addresses=[], fqdns=[], unresolved=[])
+            result[name] = f
+            try:
+                addresses, ips, unresolved = self.resolve(name)
+            except FilterError:
+                f['error'] = str(sys.exc_info()[1])
+                continue
+            f['addresses'], f['fqdns'] = self.values(name)
+            f['members'] = sorted(addresses)
+            f['registered_ips'] = sorted(ips)
+            f['unresolved'] = sorted(unresolved)
+        return result
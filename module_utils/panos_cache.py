@@ -0,0 +1,149 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Small persistent cache with per-entry TTL, stored as a JSON file on the
+host running the module, so that facts learned from a device in one run
+can save API calls in the next ones.
+
+    cache = TTLCache(default_cache_path('content_versions'), ttl=3600)
+    latest = cache.get('10.0.0.1/content')
+    ...
+    cache.set('10.0.0.1/content', '600-3456')
+    cache.save()
+
+The file is only read on first use. save() merges the changed entries
+into the current content of the file under an exclusive lock, so several
+forks or tasks can share one cache file, and replaces it atomically.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+CACHE_DIR_ENV = 'PANOS_CACHE_DIR'
+DEFAULT_CACHE_DIR = os.path.join('~', '.ansible', 'cache', 'panos')
+
+
+def default_cache_path(name):
+    """Path of cache name, in $PANOS_CACHE_DIR or ~/.ansible/cache/panos."""
+    cache_dir = os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+    return os.path.join(os.path.expanduser(cache_dir), '%s.json' % name)
+
+
+def _read(path):
+    try:
+        f = open(path)
+    except (IOError, OSError):
+        return {}
+    try:
+        try:
+            data = json.load(f)
+        except ValueError:
+            # corrupted or half written by an older version, start over
+            return {}
+    finally:
+        f.close()
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+class TTLCache(object):
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._entries = None
+        self._dirty = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = _read(self.path)
+        return self._entries
+
+    def get(self, key, default=None):
+        """Value of key, default when missing or older than ttl."""
+        with self._lock:
+            e = self._load().get(key)
+        if not isinstance(e, dict) or 'time' not in e:
+            return default
+        if time.time() - e['time'] > self.ttl:
+            return default
+        return e.get('value', default)
+
+    def set(self, key, value):
+        e = dict(time=time.time(), value=value)
+        with self._lock:
+            self._load()[key] = e
+            self._dirty[key] = e
+
+    def delete(self, key):
+        with self._lock:
+            self._load().pop(key, None)
+            self._dirty[key] = None
+
+    def save(self):
+        """
+        Write the entries changed since the last save. Never raises,
+        a cache that cannot be written just does not save anything.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+
+        try:
+            dirname = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            lockf = open(self.path + '.lock', 'a')
+            try:
+                if HAS_FCNTL:
+                    fcntl.flock(lockf, fcntl.LOCK_EX)
+
+                entries = _read(self.path)
+                now = time.time()
+                for k, e in list(entries.items()):
+                    # drop what expired long ago while we are at it
+                    if not isinstance(e, dict) or \
+                            now - e.get('time', 0) > 10 * self.ttl:
+                        del entries[k]
+                for k, e in dirty.items():
+                    if e is None:
+                        entries.pop(k, None)
+                    else:
+                        entries[k] = e
+
+                fd, tmpname = tempfile.mkstemp(dir=dirname,
+                                               prefix='.panos_cache')
+                try:
+                    os.write(fd, json.dumps(entries, sort_keys=True)
+                             .encode('utf-8'))
+                finally:
+                    os.close(fd)
+                os.rename(tmpname, self.path)
+            finally:
+                lockf.close()
+        except (IOError, OSError):
+            pass
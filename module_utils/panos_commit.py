@@ -0,0 +1,113 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Full and partial commits.
+
+A partial commit only activates part of the candidate configuration, so a
+small change does not wait for the whole configuration to be compiled and
+does not pick up the pending changes of other administrators. It can be
+scoped by administrator (PAN-OS 8.0 and later), by excluding configuration
+areas and by vsys.
+
+The configuration modules take a ``partial_commit`` option; when it is set
+they commit only the changes made by their own user and exclude the areas
+they never touch::
+
+    if changed and commit:
+        commit_candidate(xapi, **partial_scope(module, POLICY_AND_OBJECTS))
+"""
+
+from ansible.module_utils.panos_jobs import JobTracker
+from ansible.module_utils.panos_xml import escape, members
+
+# configuration areas that can be left out of a partial commit
+DEVICE_AND_NETWORK = 'device-and-network'
+POLICY_AND_OBJECTS = 'policy-and-objects'
+SHARED_OBJECT = 'shared-object'
+
+EXCLUDABLE = (DEVICE_AND_NETWORK, POLICY_AND_OBJECTS, SHARED_OBJECT)
+
+
+def commit_cmd(admins=None, excluded=None, vsys=None, no_vsys=False,
+               description=None, force=False):
+    """
+    Return the (cmd, action) pair for xapi.commit. Without any scope this
+    is the plain full commit.
+    """
+    partial = []
+    if admins:
+        partial.append('<admin>%s</admin>' % members(admins))
+    for area in excluded or []:
+        if area not in EXCLUDABLE:
+            raise ValueError('cannot exclude %s from a commit, valid areas '
+                             'are %s' % (area, ', '.join(EXCLUDABLE)))
+        partial.append('<%s>excluded</%s>' % (area, area))
+    if no_vsys:
+        partial.append('<no-vsys></no-vsys>')
+    elif vsys:
+        partial.append('<vsys>%s</vsys>' % members(vsys))
+
+    cmd = []
+    if description:
+        cmd.append('<description>%s</description>' % escape(description))
+    if partial:
+        cmd.append('<partial>%s</partial>' % ''.join(partial))
+    cmd = ''.join(cmd)
+    if force:
+        cmd = '<force>%s</force>' % cmd
+
+    # commits scoped by administrator use the 8.0 partial commit action
+    action = 'partial' if admins else None
+
+    return '<commit>%s</commit>' % cmd, action
+
+
+def commit_candidate(xapi, admins=None, excluded=None, vsys=None,
+                     no_vsys=False, description=None, force=False,
+                     sync=True, interval=1, timeout=None):
+    """
+    Issue the commit. With sync the commit job is waited on through a
+    JobTracker and the finished Job is returned, None when there was
+    nothing to commit.
+    """
+    cmd, action = commit_cmd(admins=admins, excluded=excluded, vsys=vsys,
+                             no_vsys=no_vsys, description=description,
+                             force=force)
+    xapi.commit(cmd=cmd, action=action)
+    if not sync:
+        return None
+
+    tracker = JobTracker(xapi, interval=interval, timeout=timeout)
+    job = tracker.add_from_response('commit')
+    if job is not None:
+        tracker.wait()
+    return job
+
+
+def partial_scope(module, area):
+    """
+    Commit scope for a module changing only area (DEVICE_AND_NETWORK or
+    POLICY_AND_OBJECTS): empty, i.e. a full commit, unless the partial_commit
+    option is set, in which case only the changes of the module user are
+    committed and the other area is excluded.
+    """
+    if not module.params.get('partial_commit'):
+        return {}
+
+    return dict(
+        admins=[module.params['username']],
+        excluded=[a for a in (DEVICE_AND_NETWORK, POLICY_AND_OBJECTS)
+                  if a != area]
+    )
@@ -0,0 +1,271 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Tracking of PAN-OS asynchronous jobs (downloads, installs, commits).
+
+A JobTracker waits on any number of jobs of one device. Each tick issues
+a single status request, ``show jobs id`` while one job is pending and
+``show jobs all`` when there are more, then sleeps; the sleep grows by
+``backoff`` up to ``max_interval`` so long installs do not keep the
+management plane busy. A job that finishes with a nextjob (content
+installs do) can be followed, the tracker then waits on the chained job
+as part of the same Job.
+
+    tracker = JobTracker(xapi, timeout=job_timeout)
+    job = tracker.add(jobid, 'content-install', follow=True)
+    tracker.wait()
+    module.exit_json(changed=True, jobs=[job.to_dict()])
+
+Every finished job is reported to the API metrics of the module when xapi
+is instrumented.
+"""
+
+import time
+
+try:
+    from pan.xapi import PanXapiError as _JobExceptionBase
+except ImportError:
+    _JobExceptionBase = Exception
+
+
+class JobException(_JobExceptionBase):
+    """
+    A job failed or timed out. Subclass of PanXapiError, so the modules'
+    existing error handling covers it.
+    """
+    pass
+
+
+def _text(e, tag):
+    t = e.find(tag)
+    if t is None or t.text is None:
+        return None
+    return t.text.strip()
+
+
+class Job(object):
+    def __init__(self, jobid, jobtype=None, follow=False, started=None):
+        self.id = jobid
+        self.ids = [jobid]
+        self.type = jobtype
+        self.follow = follow
+        self.status = None
+        self.result = None
+        self.progress = None
+        self.details = None
+        self.nextjob = None
+        self.polls = 0
+        self.start = started if started is not None else time.time()
+        self.end = None
+        self.timeline = []
+
+    @property
+    def done(self):
+        return self.end is not None
+
+    @property
+    def ok(self):
+        return self.result == 'OK'
+
+    @property
+    def seconds(self):
+        return (self.end or time.time()) - self.start
+
+    def update(self, status, result, progress, details, nextjob, now):
+        self.polls += 1
+        if status != self.status or progress != self.progress:
+            self.timeline.append(dict(
+                t=round(now - self.start, 3),
+                id=self.id,
+                status=status,
+                progress=progress
+            ))
+        self.status = status
+        self.progress = progress
+        self.details = details
+        if status != 'FIN':
+            return
+
+        self.result = result
+        self.nextjob = nextjob
+        if self.follow and result == 'OK' and nextjob and nextjob != '0':
+            # keep waiting, on the chained job
+            self.id = nextjob
+            self.ids.append(nextjob)
+            self.status = self.progress = self.result = None
+            return
+
+        self.end = now
+
+    def to_dict(self):
+        return dict(
+            id=self.ids[0],
+            ids=self.ids,
+            type=self.type,
+            result=self.result,
+            details=self.details,
+            seconds=round(self.seconds, 3),
+            polls=self.polls,
+            timeline=self.timeline
+        )
+
+
+class JobTracker(object):
+    def __init__(self, xapi, interval=1.0, max_interval=10.0, backoff=1.5,
+                 timeout=240, sleep=time.sleep):
+        self.xapi = xapi
+        self.interval = float(interval)
+        self.max_interval = float(max_interval)
+        self.backoff = float(backoff)
+        self.timeout = float(timeout) if timeout is not None else None
+        self.sleep = sleep
+        self.jobs = []
+
+    def add(self, jobid, jobtype=None, follow=False):
+        """Start tracking jobid, follow its nextjob chain if follow."""
+        job = Job(str(jobid), jobtype=jobtype, follow=follow)
+        self.jobs.append(job)
+        return job
+
+    def add_from_response(self, jobtype=None, follow=False):
+        """
+        Track the job started by the last request, None if the response
+        carries no job (e.g. a commit with nothing to commit).
+        """
+        jobid = self.xapi.element_root.find('.//job')
+        if jobid is None or not jobid.text:
+            return None
+        return self.add(jobid.text.strip(), jobtype=jobtype, follow=follow)
+
+    @property
+    def pending(self):
+        return [j for j in self.jobs if not j.done]
+
+    def _query(self, jobid):
+        self.xapi.op(cmd='<show><jobs><id>%s</id></jobs></show>' % jobid)
+        root = self.xapi.element_root
+        return root.findall('.//job'), _text(root, './/nextjob')
+
+    def poll(self):
+        """
+        One status request covering every pending job. Returns the jobs
+        that finished in this tick.
+        """
+        pending = self.pending
+        if not pending:
+            return []
+
+        single_nextjob = None
+        if len(pending) == 1:
+            entries, single_nextjob = self._query(pending[0].id)
+        else:
+            self.xapi.op(cmd='<show><jobs><all></all></jobs></show>')
+            entries = self.xapi.element_root.findall('.//job')
+
+        status = {}
+        for e in entries:
+            jobid = _text(e, 'id')
+            if jobid is not None:
+                status[jobid] = e
+
+        now = time.time()
+        finished = []
+        for job in pending:
+            e = status.get(job.id)
+            nextjob = single_nextjob
+            if e is None:
+                # not in the listing (yet), ask for it directly
+                found, nextjob = self._query(job.id)
+                e = found[0] if found else None
+            if e is None or _text(e, 'status') is None:
+                raise JobException("Invalid job %s: no status information %s"
+                                   % (job.id, self.xapi.xml_document))
+
+            jstatus = _text(e, 'status')
+            nextjob = _text(e, 'nextjob') or nextjob
+            if jstatus == 'FIN' and job.follow and nextjob is None and \
+                    len(pending) > 1:
+                # show jobs all does not report the chained job
+                _, nextjob = self._query(job.id)
+
+            details = _text(e, 'details/line') or _text(e, 'details')
+            job.update(jstatus, _text(e, 'result'), _text(e, 'progress'),
+                       details, nextjob, now)
+            if job.done:
+                self._report(job)
+                finished.append(job)
+
+        return finished
+
+    def _report(self, job):
+        metrics = getattr(self.xapi, 'metrics', None)
+        if metrics is None:
+            return
+        metrics.record_job(getattr(self.xapi, 'hostname', None),
+                           job.ids[0], job.type, job.seconds, job.polls,
+                           result=job.result)
+
+    def wait(self, raise_on_failure=True, on_finish=None):
+        """
+        Poll until every job is finished and return them. Raises
+        JobException when a job, its chained jobs included, is still
+        running timeout seconds after it was added and, if
+        raise_on_failure, when a job does not finish with result OK.
+
+        on_finish is called with each job as it finishes and may add new
+        jobs to the tracker, which are then waited on as well.
+        """
+        interval = self.interval
+        while True:
+            count = len(self.jobs)
+            for job in self.poll():
+                if on_finish is not None:
+                    on_finish(job)
+            pending = self.pending
+            if not pending:
+                break
+            if len(self.jobs) != count:
+                # new work, look at it again soon
+                interval = self.interval
+
+            delay = interval
+            if self.timeout is not None:
+                now = time.time()
+                late = [j.id for j in pending
+                        if now >= j.start + self.timeout]
+                if late:
+                    raise JobException("Timeout in job %s" % ', '.join(late))
+                # last poll right at the earliest deadline, not after it
+                deadline = min([j.start + self.timeout for j in pending])
+                delay = min(delay, deadline - now)
+            self.sleep(delay)
+            interval = min(interval * self.backoff, self.max_interval)
+
+        if raise_on_failure:
+            for j in self.jobs:
+                if not j.ok:
+                    raise JobException("Job %s failed: %s" %
+                                       (j.id, j.details or j.result))
+
+        return self.jobs
+
+
+def wait_for_job(xapi, jobid, jobtype=None, follow=False, timeout=240,
+                 interval=1.0):
+    """Wait for a single job, return the finished Job."""
+    tracker = JobTracker(xapi, interval=interval, timeout=timeout)
+    job = tracker.add(jobid, jobtype=jobtype, follow=follow)
+    tracker.wait()
+    return job
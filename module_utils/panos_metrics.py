@@ -0,0 +1,224 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Per-call instrumentation of pan.xapi.PanXapi objects.
+
+Every API method called through the wrapper is timed and its request and
+response sizes are recorded. A compact summary is attached to the module
+result as ``api_metrics``; when the PANOS_METRICS_LOG environment variable
+names a file, one JSON line per API call is appended to it as well.
+"""
+
+import json
+import os
+import threading
+import time
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+METRICS_LOG_ENV = 'PANOS_METRICS_LOG'
+
+# PanXapi methods that hit the wire
+_API_METHODS = frozenset([
+    'ad_hoc', 'clone', 'commit', 'delete', 'edit', 'export', 'get',
+    'keygen', 'log', 'move', 'op', 'override', 'rename', 'report', 'set',
+    'show', 'user_id'
+])
+
+# arguments that end up in the request body
+_PAYLOAD_ARGS = ('xpath', 'element', 'cmd', 'qs', 'extra_qs', 'where',
+                 'dst', 'newname', 'xpath_from', 'filter')
+
+
+def _payload_size(args, kwargs):
+    size = 0
+    for a in args:
+        if isinstance(a, string_types):
+            size += len(a)
+    for k in _PAYLOAD_ARGS:
+        v = kwargs.get(k)
+        if isinstance(v, string_types):
+            size += len(v)
+    return size
+
+
+class ApiMetrics(object):
+    def __init__(self, module_name=None, log_file=None):
+        self.module_name = module_name
+        self.log_file = log_file
+        self.calls = []
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_module(cls, module):
+        """
+        Return the metrics collector bound to module, creating it on first
+        use. exit_json and fail_json are wrapped so that every result
+        carries the api_metrics summary.
+        """
+        metrics = getattr(module, '_panos_metrics', None)
+        if metrics is not None:
+            return metrics
+
+        metrics = cls(module_name=getattr(module, '_name', None),
+                      log_file=os.environ.get(METRICS_LOG_ENV))
+        module._panos_metrics = metrics
+
+        def wrap_exit(exit_method):
+            def _exit(**kwargs):
+                kwargs['api_metrics'] = metrics.summary()
+                metrics.flush()
+                return exit_method(**kwargs)
+            return _exit
+
+        module.exit_json = wrap_exit(module.exit_json)
+        module.fail_json = wrap_exit(module.fail_json)
+
+        return metrics
+
+    def wrap(self, xapi):
+        return InstrumentedXapi(xapi, self)
+
+    def record(self, host, method, seconds, bytes_out, bytes_in, error=None):
+        call = dict(
+            host=host,
+            method=method,
+            start=time.time() - seconds,
+            seconds=seconds,
+            bytes_out=bytes_out,
+            bytes_in=bytes_in
+        )
+        if error is not None:
+            call['error'] = error
+        with self._lock:
+            self.calls.append(call)
+
+    def record_job(self, host, jobid, jobtype, seconds, polls, result=None):
+        job = dict(
+            host=host,
+            id=jobid,
+            type=jobtype,
+            seconds=seconds,
+            polls=polls,
+            result=result
+        )
+        with self._lock:
+            self.jobs.append(job)
+
+    def summary(self):
+        with self._lock:
+            calls = list(self.calls)
+            jobs = list(self.jobs)
+
+        methods = {}
+        for c in calls:
+            m = methods.setdefault(c['method'], dict(
+                calls=0, errors=0, seconds=0.0, max_seconds=0.0,
+                bytes_out=0, bytes_in=0
+            ))
+            m['calls'] += 1
+            m['seconds'] += c['seconds']
+            m['max_seconds'] = max(m['max_seconds'], c['seconds'])
+            m['bytes_out'] += c['bytes_out']
+            m['bytes_in'] += c['bytes_in']
+            if 'error' in c:
+                m['errors'] += 1
+
+        for m in methods.values():
+            m['seconds'] = round(m['seconds'], 3)
+            m['max_seconds'] = round(m['max_seconds'], 3)
+
+        result = dict(
+            calls=len(calls),
+            errors=sum(m['errors'] for m in methods.values()),
+            seconds=round(sum(c['seconds'] for c in calls), 3),
+            bytes_out=sum(c['bytes_out'] for c in calls),
+            bytes_in=sum(c['bytes_in'] for c in calls),
+            methods=methods
+        )
+        if jobs:
+            result['jobs'] = jobs
+
+        return result
+
+    def flush(self):
+        if not self.log_file:
+            return
+
+        with self._lock:
+            calls, self.calls = self.calls, []
+
+        try:
+            f = open(self.log_file, 'a')
+        except (IOError, OSError):
+            # metrics must never break the task
+            return
+        try:
+            for c in calls:
+                c = dict(c, module=self.module_name)
+                f.write(json.dumps(c, sort_keys=True) + '\n')
+        finally:
+            f.close()
+
+
+class InstrumentedXapi(object):
+    """
+    Proxy for a PanXapi instance recording every API call in an ApiMetrics
+    collector. Attribute reads and writes are forwarded to the wrapped
+    object, so element_root, xml_document and friends work as usual.
+    """
+
+    def __init__(self, xapi, metrics):
+        object.__setattr__(self, '_xapi', xapi)
+        object.__setattr__(self, 'metrics', metrics)
+
+    def __getattr__(self, name):
+        attr = getattr(self._xapi, name)
+        if name not in _API_METHODS:
+            return attr
+
+        def _timed(*args, **kwargs):
+            error = None
+            start = time.time()
+            try:
+                return attr(*args, **kwargs)
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                seconds = time.time() - start
+                response = getattr(self._xapi, 'xml_document', None) or ''
+                self.metrics.record(
+                    getattr(self._xapi, 'hostname', None),
+                    name,
+                    seconds,
+                    _payload_size(args, kwargs),
+                    len(response),
+                    error=error
+                )
+
+        return _timed
+
+    def __setattr__(self, name, value):
+        setattr(self._xapi, name, value)
+
+
+def instrument(module, xapi):
+    """Wrap xapi so its calls are reported in the module result."""
+    return ApiMetrics.for_module(module).wrap(xapi)
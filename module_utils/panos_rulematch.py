@@ -0,0 +1,625 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Offline security rule matching: which rule of a rulebase would match a
+flow.
+
+The rulebase is indexed once per dimension. Every rule is a bit of a
+Python integer used as a bitset. Zones, users, URL categories and
+applications map a value to the bitset of the rules accepting it. Source
+and destination addresses, and service ports, are cut into elementary
+intervals (the boundaries of every rule interval, sorted) each holding
+the bitset of the rules covering it, found by bisection. A query ANDs
+one bitset per dimension and the lowest bit left is the first match, so
+its cost does not depend on the position of the rule::
+
+    matcher = RuleMatcher.from_config(ET.parse('running.xml').getroot())
+    rule = matcher.match(dict(from_zone='trust', to_zone='untrust',
+                              source='10.1.2.3', destination='8.8.8.8',
+                              application='dns', protocol='udp', port=53))
+
+Rules are dicts with the option names of panos_security_policy (rule_name,
+rule_type, from_zone, to_zone, source, destination, source_user,
+category, hip_profiles, application, service, action) plus disabled,
+negate_source and negate_destination. Flow fields left out of a query are not checked.
+
+The same indexes tell which earlier rules match everything a rule
+matches, ANDing per dimension the bitsets of the rules accepting all its
+values and, through a segment tree over the elementary intervals, those
+covering all its intervals. shadowed() finds the rules that can never be
+hit in one pass over the rulebase, shadowing() checks a rule about to be
+appended::
+
+    shadow = matcher.shadowing(rule_from_pandevice(new_rule))
+
+Approximations, as the firewall knows more than the configuration:
+application-default matches any port, fqdn addresses, dynamic address
+groups, EDLs and regions never match an address, and the names they come
+from are listed in unresolved. Coverage errs on the side of not shadowing:
+application-default only covers application-default.
+"""
+
+import bisect
+
+from ansible.module_utils.panos_addr import ANY, merge, complement, \
+    parse_address, parse_ip
+
+_PROTOCOLS = {'6': 'tcp', '17': 'udp', '132': 'sctp'}
+
+# configuration containers ObjectStore.load() reads
+OBJECT_CONTAINERS = ('address', 'address-group', 'service', 'service-group',
+                     'application-group')
+
+# predefined services
+_SERVICES = {
+    'service-http': [('tcp', 80, 80), ('tcp', 8080, 8080)],
+    'service-https': [('tcp', 443, 443)],
+}
+
+
+def _members(e, path):
+    return [m.text for m in e.findall(path) if m.text is not None]
+
+
+def _text(e, path, default=None):
+    t = e.find(path)
+    if t is None or t.text is None:
+        return default
+    return t.text.strip()
+
+
+def _vsys_root(root, vsys):
+    if root.tag != 'config':
+        found = root.find('.//config')
+        if found is not None:
+            root = found
+    return root.find("devices/entry/vsys/entry[@name='%s']" % vsys), \
+        root.find('shared')
+
+
+class ObjectStore(object):
+    """
+    Address, service and application objects with their groups, resolved
+    to intervals, port ranges and application names with memoization.
+    """
+    def __init__(self, addresses=None, address_groups=None, services=None,
+                 service_groups=None, application_groups=None):
+        # {name: (type, value)}, {name: [members] or None if dynamic}
+        self.addresses = addresses or {}
+        self.address_groups = address_groups or {}
+        # {name: [(protocol, first, last)]}, {name: [members]}
+        self.services = dict(_SERVICES)
+        self.services.update(services or {})
+        self.service_groups = service_groups or {}
+        self.application_groups = application_groups or {}
+        self._addr_memo = {}
+
+    @classmethod
+    def from_config(cls, root, vsys='vsys1'):
+        """Objects of vsys and shared, the vsys ones win on name clashes."""
+        store = cls()
+        vsys_e, shared = _vsys_root(root, vsys)
+        for scope in (shared, vsys_e):
+            if scope is not None:
+                store.load(scope)
+        return store
+
+    def load(self, scope):
+        for e in scope.findall('address/entry'):
+            for type_ in ('ip-netmask', 'ip-range', 'fqdn', 'ip-wildcard'):
+                value = _text(e, type_)
+                if value is not None:
+                    self.addresses[e.get('name')] = (type_, value)
+                    break
+        for e in scope.findall('address-group/entry'):
+            if e.find('dynamic') is not None:
+                self.address_groups[e.get('name')] = None
+            else:
+                self.address_groups[e.get('name')] = \
+                    _members(e, 'static/member') + _members(e, 'member')
+        for e in scope.findall('service/entry'):
+            ports = []
+            for proto in ('tcp', 'udp', 'sctp'):
+                spec = _text(e, 'protocol/%s/port' % proto)
+                if spec is not None:
+                    ports.extend(parse_ports(proto, spec))
+            self.services[e.get('name')] = ports
+        for e in scope.findall('service-group/entry'):
+            self.service_groups[e.get('name')] = \
+                _members(e, 'members/member') + _members(e, 'member')
+        for e in scope.findall('application-group/entry'):
+            self.application_groups[e.get('name')] = \
+                _members(e, 'members/member') + _members(e, 'member')
+        self._addr_memo = {}
+
+    def address(self, name, unresolved, _seen=()):
+        """Merged intervals of an address value, object or group."""
+        if name == 'any':
+            return list(ANY)
+        if name in self._addr_memo:
+            intervals, missing = self._addr_memo[name]
+            unresolved.extend(missing)
+            return intervals
+
+        missing = []
+        intervals = []
+        if name in self.addresses:
+            type_, value = self.addresses[name]
+            interval = None
+            if type_ != 'ip-wildcard':
+                try:
+                    interval = parse_address(value, type_)
+                except ValueError:
+                    pass
+            if interval is None:
+                missing.append(name)
+            else:
+                intervals.append(interval)
+        elif name in self.address_groups:
+            members = self.address_groups[name]
+            if members is None or name in _seen:
+                missing.append(name)
+            else:
+                for m in members:
+                    intervals.extend(self.address(m, missing,
+                                                  _seen + (name,)))
+        else:
+            interval = parse_address(name)
+            if interval is None:
+                missing.append(name)
+            else:
+                intervals.append(interval)
+
+        intervals = merge(intervals)
+        self._addr_memo[name] = (intervals, missing)
+        unresolved.extend(missing)
+        return intervals
+
+    def service(self, name, unresolved, _seen=()):
+        """[(protocol, first, last)] of a service or service group."""
+        if name in self.services:
+            return self.services[name]
+        if name in self.service_groups and name not in _seen:
+            ports = []
+            for m in self.service_groups[name]:
+                ports.extend(self.service(m, unresolved, _seen + (name,)))
+            return ports
+        unresolved.append(name)
+        return []
+
+    def applications(self, name, _seen=()):
+        if name in self.application_groups and name not in _seen:
+            apps = set()
+            for m in self.application_groups[name]:
+                apps.update(self.applications(m, _seen + (name,)))
+            return apps
+        return set([name])
+
+
+def parse_ports(proto, spec):
+    """[(protocol, first, last)] of a port spec like 80,443,8000-8999."""
+    ports = []
+    for p in spec.split(','):
+        p = p.strip()
+        if not p:
+            continue
+        if '-' in p:
+            first, last = p.split('-', 1)
+        else:
+            first = last = p
+        ports.append((proto, int(first), int(last)))
+    return ports
+
+
+def rules_from_config(root, vsys='vsys1'):
+    """The security rules of vsys, in order, as rule dicts."""
+    vsys_e, _ = _vsys_root(root, vsys)
+    if vsys_e is None:
+        return []
+    rules = []
+    for e in vsys_e.findall('rulebase/security/rules/entry'):
+        rules.append(dict(
+            rule_name=e.get('name'),
+            rule_type=_text(e, 'rule-type', 'universal'),
+            from_zone=_members(e, 'from/member'),
+            to_zone=_members(e, 'to/member'),
+            source=_members(e, 'source/member'),
+            destination=_members(e, 'destination/member'),
+            source_user=_members(e, 'source-user/member') or ['any'],
+            category=_members(e, 'category/member') or ['any'],
+            hip_profiles=_members(e, 'hip-profiles/member') or ['any'],
+            application=_members(e, 'application/member'),
+            service=_members(e, 'service/member'),
+            action=_text(e, 'action'),
+            disabled=_text(e, 'disabled') == 'yes',
+            negate_source=_text(e, 'negate-source') == 'yes',
+            negate_destination=_text(e, 'negate-destination') == 'yes'
+        ))
+    return rules
+
+
+def rule_from_pandevice(rule):
+    """Rule dict of a pandevice.policies.SecurityRule."""
+    def listify(v, default='any'):
+        if v is None:
+            return [default]
+        if isinstance(v, (list, tuple)):
+            return list(v)
+        return [v]
+
+    return dict(
+        rule_name=rule.name,
+        rule_type=getattr(rule, 'type', None) or 'universal',
+        from_zone=listify(rule.fromzone),
+        to_zone=listify(rule.tozone),
+        source=listify(rule.source),
+        destination=listify(rule.destination),
+        source_user=listify(rule.source_user),
+        category=listify(rule.category),
+        hip_profiles=listify(getattr(rule, 'hip_profiles', None)),
+        application=listify(rule.application),
+        service=listify(rule.service, 'application-default'),
+        action=rule.action,
+        disabled=bool(getattr(rule, 'disabled', False)),
+        negate_source=bool(getattr(rule, 'negate_source', False)),
+        negate_destination=bool(getattr(rule, 'negate_destination', False))
+    )
+
+
+class _ValueIndex(object):
+    """Bitset of the rules accepting each value of a dimension."""
+    def __init__(self):
+        self.any = 0
+        self.bits = {}
+
+    def add(self, values, bit):
+        if not values or 'any' in values:
+            self.any |= bit
+            return
+        for v in values:
+            self.bits[v] = self.bits.get(v, 0) | bit
+
+    def lookup(self, value):
+        return self.bits.get(value, 0) | self.any
+
+    def covering(self, values, bits):
+        """The rules of bits accepting every value of values."""
+        if not values or 'any' in values:
+            return bits & self.any
+        found = bits
+        for v in values:
+            found &= self.bits.get(v, 0)
+            if not found:
+                break
+        return (bits & self.any) | found
+
+
+class _IntervalIndex(object):
+    """
+    Bitset of the rules covering each elementary interval, per key
+    (address family or protocol), found by bisection.
+    """
+    def __init__(self):
+        self._toggles = {}
+        self._trees = {}
+        self.points = {}
+        self.bitsets = {}
+
+    def add(self, key, merged, bit):
+        # merged intervals of one rule do not overlap: XOR-ing the bit at
+        # both ends of each one sets it exactly inside the intervals
+        toggles = self._toggles.setdefault(key, {})
+        for first, last in merged:
+            toggles[first] = toggles.get(first, 0) ^ bit
+            toggles[last + 1] = toggles.get(last + 1, 0) ^ bit
+
+    def freeze(self):
+        for key, toggles in self._toggles.items():
+            points = sorted(toggles)
+            bitsets = []
+            current = 0
+            for p in points:
+                current ^= toggles[p]
+                bitsets.append(current)
+            self.points[key] = points
+            self.bitsets[key] = bitsets
+        self._toggles = {}
+        self._trees = {}
+
+    def lookup(self, key, value):
+        points = self.points.get(key)
+        if not points:
+            return 0
+        i = bisect.bisect_right(points, value) - 1
+        if i < 0:
+            return 0
+        return self.bitsets[key][i]
+
+    def _tree(self, key):
+        # segment tree of the AND of consecutive elementary intervals,
+        # only built when coverage is asked for
+        tree = self._trees.get(key)
+        if tree is None:
+            leaves = self.bitsets[key]
+            n = len(leaves)
+            tree = [0] * n + leaves
+            for i in range(n - 1, 0, -1):
+                tree[i] = tree[2 * i] & tree[2 * i + 1]
+            self._trees[key] = tree
+        return tree
+
+    def covering(self, key, first, last, bits):
+        """The rules of bits covering the whole interval first-last."""
+        points = self.points.get(key)
+        if not points:
+            return 0
+        i = bisect.bisect_right(points, first) - 1
+        if i < 0:
+            return 0
+        j = bisect.bisect_right(points, last) - 1
+        tree = self._tree(key)
+        lo, hi = i + len(points), j + len(points) + 1
+        while lo < hi and bits:
+            if lo & 1:
+                bits &= tree[lo]
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                bits &= tree[hi]
+            lo >>= 1
+            hi >>= 1
+        return bits
+
+
+_VALUE_FIELDS = ('from_zone', 'to_zone', 'source_user', 'category',
+                 'hip_profiles', 'application')
+
+
+class RuleMatcher(object):
+    def __init__(self, rules, objects=None):
+        self.rules = list(rules)
+        self.objects = objects or ObjectStore()
+        # names that could not be resolved, per rule name
+        self.unresolved = {}
+
+        self.enabled = 0
+        self.rule_type = {}
+        self.values = dict((f, _ValueIndex()) for f in _VALUE_FIELDS)
+        self.source = _IntervalIndex()
+        self.destination = _IntervalIndex()
+        self.service = _IntervalIndex()
+        self.any_service = 0
+        # rules set to application-default, part of any_service for
+        # match() but told apart from any when looking for coverage
+        self.app_default = 0
+
+        self._resolved = []
+        for idx, rule in enumerate(self.rules):
+            self._index(idx, rule)
+        self.source.freeze()
+        self.destination.freeze()
+        self.service.freeze()
+
+    @classmethod
+    def from_config(cls, root, vsys='vsys1'):
+        return cls(rules_from_config(root, vsys),
+                   ObjectStore.from_config(root, vsys))
+
+    def resolve(self, rule):
+        """
+        Rule dict with its objects resolved: expanded applications,
+        merged source and destination intervals, negation applied, and
+        merged (protocol, first, last) ports, None standing for any.
+        """
+        unresolved = []
+        r = dict(rule_type=rule.get('rule_type') or 'universal')
+        for field in _VALUE_FIELDS:
+            r[field] = rule.get(field) or ['any']
+
+        if 'any' not in r['application']:
+            expanded = set()
+            for a in r['application']:
+                expanded.update(self.objects.applications(a))
+            r['application'] = sorted(expanded)
+
+        for field in ('source', 'destination'):
+            intervals = []
+            for name in rule.get(field) or ['any']:
+                intervals.extend(self.objects.address(name, unresolved))
+            intervals = merge(intervals)
+            if rule.get('negate_' + field):
+                intervals = complement(intervals)
+            r[field] = intervals
+
+        services = rule.get('service') or ['any']
+        r['app_default'] = 'any' not in services and \
+            'application-default' in services
+        if 'any' in services or r['app_default']:
+            r['service'] = None
+        else:
+            ports = []
+            for name in services:
+                ports.extend(self.objects.service(name, unresolved))
+            # merge() takes the protocol for an address family
+            r['service'] = merge(ports)
+
+        r['unresolved'] = sorted(set(unresolved))
+        return r
+
+    def _index(self, idx, rule):
+        bit = 1 << idx
+        if not rule.get('disabled'):
+            self.enabled |= bit
+
+        r = self.resolve(rule)
+        self._resolved.append(r)
+        self.rule_type[r['rule_type']] = \
+            self.rule_type.get(r['rule_type'], 0) | bit
+        for field in _VALUE_FIELDS:
+            self.values[field].add(r[field], bit)
+
+        for field, index in (('source', self.source),
+                             ('destination', self.destination)):
+            for family in (4, 6):
+                index.add(family, [(i[1], i[2]) for i in r[field]
+                                   if i[0] == family], bit)
+
+        if r['service'] is None:
+            self.any_service |= bit
+            if r['app_default']:
+                self.app_default |= bit
+        else:
+            for proto in set(p[0] for p in r['service']):
+                self.service.add(proto, [(p[1], p[2]) for p in r['service']
+                                         if p[0] == proto], bit)
+
+        if r['unresolved']:
+            self.unresolved[rule.get('rule_name')] = r['unresolved']
+
+    def candidates(self, flow):
+        """Bitset of the enabled rules matching flow."""
+        bits = self.enabled
+        for field in ('from_zone', 'to_zone', 'source_user', 'category',
+                      'application'):
+            value = flow.get(field)
+            if value is not None:
+                bits &= self.values[field].lookup(value)
+                if not bits:
+                    return 0
+
+        if flow.get('from_zone') is not None and \
+                flow.get('to_zone') is not None:
+            if flow['from_zone'] == flow['to_zone']:
+                zone_type = 'intrazone'
+            else:
+                zone_type = 'interzone'
+            bits &= self.rule_type.get('universal', 0) | \
+                self.rule_type.get(zone_type, 0)
+
+        for field, index in (('source', self.source),
+                             ('destination', self.destination)):
+            value = flow.get(field)
+            if value is not None and bits:
+                family, ip = parse_ip(value)
+                bits &= index.lookup(family, ip)
+
+        port = flow.get('port')
+        if port is not None and bits:
+            proto = str(flow.get('protocol') or 'tcp').lower()
+            proto = _PROTOCOLS.get(proto, proto)
+            bits &= self.service.lookup(proto, int(port)) | self.any_service
+
+        return bits
+
+    def match(self, flow):
+        """The first rule matching flow, None if none does."""
+        bits = self.candidates(flow)
+        if not bits:
+            return None
+        return self.rules[(bits & -bits).bit_length() - 1]
+
+    def match_all(self, flow):
+        """Every rule matching flow, in rulebase order."""
+        bits = self.candidates(flow)
+        rules = []
+        while bits:
+            low = bits & -bits
+            rules.append(self.rules[low.bit_length() - 1])
+            bits ^= low
+        return rules
+
+    def match_many(self, flows):
+        match = self.match
+        return [match(f) for f in flows]
+
+    def _covering(self, r, bits):
+        bits &= self.rule_type.get('universal', 0) | \
+            self.rule_type.get(r['rule_type'], 0)
+        for field in _VALUE_FIELDS:
+            if not bits:
+                return 0
+            bits = self.values[field].covering(r[field], bits)
+
+        for field, index in (('source', self.source),
+                             ('destination', self.destination)):
+            for family, first, last in r[field]:
+                if not bits:
+                    return 0
+                bits = index.covering(family, first, last, bits)
+
+        # the ports of application-default depend on the application, it
+        # only covers itself
+        any_service = self.any_service & ~self.app_default
+        if r['app_default']:
+            return bits & self.any_service
+        if r['service'] is None:
+            return bits & any_service
+        for proto, first, last in r['service']:
+            if not bits:
+                return 0
+            bits &= any_service | \
+                self.service.covering(proto, first, last, bits)
+        return bits
+
+    def covering(self, rule, before=None):
+        """
+        Bitset of the enabled rules, among the first before ones, matching
+        every flow rule matches. Each dimension costs a few bitset
+        operations, a segment tree answers the interval ones, so checking
+        every rule of a rulebase stays close to linear.
+        """
+        bits = self.enabled
+        if before is not None:
+            bits &= (1 << before) - 1
+        return self._covering(self.resolve(rule), bits)
+
+    def shadowing(self, rule):
+        """
+        First rule of the rulebase matching every flow rule matches, None
+        if there is none or rule has unresolved objects. rule would never
+        be hit after it.
+        """
+        r = self.resolve(rule)
+        if r['unresolved']:
+            return None
+        bits = self._covering(r, self.enabled)
+        if not bits:
+            return None
+        return self.rules[(bits & -bits).bit_length() - 1]
+
+    def shadowed(self):
+        """
+        Enabled rules that never match anything because an earlier rule
+        matches every flow they do, as dicts with rule_name, shadowed_by
+        and redundant, true when both rules have the same action and the
+        later one can simply be removed. Rules with unresolved objects are
+        left out, what they match is not known.
+        """
+        result = []
+        for idx, rule in enumerate(self.rules):
+            bit = 1 << idx
+            r = self._resolved[idx]
+            if not self.enabled & bit or r['unresolved']:
+                continue
+            bits = self._covering(r, self.enabled & (bit - 1))
+            if not bits:
+                continue
+            first = self.rules[(bits & -bits).bit_length() - 1]
+            result.append(dict(
+                rule_name=rule.get('rule_name'),
+                shadowed_by=first.get('rule_name'),
+                redundant=first.get('action') == rule.get('action')
+            ))
+        return result
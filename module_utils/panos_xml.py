@@ -0,0 +1,355 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+Precompiled XML element builders for PAN-OS configuration objects.
+
+A template is a string with ``{key}`` placeholders and optional sections
+in square brackets::
+
+    _ADDRESS = XmlTemplate('<{type!tag}>{address}</{type!tag}>'
+                           '[<description>{description}</description>]'
+                           '[<tag>{tag!members}</tag>]')
+
+The template is parsed once, when the module is loaded. Rendering looks
+values up in a dict, escapes them and joins the pieces in a single pass;
+an optional section is dropped when any of its values is None, an empty
+string or an empty list.
+
+Conversions:
+
+    {key}           escaped text (the default)
+    {key!members}   list of <member> elements, a single string is accepted
+    {key!yesno}     'yes' or 'no' from a boolean
+    {key!tag}       element name, validated but not escaped
+    {key!raw}       pre-rendered XML, inserted as is
+"""
+
+import re
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+_PLACEHOLDER = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)(?:!([a-z]+))?\}')
+_TAG = re.compile(r'^[A-Za-z_][A-Za-z0-9_.-]*$')
+
+
+class XmlTemplateError(Exception):
+    pass
+
+
+def escape(value):
+    """Escape value for use as element text or attribute value."""
+    if not isinstance(value, string_types):
+        value = str(value)
+    if '&' not in value and '<' not in value and '>' not in value and \
+            '"' not in value and "'" not in value:
+        return value
+    return value.replace('&', '&amp;').replace('<', '&lt;') \
+        .replace('>', '&gt;').replace('"', '&quot;').replace("'", '&apos;')
+
+
+def members(values):
+    if isinstance(values, string_types):
+        return '<member>%s</member>' % escape(values)
+    return ''.join(['<member>%s</member>' % escape(v) for v in values])
+
+
+def yesno(value):
+    if isinstance(value, string_types):
+        value = value.lower() in ('yes', 'true', '1')
+    return 'yes' if value else 'no'
+
+
+_valid_tags = set()
+
+
+def tag(value):
+    if value in _valid_tags:
+        return value
+    if not isinstance(value, string_types) or not _TAG.match(value):
+        raise XmlTemplateError('Invalid element name: %r' % (value,))
+    _valid_tags.add(value)
+    return value
+
+
+def raw(value):
+    return value
+
+
+_CONVERSIONS = {
+    None: escape,
+    'members': members,
+    'yesno': yesno,
+    'tag': tag,
+    'raw': raw,
+}
+
+
+def _missing_value(key):
+    raise XmlTemplateError('Missing value for %s' % key)
+
+
+def _parse(template, pos, optional):
+    """
+    Parse template[pos:] up to the end of the current section. Returns a
+    list of nodes (literal strings, (key, conversion) tuples and nested
+    section lists) and the position after the section.
+    """
+    nodes = []
+    start = pos
+    while pos < len(template):
+        c = template[pos]
+        if c == '[':
+            if pos > start:
+                nodes.append(template[start:pos])
+            section, pos = _parse(template, pos+1, True)
+            nodes.append(section)
+            start = pos
+            continue
+        if c == ']':
+            if not optional:
+                raise XmlTemplateError('Unbalanced ] in template %r' %
+                                       template)
+            if pos > start:
+                nodes.append(template[start:pos])
+            return nodes, pos+1
+        if c == '{':
+            m = _PLACEHOLDER.match(template, pos)
+            if m is None:
+                raise XmlTemplateError('Invalid placeholder at %d in %r' %
+                                       (pos, template))
+            if m.group(2) not in _CONVERSIONS:
+                raise XmlTemplateError('Unknown conversion %s in %r' %
+                                       (m.group(2), template))
+            if pos > start:
+                nodes.append(template[start:pos])
+            nodes.append(m.groups())
+            pos = m.end()
+            start = pos
+            continue
+        pos += 1
+
+    if optional:
+        raise XmlTemplateError('Unbalanced [ in template %r' % template)
+    if pos > start:
+        nodes.append(template[start:pos])
+    return nodes, pos
+
+
+class XmlTemplate(object):
+    def __init__(self, template):
+        self.template = template
+        nodes, _ = _parse(template, 0, False)
+        self._render = self._compile(nodes)
+
+    @staticmethod
+    def _compile(nodes):
+        """
+        Turn the parsed template into the source of a single function
+        doing one dict lookup per key and one string formatting per
+        section, then compile it.
+        """
+        keys = []
+        converted = []
+        namespace = dict(_missing_value=_missing_value)
+
+        def var(key):
+            if key not in keys:
+                keys.append(key)
+            return '_v%d' % keys.index(key)
+
+        def present(v):
+            # None, '' and empty lists drop an optional section
+            return "(%(v)s or (%(v)s is not None and %(v)s != '' and " \
+                   "%(v)s != [] and %(v)s != ()))" % dict(v=v)
+
+        def section(nodes, top=False):
+            fmt = []
+            args = []
+            direct = []
+            for n in nodes:
+                if isinstance(n, string_types):
+                    fmt.append(n.replace('%', '%%'))
+                elif isinstance(n, tuple):
+                    key, conv = n
+                    cname = '_c_%s' % (conv or 'escape')
+                    namespace[cname] = _CONVERSIONS[conv]
+                    value = '%s(%s)' % (cname, var(key))
+                    if top:
+                        # convert required values once, even if repeated
+                        if value not in converted:
+                            converted.append(value)
+                        value = '_a%d' % converted.index(value)
+                    fmt.append('%s')
+                    args.append(value)
+                    direct.append(var(key))
+                else:
+                    sfmt, sargs, sdirect = section(n)
+                    cond = ' and '.join([present(v) for v in sdirect])
+                    fmt.append('%s')
+                    args.append("((%r %% (%s,)) if %s else '')" %
+                                (sfmt, ', '.join(sargs), cond or 'True'))
+            return ''.join(fmt), args, direct
+
+        fmt, args, direct = section(nodes, top=True)
+
+        body = ['def render(values):']
+        for i, key in enumerate(keys):
+            body.append('    _v%d = values.get(%r)' % (i, key))
+        for v in sorted(set(direct)):
+            body.append('    if %s is None: _missing_value(%r)' %
+                        (v, keys[int(v[2:])]))
+        for i, value in enumerate(converted):
+            body.append('    _a%d = %s' % (i, value))
+        if args:
+            body.append('    return %r %% (%s,)' % (fmt, ', '.join(args)))
+        else:
+            body.append('    return %r' % fmt.replace('%%', '%'))
+
+        exec(compile('\n'.join(body), '<XmlTemplate>', 'exec'), namespace)
+        return namespace['render']
+
+    def render(self, values=None, **kwargs):
+        """Render the template with values from a dict and/or keywords."""
+        if values is None:
+            values = kwargs
+        elif kwargs:
+            values = dict(values, **kwargs)
+        return self._render(values)
+
+    def render_entries(self, objects, name_key='name'):
+        """
+        Render many objects in one pass, each one wrapped in an
+        <entry name="..."> element, ready for a single set call on the
+        parent xpath.
+        """
+        render = self._render
+        return ''.join(['<entry name="%s">%s</entry>' %
+                        (escape(o[name_key]), render(o)) for o in objects])
+
+
+def entry(name, inner=''):
+    return '<entry name="%s">%s</entry>' % (escape(name), inner)
+
+
+# objects
+ADDRESS = XmlTemplate(
+    '<{type!tag}>{address}</{type!tag}>'
+    '[<description>{description}</description>]'
+    '[<tag>{tag!members}</tag>]'
+)
+
+PROFILE_GROUP = XmlTemplate(
+    '[<data-filtering>{data_filtering!members}</data-filtering>]'
+    '[<file-blocking>{file_blocking!members}</file-blocking>]'
+    '[<spyware>{spyware!members}</spyware>]'
+    '[<url-filtering>{url_filtering!members}</url-filtering>]'
+    '[<virus>{virus!members}</virus>]'
+    '[<vulnerability>{vulnerability!members}</vulnerability>]'
+    '[<wildfire-analysis>{wildfire!members}</wildfire-analysis>]'
+)
+
+# NAT rules
+DNAT = XmlTemplate(
+    '<destination-translation>'
+    '[<translated-address>{dnat_address}</translated-address>]'
+    '[<translated-port>{dnat_port}</translated-port>]'
+    '</destination-translation>'
+)
+
+SNAT_STATIC_IP = XmlTemplate(
+    '<source-translation><static-ip>'
+    '<bi-directional>{snat_bidirectional!yesno}</bi-directional>'
+    '<translated-address>{snat_address}</translated-address>'
+    '</static-ip></source-translation>'
+)
+
+SNAT_DIPP_INTERFACE = XmlTemplate(
+    '<source-translation><dynamic-ip-and-port><interface-address>'
+    '<interface>{snat_interface}</interface>'
+    '[<ip>{snat_interface_address}</ip>]'
+    '</interface-address></dynamic-ip-and-port></source-translation>'
+)
+
+SNAT_DIPP_ADDRESS = XmlTemplate(
+    '<source-translation><dynamic-ip-and-port>'
+    '<translated-address>{snat_address!members}</translated-address>'
+    '</dynamic-ip-and-port></source-translation>'
+)
+
+NAT_RULE = XmlTemplate(
+    '[{dnatxml!raw}]'
+    '[{snatxml!raw}]'
+    '<to>{to_zone!members}</to>'
+    '<from>{from_zone!members}</from>'
+    '<source>{source!members}</source>'
+    '<destination>{destination!members}</destination>'
+    '<service>{service}</service>'
+    '<nat-type>ipv4</nat-type>'
+)
+
+SERVICE = XmlTemplate(
+    '<protocol><{protocol!tag}>'
+    '<port>{port}</port>'
+    '[<source-port>{source_port}</source-port>]'
+    '</{protocol!tag}></protocol>'
+)
+
+# security rules
+SECURITY_RULE = XmlTemplate(
+    '<to>{to_zone!members}</to>'
+    '<from>{from_zone!members}</from>'
+    '<source>{source!members}</source>'
+    '<destination>{destination!members}</destination>'
+    '<source-user>{source_user!members}</source-user>'
+    '<category>{category!members}</category>'
+    '<application>{application!members}</application>'
+    '<service>{service!members}</service>'
+    '<hip-profiles>{hip_profiles!members}</hip-profiles>'
+    '<action>{action}</action>'
+    '<log-start>{log_start!yesno}</log-start>'
+    '<log-end>{log_end!yesno}</log-end>'
+    '<rule-type>{rule_type}</rule-type>'
+    '[<description>{description}</description>]'
+    '[<tag>{tag!members}</tag>]'
+    '[<profile-setting>{profile_setting!raw}</profile-setting>]'
+)
+
+SECURITY_GROUP_PROFILE = XmlTemplate(
+    '<group>{group_profile!members}</group>'
+)
+
+SECURITY_PROFILES = XmlTemplate(
+    '<profiles>'
+    '[<virus>{antivirus!members}</virus>]'
+    '[<vulnerability>{vulnerability!members}</vulnerability>]'
+    '[<spyware>{spyware!members}</spyware>]'
+    '[<url-filtering>{url_filtering!members}</url-filtering>]'
+    '[<file-blocking>{file_blocking!members}</file-blocking>]'
+    '[<data-filtering>{data_filtering!members}</data-filtering>]'
+    '[<wildfire-analysis>{wildfire_analysis!members}</wildfire-analysis>]'
+    '</profiles>'
+)
+
+# network, content of a layer3 interface or subinterface entry
+LAYER3 = XmlTemplate(
+    '[<tag>{tag}</tag>]'
+    '[<ip>{ip!raw}</ip>]'
+    '[<dhcp-client>'
+    '<create-default-route>{create_default_route!yesno}</create-default-route>'
+    '</dhcp-client>]'
+)
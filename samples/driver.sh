@@ -1,2 +1,2 @@
 #!/bin/sh
-ansible-playbook $1 -M ../library/ -i ./inventory.ini
+ANSIBLE_MODULE_UTILS=../module_utils ansible-playbook $1 -M ../library/ -i ./inventory.ini